@@ -0,0 +1,215 @@
+"""
+Бенчмарк всех маршрутов shop_api/urls.py на данных заданного масштаба.
+
+База наполняется командой generate_data (--scale 10k/100k/1m: товаров,
+отзывов и заказов), после чего для каждого маршрута измеряются перцентили
+задержки и число SQL-запросов на запрос. Кэш ответов отключается, ETag не
+передаётся, чтобы каждый запрос доходил до БД. Работает с SQLite и с
+PostgreSQL (DJANGO_SETTINGS_MODULE), данные - в отдельной тестовой базе;
+--keepdb сохраняет её между запусками, чтобы не наполнять заново.
+
+После чтений (GET всех маршрутов) измеряются изменяющие запросы
+WRITE_SCENARIOS: создание заказа, массовая смена статуса, создание отзыва,
+добавление и удаление избранного. Тело каждого запроса генерируется заново
+(--seed), данные для него готовятся вне замера: новые заказы для смены
+статуса, ещё не отрецензированный товар, избранное до удаления. Записи
+остаются в базе бенчмарка, в том числе с --keepdb.
+
+    python -m benchmarks.bench_api [--scale 10k] [--repeat 50] [--seed 0] [--keepdb]
+                                   [--output api_10k.json]
+"""
+import argparse
+import logging
+import random
+import re
+import sys
+from types import SimpleNamespace
+
+from benchmarks.common import setup_django, benchmark_database, measure, write_results
+
+# дополнительные варианты запросов для списков (кроме запроса без параметров)
+QUERY_VARIANTS = {
+    'products/': ('?search=ноутбук', '?ordering=-rating_avg', '?price__lt=1000'),
+    'product-reviews/': ('?product={product}',),
+    'orders/': ('?status=NEW',),
+}
+
+# маршруты, доступные только персоналу
+STAFF_ROUTES = ('metrics/', 'analytics/sales/')
+
+
+# изменяющие запросы: (маршрут, метод, клиент, ожидаемый статус, функция данных запроса)
+WRITE_SCENARIOS = (
+    ('orders/', 'post', 'user', 201, 'order_payload'),
+    ('orders/bulk-status/', 'post', 'staff', 200, 'bulk_status_payload'),
+    ('product-reviews/', 'post', 'user', 201, 'review_payload'),
+    ('user-info/<int:pk>/favourites/', 'post', 'user', 201, 'add_favourites_payload'),
+    ('user-info/<int:pk>/favourites/', 'delete', 'user', 200, 'remove_favourites_payload'),
+)
+# заказов в одной массовой смене статуса и товаров в одном изменении избранного
+BULK_STATUS_ORDERS = 100
+FAVOURITES_PRODUCTS = 20
+
+
+def iter_routes():
+    """ Маршруты shop_api/urls.py без дублей с суффиксом формата (.json) """
+    from shop_api.urls import urlpatterns
+
+    for pattern in urlpatterns:
+        route = str(pattern.pattern)
+        if 'format' not in route:
+            yield route
+
+
+def sample_ids(user):
+    """ id объектов для детальных маршрутов: заказ и профиль - пользователя бенчмарка """
+    from shop_api.models import Product, Review, Order, ProductCollections
+
+    order = Order.objects.filter(user=user).order_by('id').first()
+    return {
+        'products': Product.objects.order_by('-rating_count', 'id').values_list('id', flat=True).first(),
+        'product-reviews': Review.objects.order_by('id').values_list('id', flat=True).first(),
+        'orders': order.id if order else None,
+        'product-collections': ProductCollections.objects.order_by('id').values_list('id', flat=True).first(),
+        'user-info': user.id,
+    }
+
+
+def build_urls(route, ids):
+    path = route.replace('async/', '')
+    if '<int:pk>' in route:
+        key = path.split('/')[0]
+        if ids.get(key) is None:
+            raise RuntimeError(f'Нет данных для маршрута {route}')
+        return ['/api/v1/' + route.replace('<int:pk>', str(ids[key]))]
+    url = '/api/v1/' + route
+    return [url] + [url + query.format(product=ids['products']) for query in QUERY_VARIANTS.get(path, ())]
+
+
+class WritePayloads:
+    """ Тела изменяющих запросов; данные, которые они меняют, готовятся здесь же (вне замера) """
+
+    def __init__(self, user, seed):
+        from shop_api.models import Product, Review
+
+        self.user = user
+        self.random = random.Random(seed)
+        self.product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        reviewed = set(Review.objects.filter(creator=user).values_list('product_id', flat=True))
+        self.unreviewed = iter([pk for pk in self.product_ids if pk not in reviewed])
+
+    def _products(self, count):
+        return self.random.sample(self.product_ids, count)
+
+    def order_payload(self):
+        return {'products': [{'product': pk, 'quantity': self.random.randint(1, 3)} for pk in self._products(3)]}
+
+    def bulk_status_payload(self):
+        from shop_api.serializers import OrderSerializer
+
+        # переходы только из NEW и IN_PROGRESS, поэтому каждый замер отменяет свежие заказы
+        ids = []
+        context = {'request': SimpleNamespace(user=self.user)}
+        for _ in range(BULK_STATUS_ORDERS):
+            serializer = OrderSerializer(data=self.order_payload(), context=context)
+            serializer.is_valid(raise_exception=True)
+            ids.append(serializer.save().id)
+        return {'status': 'CANCELLED', 'ids': ids}
+
+    def review_payload(self):
+        # у пользователя один отзыв на товар
+        return {'product': next(self.unreviewed), 'rating': self.random.randint(1, 5), 'review_text': 'бенчмарк'}
+
+    def add_favourites_payload(self):
+        from shop_api.favourites import remove_favourites
+
+        products = self._products(FAVOURITES_PRODUCTS)
+        remove_favourites(self.user.id, products)
+        return {'products': products}
+
+    def remove_favourites_payload(self):
+        from shop_api.favourites import add_favourites
+
+        products = self._products(FAVOURITES_PRODUCTS)
+        add_favourites(self.user.id, products)
+        return {'products': products}
+
+
+def server_timing_queries(response):
+    """ Число SQL-запросов из Server-Timing: у асинхронных маршрутов они идут в потоках пула """
+    match = re.search(r'db;[^,]*desc="(\d+) queries"', response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def report(result):
+    print(f"{result['method'].upper():6} {result['url']:60} p50={result['p50_ms']:8.2f} ms  "
+          f"p99={result['p99_ms']:8.2f} ms  queries={result['queries']}", file=sys.stderr, flush=True)
+
+
+def make_client(user):
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_AUTHORIZATION='Token ' + token.key)
+
+
+def main():
+    setup_django()
+    from shop_api.datagen import SCALES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keepdb', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    # строки лога о каждом запросе (shop_api.timing) не нужны в выводе бенчмарка
+    logging.getLogger('shop_api.timing').setLevel(logging.WARNING)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+    from shop_api.models import Product
+
+    dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with benchmark_database(keepdb=args.keepdb), override_settings(CACHES=dummy_cache, QUERY_BUDGETS_STRICT=False):
+        if Product.objects.count() != SCALES[args.scale]:
+            call_command('flush', interactive=False, verbosity=0)
+            call_command('generate_data', scale=args.scale, seed=args.seed, verbosity=0)
+        user = User.objects.filter(order__isnull=False).order_by('id').first()
+        admin, _ = User.objects.get_or_create(username='bench-admin', defaults={'is_staff': True})
+        ids = sample_ids(user)
+        clients = {'user': make_client(user), 'staff': make_client(admin)}
+
+        results = []
+        for route in iter_routes():
+            identity = 'staff' if route in STAFF_ROUTES else 'user'
+            client = clients[identity]
+            for url in build_urls(route, ids):
+                def request(url=url):
+                    response = client.get(url)
+                    assert response.status_code == 200, f'{url}: {response.status_code}'
+                result = measure(request, repeat=args.repeat)
+                if route.startswith('async/'):
+                    result['queries'] = server_timing_queries(client.get(url))
+                results.append({'route': route, 'url': url, 'method': 'get', 'client': identity, **result})
+                report(results[-1])
+
+        payloads = WritePayloads(user, args.seed)
+        for route, method, identity, status, payload in WRITE_SCENARIOS:
+            client = clients[identity]
+            url = build_urls(route, ids)[0]
+
+            def request(data, url=url, method=method, client=client, status=status):
+                response = getattr(client, method)(url, data, content_type='application/json')
+                assert response.status_code == status, f'{method.upper()} {url}: {response.status_code}'
+            result = measure(request, repeat=args.repeat, setup=lambda payload=payload: (getattr(payloads, payload)(),))
+            results.append({'route': route, 'url': url, 'method': method, 'client': identity, **result})
+            report(results[-1])
+        write_results('api', results, args.output, scale=args.scale, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
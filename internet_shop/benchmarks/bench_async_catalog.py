@@ -0,0 +1,175 @@
+"""
+Бенчмарк пропускной способности чтения каталога при одновременных запросах.
+
+Сравниваются три пути обработки одних и тех же запросов в одном процессе:
+
+* wsgi - синхронные ViewSet через WSGI-обработчик, --wsgi-threads потоков
+  (1 - как у sync-воркера gunicorn);
+* asgi_sync - те же синхронные ViewSet под ASGI (Django выполняет их в одном
+  общем потоке);
+* asgi_async - асинхронные эндпоинты /api/v1/async/... (shop_api.async_views),
+  работа с БД в пуле из ASYNC_DB_POOL_SIZE потоков.
+
+Задержка сети до БД имитируется паузой --db-latency мс на каждый SQL-запрос,
+кэш ответов отключается, чтобы каждый запрос доходил до БД. Выигрыш асинхронного
+пути определяется долей ожидания БД: при задержке около нуля запрос упирается в
+CPU (GIL) и пропускная способность у всех путей примерно одинакова.
+
+    python -m benchmarks.bench_async_catalog [--concurrency 1 8 32] [--requests 200]
+                                             [--db-latency 10] [--output results.json]
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, benchmark_database, percentile, write_results
+
+ROUTES = {
+    'products-list': '/api/v1/{prefix}products/?page_size=20',
+    'products-detail': '/api/v1/{prefix}products/{product}/',
+    'reviews-list': '/api/v1/{prefix}product-reviews/?page_size=20',
+    'collections-detail': '/api/v1/{prefix}product-collections/{collection}/',
+}
+
+
+def seed():
+    from django.contrib.auth.models import User
+    from shop_api.models import Product, Review, ProductCollections
+
+    Product.objects.bulk_create(Product(name=f'Товар {i}', price=i % 100 + 1, description='описание товара')
+                                for i in range(200))
+    User.objects.bulk_create(User(username=f'bench{i}') for i in range(20))
+    users = list(User.objects.filter(username__startswith='bench'))
+    products = list(Product.objects.all())
+    Review.objects.bulk_create(Review(creator=user, product=product, rating=(i % 5) + 1, review_text='отзыв')
+                               for i, (user, product) in enumerate((u, p) for u in users for p in products[:10]))
+    collection = ProductCollections.objects.create(title='подборка', text='товары для бенчмарка')
+    collection.products.set(products[:20])
+    return {'product': products[0].id, 'collection': collection.id}
+
+
+def install_db_latency(latency_ms):
+    """
+    Пауза перед каждым SQL-запросом во всех соединениях, включая потоки пула.
+
+    Пауза добавляется в CursorWrapper, а не в connection.execute_wrappers:
+    контексты execute_wrapper() из ServerTimingMixin и QueryBudgetMixin при
+    выходе снимают последнюю обёртку списка, и обёртка, добавленная при
+    открытии соединения внутри запроса (потоки WSGI и пула), терялась бы.
+    """
+    from django.db.backends.utils import CursorWrapper
+
+    def slow(method):
+        def wrapper(self, *args):
+            time.sleep(latency_ms / 1000)
+            return method(self, *args)
+        return wrapper
+
+    for name in ('_execute', '_executemany'):
+        setattr(CursorWrapper, name, slow(getattr(CursorWrapper, name)))
+
+
+def check_db_latency(response, latency_ms):
+    """ Время БД в Server-Timing (auth + db) не меньше числа запросов, умноженного на задержку """
+    durations = {}
+    queries = 0
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        durations[name] = float(params['dur'])
+        if name == 'db':
+            queries = int(params['desc'].strip('"').split()[0])
+    reported = durations.get('auth', 0) + durations.get('db', 0)
+    # dur округлён до 0.1 мс
+    assert reported >= queries * latency_ms - 0.05, \
+        f"задержка БД применена не ко всем запросам: {reported} мс на {queries} запросов по {latency_ms} мс"
+
+
+def _summary(timings, elapsed):
+    return {
+        'requests': len(timings),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def run_wsgi(url, requests, threads, latency_ms):
+    from django.test import Client
+
+    def worker(count):
+        client = Client()
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+            check_db_latency(response, latency_ms)
+        return timings
+
+    counts = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        timings = [value for result in executor.map(worker, counts) for value in result]
+    return _summary(timings, time.perf_counter() - start)
+
+
+def run_asgi(url, requests, concurrency, latency_ms):
+    from django.test import AsyncClient
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+        timings = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200
+                check_db_latency(response, latency_ms)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return _summary(timings, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--db-latency', type=float, default=10.0, help='имитация задержки SQL-запроса, мс')
+    parser.add_argument('--wsgi-threads', type=int, default=1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with benchmark_database(), override_settings(CACHES=dummy_cache, ALLOWED_HOSTS=['*']):
+        ids = seed()
+        install_db_latency(args.db_latency)
+        results = []
+        for route, template in ROUTES.items():
+            sync_url = template.format(prefix='', **ids)
+            async_url = template.format(prefix='async/', **ids)
+            for concurrency in args.concurrency:
+                for mode, run in (
+                        ('wsgi', lambda: run_wsgi(sync_url, args.requests, args.wsgi_threads, args.db_latency)),
+                        ('asgi_sync', lambda: run_asgi(sync_url, args.requests, concurrency, args.db_latency)),
+                        ('asgi_async', lambda: run_asgi(async_url, args.requests, concurrency, args.db_latency))):
+                    results.append({'route': route, 'mode': mode, 'concurrency': concurrency,
+                                    'db_latency_ms': args.db_latency, **run()})
+        write_results('async_catalog', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Бенчмарк аутентификации по токену: TokenAuthentication (запрос токена с
+пользователем к БД на каждый запрос) против CachedTokenAuthentication (LRU
+процесса + кэш Django).
+
+Измеряются сам authenticate() и полный запрос к "горячим" маршрутам чтения
+(список товаров отдаётся из кэша ответов, поэтому запрос токена - основная
+работа с БД). Задержка сети до БД имитируется паузой --db-latency мс на
+каждый SQL-запрос: экономия на запрос примерно равна ей. Кэш токенов
+работает только с общим для процессов кэшем Django, поэтому на время
+бенчмарка он - файловый во временном каталоге (в production - Redis/Memcached).
+
+    python -m benchmarks.bench_auth [--repeat 200] [--db-latency 1] [--output results.json]
+"""
+import argparse
+import logging
+import tempfile
+from unittest import mock
+
+from benchmarks.bench_async_catalog import install_db_latency
+from benchmarks.common import setup_django, benchmark_database, measure, write_results
+
+ROUTES = ('/api/v1/products/?page_size=20', '/api/v1/orders/?page_size=20')
+
+
+def implementations():
+    from rest_framework.authentication import TokenAuthentication
+    from shop_api.authentication import CachedTokenAuthentication
+
+    return (('token', TokenAuthentication), ('cached_token', CachedTokenAuthentication))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--db-latency', type=float, default=1.0, help='имитация задержки SQL-запроса, мс')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    logging.getLogger('shop_api.timing').setLevel(logging.WARNING)
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test.utils import override_settings
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient, APIRequestFactory
+    from rest_framework.views import APIView
+    from shop_api.models import Product
+
+    shared_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                'LOCATION': tempfile.mkdtemp(prefix='bench_auth_')}}
+    with benchmark_database(), override_settings(ALLOWED_HOSTS=['*'], CACHES=shared_cache):
+        user = User.objects.create_user(username='bench')
+        token = Token.objects.create(user=user)
+        Product.objects.bulk_create(Product(name=f'Товар {i}', price=i % 100 + 1) for i in range(100))
+        if args.db_latency:
+            install_db_latency(args.db_latency)
+        header = f'Token {token.key}'
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=header)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=header)
+
+        results = []
+        for name, auth_class in implementations():
+            cache.clear()
+            result = measure(lambda: auth_class().authenticate(request), repeat=args.repeat)
+            results.append({'route': 'authenticate()', 'implementation': name, **result})
+            # authentication_classes представлений берутся из APIView
+            with mock.patch.object(APIView, 'authentication_classes', [auth_class]):
+                for route in ROUTES:
+                    client.get(route)
+                    result = measure(lambda: client.get(route), repeat=args.repeat)
+                    results.append({'route': route, 'implementation': name, **result})
+        write_results('auth', results, args.output, db_latency_ms=args.db_latency)
+
+
+if __name__ == '__main__':
+    main()
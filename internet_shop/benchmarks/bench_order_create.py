@@ -0,0 +1,66 @@
+"""
+Бенчмарк создания заказа на 1, 50 и 500 позиций.
+
+Сравнивает OrderSerializer (все товары загружаются одним in_bulk, итоги считаются
+до INSERT) с прежней схемой, где товар каждой позиции загружался отдельным
+запросом, а count/total записывались дополнительным UPDATE.
+
+    python -m benchmarks.bench_order_create [--repeat 20] [--output results.json]
+"""
+import argparse
+from types import SimpleNamespace
+
+from benchmarks.common import setup_django, benchmark_database, measure, write_results
+
+LINES = (1, 50, 500)
+
+
+def legacy_create(user, lines):
+    from django.db import transaction
+    from shop_api.models import Product, Order, Position
+
+    with transaction.atomic():
+        order = Order.objects.create(user=user, count=0, total=0)
+        positions = []
+        for line in lines:
+            product = Product.objects.get(pk=line['product'])
+            order.total += product.price * line['quantity']
+            order.count += line['quantity']
+            positions.append(Position(order=order, product=product, quantity=line['quantity']))
+        order.save()
+        Position.objects.bulk_create(positions)
+
+
+def serializer_create(user, lines):
+    from shop_api.serializers import OrderSerializer
+
+    serializer = OrderSerializer(data={'products': lines}, context={'request': SimpleNamespace(user=user)})
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from shop_api.models import Product
+
+    with benchmark_database():
+        user = User.objects.create_user(username='bench')
+        Product.objects.bulk_create(Product(name=f'Товар {i}', price=i % 100 + 1) for i in range(max(LINES)))
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        results = []
+        for count in LINES:
+            lines = [{'product': pk, 'quantity': 2} for pk in product_ids[:count]]
+            for name, func in (('legacy', legacy_create), ('in_bulk', serializer_create)):
+                result = measure(lambda: func(user, lines), repeat=args.repeat)
+                results.append({'lines': count, 'implementation': name, **result})
+        write_results('order_create', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager, ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """ Инициализация Django для запуска бенчмарка как скрипта: python -m benchmarks.<name> """
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'internet_shop.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """ Отдельная тестовая БД (test_<NAME>), чтобы данные бенчмарка не попали в рабочую """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def measure(func, repeat=10, setup=None):
+    """ Время (мс, перцентили) и число SQL-запросов за вызов func() """
+    from django.db import connections
+    from shop_api.budgets import QueryRecorder
+
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            start = time.perf_counter()
+            func(*args)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(recorder.count)
+    return {
+        'repeat': repeat,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, results, output=None, **metadata):
+    """ Результаты в JSON для сравнения прогонов между коммитами; metadata - параметры прогона """
+    from django.db import connection
+
+    payload = {
+        'benchmark': name,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'database': connection.vendor,
+        **metadata,
+        'results': results,
+    }
+    text = json.dumps(payload, ensure_ascii=False, indent=2)
+    if output:
+        Path(output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+    return payload
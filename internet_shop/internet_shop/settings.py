@@ -27,6 +27,10 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Превышение бюджета SQL-запросов действием ViewSet (shop_api.budgets):
+# True - исключение, False - предупреждение в лог
+QUERY_BUDGETS_STRICT = DEBUG
+
 
 # Application definition
 
@@ -41,15 +45,18 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
-    'shop_api',
+    'shop_api.apps.ShopApiConfig',
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы Server-Timing учитывал все остальные middleware
+    'shop_api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop_api.replicas.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +96,74 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (shop_api.replicas): DB_REPLICA_HOSTS=host1,host2 - с теми же базой и учётными данными.
+# В тестах реплики указывают на тестовую базу default
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, map(str.strip, os.getenv('DB_REPLICA_HOSTS', '').split(','))), 1):
+    DATABASES[f'replica_{_index}'] = {**DATABASES['default'], 'HOST': _host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+
+DATABASE_ROUTERS = ['shop_api.replicas.ReplicaRouter']
+
+# Сколько секунд после своей записи пользователь читает каталог из default, а не с реплик
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Кэш ответов каталога (shop_api.cache): алиас в CACHES и время жизни в секундах
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Выгрузка заказов (shop_api.export): число строк, читаемых из курсора за раз
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
+# Массовая смена статуса заказов (shop_api.order_status): максимум id в одном запросе
+ORDER_BULK_STATUS_MAX_IDS = 10000
+
+# Избранное (shop_api.favourites): максимум товаров в одном запросе добавления/удаления
+FAVOURITES_MAX_PRODUCTS = 500
+
+# Рекомендации "часто покупают вместе" (shop_api.recommendations): товаров в топе
+RECOMMENDATIONS_TOP_K = 10
+
+# Число строк, начиная с которого списки в админке и API (?with_count=true) показывают оценку вместо точного
+# COUNT(*), и время жизни точного числа, сохранённого в кэше как оценка на СУБД кроме PostgreSQL (shop_api.counts)
+ESTIMATED_COUNT_THRESHOLD = 10000
+COUNT_CACHE_TIMEOUT = 600
+
+# Outbox (shop_api.outbox, manage.py process_outbox): сообщений в пачке, потоков воркера, пауза опроса пустой очереди,
+# число попыток и экспоненциальная задержка между ними (секунды)
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_CONCURRENCY = 1
+OUTBOX_POLL_INTERVAL = 1.0
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 5
+OUTBOX_RETRY_MAX_DELAY = 600
+
+# Строки лога о запросах (shop_api.timing) в JSON: эндпоинт, статус, фазы в мс
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'shop_api.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'shop_api.outbox': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Асинхронные эндпоинты каталога (shop_api.async_views): размер пула потоков для работы с БД
+ASYNC_DB_POOL_SIZE = 8
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -128,8 +203,12 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Кэш аутентификации по токену (shop_api.authentication): записей в LRU процесса и время жизни в секундах
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',),
+        'shop_api.authentication.CachedTokenAuthentication',),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
     }
@@ -1,47 +1,105 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin, DateFieldListFilter
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
 
-from shop_api.models import Product, Review, Order, Position, ProductCollections
+from shop_api.counts import estimate_count
+from shop_api.models import Product, Review, Order, Position, ProductCollections, OutboxMessage
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Точный COUNT(*) только для небольших списков: начиная с порога - оценка планировщика PostgreSQL """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class ScalableModelAdmin(ModelAdmin):
+    """ Список без второго COUNT(*) по всей таблице при фильтрации и с оценкой числа строк """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class CappedInlineFormSet(BaseInlineFormSet):
+    """ Формы только для первых max_shown объектов (в порядке queryset встройки), остальные не загружаются """
+    max_shown = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_capped_queryset'):
+            self._capped_queryset = super().get_queryset()[:self.max_shown]
+        return self._capped_queryset
 
 
 class ReviewInline(admin.TabularInline):
-    """Отзывы на странице фильма"""
+    """Последние отзывы на странице товара"""
     model = Review
+    formset = CappedInlineFormSet
+    verbose_name_plural = f"Последние отзывы (до {CappedInlineFormSet.max_shown})"
     extra = 1
     readonly_fields = ("creator", "review_text", "rating")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("creator").order_by("-created_at", "-id")
+
 
 class PositionInline(admin.TabularInline):
     """Позиции на странице заказов"""
     model = Position
     extra = 1
     list_display = ("product", "quantity")
+    autocomplete_fields = ("product",)
 
 
 @admin.register(Product)
-class ProductAdmin(ModelAdmin):
+class ProductAdmin(ScalableModelAdmin):
     """Продукты"""
     list_display = ("name", "description", "price", "created_at", "updated_at")
+    search_fields = ("name",)
+    # избранное меняют пользователи через API; список всех пользователей в форме не выводится
+    exclude = ("favourites",)
+    date_hierarchy = "created_at"
     inlines = [ReviewInline]
 
 
 @admin.register(Review)
-class ReviewAdmin(ModelAdmin):
+class ReviewAdmin(ScalableModelAdmin):
     """Отзывы"""
     list_display = ("creator", "review_text", "rating", "product", "created_at", "updated_at")
+    list_select_related = ("creator", "product")
+    autocomplete_fields = ("creator", "product")
+    date_hierarchy = "created_at"
 
 
 @admin.register(Order)
-class OrderAdmin(ModelAdmin):
+class OrderAdmin(ScalableModelAdmin):
     """Заказы"""
     list_display = ("user", "status", "total", "count", "created_at", "updated_at")
-    inlines = [PositionInline]
+    list_select_related = ("user",)
     list_filter = (
+        "status",
         ('created_at', DateFieldListFilter),
     )
+    autocomplete_fields = ("user",)
+    date_hierarchy = "created_at"
+    inlines = [PositionInline]
 
 
 @admin.register(ProductCollections)
 class ProductCollectionsAdmin(ModelAdmin):
     """Подборки"""
     list_display = ('title', 'text', 'created_at', 'updated_at')
+    autocomplete_fields = ("products",)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(ScalableModelAdmin):
+    """Outbox: необработанные сообщения и сообщения с исчерпанными попытками"""
+    list_display = ("topic", "object_id", "attempts", "available_at", "failed_at", "last_error")
+    list_filter = ("topic", ("failed_at", admin.EmptyFieldListFilter))
+    readonly_fields = ("topic", "object_id", "payload", "created_at", "attempts", "last_error", "failed_at")
@@ -0,0 +1,111 @@
+"""
+Аналитика продаж по дневным сводным таблицам.
+
+SalesDaily (день) и ProductSalesDaily (товар, день) хранят выручку, число
+проданных штук и заказов без отменённых; день - дата создания заказа (UTC).
+Таблицы обновляются инкрементально: позиции нового заказа прибавляет
+воркер outbox (shop_api.outbox), при переходе в CANCELLED они вычитаются в
+транзакции изменения заказа (и прибавляются снова при выходе из CANCELLED). Каждая таблица
+обновляется одним INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE.
+Месячные значения суммируются из дневных. Историю заполняет команда
+backfill_sales.
+"""
+from datetime import datetime, time, timezone
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, QuerySet, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+
+from shop_api.models import OrderStatusChoices, Position, ProductSalesDaily, SalesDaily
+from shop_api.upsert import add_rows
+
+ROLLUP_FIELDS = ('revenue', 'units', 'orders')
+
+# заказов на один запрос обновления сводных таблиц (ограничение числа параметров SQL)
+CHUNK_SIZE = 5000
+
+
+def is_counted(status):
+    return status != OrderStatusChoices.CANCELLED
+
+
+def _grouped_positions(positions, by_product, sign=1):
+    """ Позиции, сгруппированные по (товар,) день, со знаком для вычитания """
+    keys = ('product', 'day') if by_product else ('day',)
+    revenue = Sum(F('quantity') * Coalesce('price', 'product__price'), output_field=FloatField())
+    return (positions
+            .annotate(day=TruncDate('order__created_at'))
+            .values(*keys)
+            .annotate(revenue=revenue * Value(float(sign)),
+                      units=Sum('quantity') * Value(sign),
+                      orders=Count('order', distinct=True) * Value(sign))
+            .order_by())
+
+
+def _rollups():
+    return ((ProductSalesDaily, True), (SalesDaily, False))
+
+
+def _upsert(model, rows, by_product, using):
+    add_rows(model, rows, ('product', 'day') if by_product else ('day',), ROLLUP_FIELDS, using)
+
+
+def apply_orders(order_ids, sign=1, using='default'):
+    """
+    Прибавление (sign=1) или вычитание (sign=-1) заказов из сводных таблиц;
+    order_ids - список id или queryset заказов (подзапрос, без выборки id).
+    """
+    if isinstance(order_ids, QuerySet):
+        chunks = [order_ids.values('id')]
+    else:
+        order_ids = list(order_ids)
+        chunks = [order_ids[start:start + CHUNK_SIZE] for start in range(0, len(order_ids), CHUNK_SIZE)]
+    for chunk in chunks:
+        positions = Position.objects.using(using).filter(order_id__in=chunk)
+        for model, by_product in _rollups():
+            _upsert(model, _grouped_positions(positions, by_product, sign), by_product, using)
+
+
+def apply_status_change(order_ids, old_status, new_status, using='default'):
+    """ Учёт смены статуса заказов: отмена вычитает их, выход из отмены - прибавляет """
+    if is_counted(old_status) != is_counted(new_status):
+        apply_orders(order_ids, 1 if is_counted(new_status) else -1, using=using)
+
+
+def rebuild_sales(since=None, using='default'):
+    """
+    Пересчёт сводных таблиц с нуля (или начиная с дня since) по заказам без
+    отменённых; возвращает число строк в таблицах по товарам и по дням.
+    """
+    positions = Position.objects.using(using).exclude(order__status=OrderStatusChoices.CANCELLED)
+    days = {}
+    if since is not None:
+        positions = positions.filter(order__created_at__gte=datetime.combine(since, time.min, tzinfo=timezone.utc))
+        days = {'day__gte': since}
+    counts = []
+    with transaction.atomic(using=using):
+        for model, by_product in _rollups():
+            model.objects.using(using).filter(**days).delete()
+            _upsert(model, _grouped_positions(positions, by_product), by_product, using)
+            counts.append(model.objects.using(using).filter(**days).count())
+    return counts
+
+
+def sales_report(period='day', date_after=None, date_before=None, products=None):
+    """ Продажи по дням или месяцам: итоги или по товарам (если заданы products) """
+    if products:
+        queryset = ProductSalesDaily.objects.filter(product__in=products)
+        keys = ('date', 'product')
+    else:
+        queryset = SalesDaily.objects.all()
+        keys = ('date',)
+    if date_after:
+        queryset = queryset.filter(day__gte=date_after)
+    if date_before:
+        queryset = queryset.filter(day__lte=date_before)
+    date = TruncMonth('day') if period == 'month' else F('day')
+    return (queryset
+            .annotate(date=date)
+            .values(*keys)
+            .annotate(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders'))
+            .order_by(*keys))
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ShopApiConfig(AppConfig):
     name = 'shop_api'
+
+    def ready(self):
+        from shop_api import replicas, signals  # noqa: F401
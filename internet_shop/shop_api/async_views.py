@@ -0,0 +1,70 @@
+"""
+Асинхронные (ASGI) эндпоинты чтения каталога: товары, отзывы, подборки.
+
+В Django 3.1 нет асинхронного ORM, поэтому вся работа с БД (выборка,
+сериализация с ленивыми обращениями к связям, рендеринг) выполняется в
+отдельном ограниченном пуле потоков, а корутина представления только ждёт
+результат. Цикл событий при этом не блокируется, а число одновременных
+обращений к БД (и соединений) не превышает ASYNC_DB_POOL_SIZE. Логика
+ответа - фильтры, пагинация, кэш, ETag - та же, что у синхронных ViewSet.
+
+Для синхронного представления под ASGI Django использует один общий поток,
+так что медленные запросы к БД выполняются по очереди; здесь - параллельно
+в пределах пула.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed
+
+from shop_api.views import ProductViewSet, ReviewViewSet, CollectionViewSet
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_executor = None
+
+
+def get_executor():
+    """ Пул потоков для работы с БД (создаётся при первом запросе) """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_DB_POOL_SIZE', 8),
+                                       thread_name_prefix='shop-api-db')
+    return _executor
+
+
+def _call_in_pool(view, request, kwargs):
+    # соединения потоков пула живут по CONN_MAX_AGE, как и в обычном запросе
+    close_old_connections()
+    try:
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(viewset, actions):
+    """ Корутина-представление над действиями чтения ViewSet """
+    view = viewset.as_view(actions)
+
+    async def async_view(request, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return HttpResponseNotAllowed(SAFE_METHODS)
+        call = sync_to_async(_call_in_pool, thread_sensitive=False, executor=get_executor())
+        return await call(view, request, kwargs)
+
+    async_view.csrf_exempt = True
+    async_view.__name__ = f'async_{viewset.__name__}'
+    return async_view
+
+
+product_list = async_read_view(ProductViewSet, {'get': 'list'})
+product_detail = async_read_view(ProductViewSet, {'get': 'retrieve'})
+review_list = async_read_view(ReviewViewSet, {'get': 'list'})
+review_detail = async_read_view(ReviewViewSet, {'get': 'retrieve'})
+collection_list = async_read_view(CollectionViewSet, {'get': 'list'})
+collection_detail = async_read_view(CollectionViewSet, {'get': 'retrieve'})
@@ -0,0 +1,146 @@
+"""
+Аутентификация по токену с кэшем: токен -> пользователь без запроса к БД.
+
+Найденный токен с пользователем хранится в двух уровнях:
+
+* LRU в памяти процесса (AUTH_TOKEN_CACHE_SIZE записей, не дольше
+  AUTH_TOKEN_CACHE_TIMEOUT секунд);
+* кэш Django на то же время.
+
+У каждого токена в кэше Django есть "поколение" - случайное значение,
+которое читается до обращения к БД и входит в ключ записи; записи LRU помнят
+поколение, при котором были добавлены, поэтому попадание в LRU стоит одного
+чтения из кэша Django. Отзыв (удаление Token, сохранение пользователя - в том
+числе снятие is_active) меняет поколение только отзываемых токенов: прежние
+записи больше не читаются ни одним процессом, а записи других пользователей
+остаются в кэше. Запрос, который прочитал поколение и загрузил токен до
+отзыва, а записал его в кэш после, пишет под ключом старого поколения, и эту
+запись уже никто не прочитает. Изменения через QuerySet.update() сигналов не
+отправляют - для них вызывается revoke_user().
+
+Отзыв должен быть виден всем воркерам, поэтому кэш работает только с общим
+для процессов кэшем Django (Redis, Memcached, БД, файлы); с LocMemCache
+токен, как в TokenAuthentication, проверяется по БД в каждом запросе.
+"""
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from shop_api.cache_backends import is_shared
+
+_GENERATION_PREFIX = 'shop_api:auth:generation:'
+_TOKEN_PREFIX = 'shop_api:auth:token:'
+
+
+def _token_hash(key):
+    # сам токен в ключи кэшей не попадает
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_key(token_hash, generation):
+    return f'{_TOKEN_PREFIX}{generation}:{token_hash}'
+
+
+def _generation_key(token_hash):
+    return _GENERATION_PREFIX + token_hash
+
+
+class LRUCache:
+    """ Ограниченный по размеру словарь с вытеснением давно не использованных записей и сроком жизни """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, entry_generation, value = entry
+            if expires < time.monotonic() or entry_generation != generation:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, generation, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, generation, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+
+def _generation(token_hash):
+    key = _generation_key(token_hash)
+    generation = cache.get(key)
+    if generation is None:
+        # поколение истекло или вытеснено - новое, записи со старым не читаются
+        cache.add(key, uuid.uuid4().hex, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        generation = cache.get(key)
+    return generation
+
+
+def revoke_tokens(keys):
+    """ Немедленный отзыв закэшированных токенов во всех процессах """
+    hashes = [_token_hash(key) for key in keys]
+    if not hashes:
+        return
+    # записи кэша Django со старым поколением в ключе больше не читаются и истекают по таймауту
+    cache.set_many({_generation_key(token_hash): uuid.uuid4().hex for token_hash in hashes},
+                   settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    for token_hash in hashes:
+        _local.delete(token_hash)
+
+
+def revoke_user(user_id):
+    """ Отзыв токенов пользователя (после изменения или деактивации) """
+    revoke_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ TokenAuthentication с кэшем токен -> пользователь (LRU процесса + кэш Django) """
+
+    def authenticate_credentials(self, key):
+        if not is_shared(caches[DEFAULT_CACHE_ALIAS]):
+            # отзыв в другом воркере в кэш этого процесса не попадёт
+            return super().authenticate_credentials(key)
+        token_hash = _token_hash(key)
+        generation = _generation(token_hash)
+        payload = _local.get(token_hash, generation)
+        if payload is None:
+            cache_key = _cache_key(token_hash, generation)
+            payload = cache.get(cache_key)
+            if payload is None:
+                user, token = super().authenticate_credentials(key)
+                payload = pickle.dumps(token, pickle.HIGHEST_PROTOCOL)
+                cache.set(cache_key, payload, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            _local.set(token_hash, generation, payload)
+        # каждый запрос получает свою копию пользователя
+        token = pickle.loads(payload)
+        return token.user, token
+
+    def get_model(self):
+        return Token
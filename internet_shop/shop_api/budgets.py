@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# управляющие команды транзакций не считаются: в тестах atomic() превращается
+# в SAVEPOINT/RELEASE, а в production - в BEGIN/COMMIT (на SQLite BEGIN
+# выполняется через execute(), на PostgreSQL - драйвером)
+_IGNORED_SQL_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN')
+
+_report_lock = threading.Lock()
+_report = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """ Действие выполнило больше SQL-запросов, чем заявлено в его бюджете """
+
+
+class QueryRecorder:
+    """ Обёртка для connection.execute_wrapper: число запросов и время в БД """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.lstrip().upper().startswith(_IGNORED_SQL_PREFIXES):
+                self.count += 1
+                self.duration += time.perf_counter() - start
+
+
+def get_query_budget_report():
+    """ Накопленная статистика по действиям: "ProductViewSet.list" -> {...} """
+    with _report_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _report.items()}
+
+
+def reset_query_budget_report():
+    with _report_lock:
+        _report.clear()
+
+
+def _record(endpoint, recorder, budget):
+    with _report_lock:
+        stats = _report.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time': 0.0, 'over_budget': 0,
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['max_queries'] = max(stats['max_queries'], recorder.count)
+        stats['db_time'] += recorder.duration
+        stats['budget'] = budget
+        if budget is not None and recorder.count > budget:
+            stats['over_budget'] += 1
+
+
+class QueryBudgetMixin:
+    """
+    Mixin для ViewSet: считает SQL-запросы и время БД каждого запроса к действию
+    и сверяет их с бюджетом из query_budgets = {"list": 1, ...}. Бюджет включает
+    запрос аутентификации по токену; действия без бюджета только учитываются.
+
+    При QUERY_BUDGETS_STRICT (по умолчанию равен DEBUG) превышение бюджета
+    приводит к QueryBudgetExceeded, иначе пишется предупреждение в лог.
+    """
+
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = super().dispatch(request, *args, **kwargs)
+        self.check_query_budget(recorder)
+        return response
+
+    def check_query_budget(self, recorder):
+        action = getattr(self, 'action', None)
+        if action is None:
+            return
+        endpoint = f"{type(self).__name__}.{action}"
+        budget = self.query_budgets.get(action)
+        _record(endpoint, recorder, budget)
+        logger.debug("%s: %d queries, %.1f ms in DB", endpoint, recorder.count, recorder.duration * 1000)
+        if budget is None or recorder.count <= budget:
+            return
+        message = (f"{endpoint} выполнил {recorder.count} SQL-запросов "
+                   f"({recorder.duration * 1000:.1f} ms) при бюджете {budget}")
+        if getattr(settings, 'QUERY_BUDGETS_STRICT', settings.DEBUG):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
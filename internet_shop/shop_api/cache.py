@@ -0,0 +1,130 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from shop_api.cache_backends import is_shared
+from shop_api.replicas import is_read_cacheable
+
+# Инвалидация через версии: ключ ответа включает текущие версии его областей
+# ("products", "product:5", ...). Сигнал изменения данных увеличивает версию
+# области, и все ответы с прежней версией перестают находиться в кэше.
+# Версия - время последнего изменения области в наносекундах, поэтому она же
+# служит Last-Modified ответов (см. ResponseCacheMixin.get_cached_freshness).
+# Версии в кэше в памяти процесса видит только свой воркер, поэтому с таким
+# кэшем ETag считается по БД, а ключ ответа включает и эту актуальность.
+_VERSION_PREFIX = 'shop_api:version:'
+_RESPONSE_PREFIX = 'shop_api:response:'
+
+
+def response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope):
+    return _VERSION_PREFIX + scope
+
+
+def get_versions(scopes):
+    cache = response_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # начальная версия по времени: после вытеснения ключа версии из кэша
+            # старые ответы не совпадут с новой версией
+            initial = time.time_ns()
+            cache.add(key, initial, None)
+            versions[key] = cache.get(key, initial)
+    return [versions[key] for key in keys]
+
+
+def _bump(scopes):
+    cache = response_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    now = time.time_ns()
+    # не меньше прежней версии + 1: повторный сброс после COMMIT всегда даёт новую версию
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def invalidate(*scopes, using=None):
+    """
+    Сброс закэшированных ответов областей. Версия увеличивается сразу и ещё раз
+    после фиксации транзакции, чтобы параллельный запрос не сохранил под новой
+    версией данные, прочитанные до COMMIT.
+    """
+    scopes = set(scopes)
+    if not scopes:
+        return
+    _bump(scopes)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes), using=using)
+
+
+def build_key(view, request, versions, freshness=None):
+    """ Ключ ответа: действие, нормализованные параметры запроса, формат, версии областей и актуальность из БД """
+    query = urlencode(sorted((key, value) for key, values in request.query_params.lists() for value in values))
+    parts = [
+        type(view).__name__,
+        view.action,
+        request.get_host(),
+        request.accepted_renderer.format,
+        query,
+        *map(str, versions),
+        *(f'{key}={value}' for key, value in sorted((freshness or {}).items())),
+    ]
+    return _RESPONSE_PREFIX + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+class ResponseCacheMixin:
+    """
+    Mixin для ViewSet: кэширует данные ответов list/retrieve (до рендеринга),
+    так что при попадании в кэш не выполняются ни выборка, ни сериализация.
+    Области кэша действия возвращает get_cache_scopes().
+    """
+
+    def get_cache_scopes(self):
+        raise NotImplementedError
+
+    def get_scope_versions(self):
+        """ Версии областей действия; читаются из кэша один раз за запрос (для ETag и ключа ответа) """
+        if getattr(self, '_scope_versions', None) is None:
+            self._scope_versions = get_versions(self.get_cache_scopes())
+        return self._scope_versions
+
+    def get_cached_freshness(self):
+        """
+        Актуальность ответа для ConditionalGetMixin по версиям областей: ответ
+        304 и попадание в кэш обходятся без запросов к БД. None - кэш не общий
+        для процессов, и версии не учитывают записи других воркеров.
+        """
+        if not is_shared(response_cache()):
+            return None
+        versions = self.get_scope_versions()
+        return {'versions': ','.join(map(str, versions)),
+                'last_modified': datetime.fromtimestamp(max(versions) / 10 ** 9, tz=timezone.utc)}
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = response_cache()
+        freshness = None if is_shared(cache) else getattr(self, 'freshness', None)
+        key = build_key(self, request, self.get_scope_versions(), freshness)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        # ответ, прочитанный с реплики сразу после записи, может быть устаревшим
+        if response.status_code == 200 and is_read_cacheable():
+            cache.set(key, response.data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        return response
@@ -0,0 +1,17 @@
+"""
+Общий ли кэш Django для процессов.
+
+Версии кэша ответов, отзыв токенов и закрепление за primary после записи
+имеют смысл, только если их видят все воркеры. Кэш в памяти процесса
+(LocMemCache) и DummyCache у каждого воркера свои, поэтому код, которому
+нужна общая запись, при таком кэше идёт в БД.
+"""
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(cache):
+    """ Видны ли записи кэша другим процессам (Redis, Memcached, БД, файлы) """
+    return not isinstance(cache, PROCESS_LOCAL_BACKENDS)
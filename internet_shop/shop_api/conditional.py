@@ -0,0 +1,93 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    Mixin для ViewSet: ETag и Last-Modified для list/retrieve и ответ 304 на
+    If-None-Match/If-Modified-Since.
+
+    Актуальность проверяется до сериализации. Для записи (retrieve) - одним
+    агрегатным запросом (Max(updated_at), Count) по её pk, зависимые данные
+    добавляются через get_freshness_aggregates(). Для страницы списка
+    выбираются только pk и updated_at её записей тем же условием курсора, что
+    и у KeysetPagination (по индексу сортировки, без агрегата по всей таблице),
+    зависимые данные агрегируются по этим pk. Если view поддерживает версии
+    своих данных в общем для процессов кэше (get_cached_freshness() из
+    ResponseCacheMixin), актуальность берётся из них без запросов к БД.
+    """
+
+    # поле для Last-Modified; None - только ETag (если изменения нельзя датировать)
+    last_modified_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_freshness_aggregates(self):
+        return {}
+
+    def get_freshness(self):
+        cached_freshness = getattr(self, 'get_cached_freshness', None)
+        freshness = cached_freshness() if cached_freshness is not None else None
+        if freshness is not None:
+            return freshness
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        elif hasattr(self.paginator, 'get_page_queryset'):
+            page = self.paginator.get_page_queryset(queryset, self.request, view=self)
+            if page is not None:
+                return self.get_page_freshness(queryset, page)
+        aggregates = {'count': Count('pk', distinct=True), **self.get_freshness_aggregates()}
+        if self.last_modified_field:
+            aggregates['last_modified'] = Max(self.last_modified_field)
+        return queryset.order_by().aggregate(**aggregates)
+
+    def get_page_freshness(self, queryset, page):
+        """ Актуальность страницы списка: её pk и updated_at, зависимые данные - агрегатом по этим pk """
+        fields = ['pk'] + ([self.last_modified_field] if self.last_modified_field else [])
+        rows = list(page.prefetch_related(None).values_list(*fields))
+        freshness = {'page': hashlib.md5(repr(rows).encode()).hexdigest()}
+        if self.last_modified_field and rows:
+            freshness['last_modified'] = max(row[1] for row in rows)
+        aggregates = self.get_freshness_aggregates()
+        if aggregates and rows:
+            freshness.update(queryset.model._default_manager.filter(pk__in=[row[0] for row in rows])
+                             .order_by().aggregate(**aggregates))
+        return freshness
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        freshness = self.get_freshness()
+        if freshness.get('count') == 0:
+            return handler(request, *args, **kwargs)
+        # данные актуальности - часть ключа кэша ответов, если кэш не общий для процессов
+        self.freshness = freshness
+
+        last_modified = [value for key, value in freshness.items() if key.endswith('last_modified') and value]
+        last_modified = int(max(last_modified).timestamp()) if last_modified else None
+        state = '|'.join([
+            type(self).__name__,
+            self.action,
+            request.accepted_renderer.format,
+            request.get_full_path(),
+            str(request.user.pk),
+            *(f'{key}={freshness[key]}' for key in sorted(freshness)),
+        ])
+        etag = 'W/"{}"'.format(hashlib.md5(state.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,57 @@
+"""
+Оценка числа строк запроса без COUNT(*).
+
+На PostgreSQL оценку даёт статистика планировщика: для запроса без условий -
+pg_class.reltuples таблицы, для запроса с условиями - число строк из плана
+(EXPLAIN). Статистика обновляется ANALYZE/autovacuum, поэтому оценка
+приблизительна. На других СУБД оценкой служит точное число, посчитанное
+ранее для того же запроса и сохранённое в кэше на COUNT_CACHE_TIMEOUT секунд
+(по истечении оно пересчитывается). Точный COUNT(*) выполняется, если оценки
+нет или она меньше ESTIMATED_COUNT_THRESHOLD.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+def estimate_count(queryset):
+    """ Оценка числа строк queryset по статистике планировщика или None """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where and not queryset.query.distinct:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                           [connection.ops.quote_name(queryset.model._meta.db_table)])
+            row = cursor.fetchone()
+            # -1 (PostgreSQL 14+) или 0: таблица ещё не анализировалась
+            return int(row[0]) if row and row[0] > 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _cache_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    return 'shop_api:count:' + hashlib.md5(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+
+
+def count_rows(queryset):
+    """ Число строк queryset и признак точности: (count, True) - COUNT(*), (count, False) - оценка """
+    estimate = estimate_count(queryset)
+    key = None
+    if estimate is None:
+        key = _cache_key(queryset)
+        estimate = cache.get(key)
+    if estimate is not None and estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+        return estimate, False
+    count = queryset.count()
+    if key is not None:
+        cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+    return count, True
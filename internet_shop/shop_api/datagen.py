@@ -0,0 +1,295 @@
+"""
+Генератор синтетических данных: пользователи, товары, отзывы, заказы с
+позициями, избранное и подборки (команда manage.py generate_data).
+
+* Данные детерминированы: одинаковые seed, объёмы и end_date дают одинаковые
+  строки.
+* id назначаются явно, подряд после максимального существующего, поэтому
+  связанные строки не требуют повторной выборки, а последовательности
+  PostgreSQL сдвигаются в конце.
+* Вставка порциями: на PostgreSQL - COPY FROM STDIN, на остальных СУБД -
+  bulk_create.
+* Агрегаты оценок товаров считаются при генерации (отзывы распределяются до
+  вставки товаров), поисковый индекс, счётчики избранного, сводные таблицы
+  продаж и матрица совместных покупок перестраиваются запросами в конце.
+"""
+import io
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from shop_api.analytics import rebuild_sales
+from shop_api.cache import invalidate
+from shop_api.favourites import rebuild_favourites_counts
+from shop_api.models import Product, Review, Order, Position, ProductCollections, OrderStatusChoices
+from shop_api.recommendations import add_order_range, refresh_top
+from shop_api.search import rebuild_index
+
+# объёмы товаров, отзывов и заказов по имени масштаба
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+CHUNK_SIZE = 10_000
+
+# период, за который распределяются даты создания
+HISTORY_DAYS = 365
+
+WORDS = ('ноутбук', 'телефон', 'планшет', 'монитор', 'клавиатура', 'мышь', 'наушники', 'колонка',
+         'принтер', 'роутер', 'камера', 'часы', 'кабель', 'зарядка', 'чехол', 'диск')
+ADJECTIVES = ('быстрый', 'надёжный', 'компактный', 'игровой', 'офисный', 'беспроводной', 'тихий', 'яркий')
+
+RATING_WEIGHTS = (5, 8, 15, 32, 40)
+STATUS_WEIGHTS = {
+    OrderStatusChoices.NEW: 10,
+    OrderStatusChoices.IN_PROGRESS: 10,
+    OrderStatusChoices.DONE: 70,
+    OrderStatusChoices.CANCELLED: 10,
+}
+
+
+@contextmanager
+def _explicit_timestamps(model):
+    """ bulk_create с заданными created_at/updated_at: auto_now(_add) на время вставки отключается """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class Writer:
+    """ Порционная вставка строк (кортежей значений столбцов attname) в таблицу модели """
+
+    def __init__(self, using, chunk_size=CHUNK_SIZE, use_copy=True, progress=None):
+        self.using = using
+        self.connection = connections[using]
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy and self.connection.vendor == 'postgresql'
+        self.progress = progress
+        self._reported = 0.0
+
+    def write(self, label, model, columns, rows, total):
+        fields = [model._meta.get_field(column) for column in columns]
+        # поля со значением по умолчанию, не заданные генератором (для COPY нужны все NOT NULL)
+        defaults = [field for field in model._meta.concrete_fields
+                    if field.attname not in columns and not field.primary_key]
+        started = time.perf_counter()
+        done = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                self._flush(model, fields, defaults, chunk)
+                done += len(chunk)
+                chunk = []
+                self._report(label, done, total, started)
+        if chunk:
+            self._flush(model, fields, defaults, chunk)
+            done += len(chunk)
+        self._report(label, done, total, started, final=True)
+        return done
+
+    def _report(self, label, done, total, started, final=False):
+        # не чаще раза в секунду, итог по таблице - всегда
+        now = time.perf_counter()
+        if self.progress and (final or now - self._reported >= 1):
+            self._reported = now
+            self.progress(label, done, total, now - started)
+
+    def _flush(self, model, fields, defaults, rows):
+        if self.use_copy:
+            self._copy(model, fields, defaults, rows)
+        else:
+            with _explicit_timestamps(model):
+                model.objects.using(self.using).bulk_create(
+                    [model(**{field.attname: value for field, value in zip(fields, row)}) for row in rows]
+                )
+
+    def _copy(self, model, fields, defaults, rows):
+        connection = self.connection
+        tail = [_copy_value(field.get_db_prep_save(field.get_default(), connection)) for field in defaults]
+        buffer = io.StringIO()
+        for row in rows:
+            values = [_copy_value(field.get_db_prep_save(value, connection)) for field, value in zip(fields, row)]
+            buffer.write('\t'.join(values + tail))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields + defaults)
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+
+
+def _next_id(model, using):
+    return (model.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+
+def generate(users, products, reviews, orders, favourites_per_user=5, collections=20, collection_size=50,
+             seed=0, end_date=None, using='default', chunk_size=CHUNK_SIZE, use_copy=True, progress=None):
+    """ Генерация данных в одной транзакции; возвращает число вставленных строк по таблицам """
+    rnd = random.Random(seed)
+    end_date = end_date or datetime.now(timezone.utc).date()
+    end = datetime.combine(end_date, dt_time.min, tzinfo=timezone.utc)
+    start = end - timedelta(days=HISTORY_DAYS)
+    period = HISTORY_DAYS * 86400
+    writer = Writer(using, chunk_size, use_copy, progress)
+    reviews = min(reviews, users * products)
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+
+    def moment(after=None):
+        if after is None:
+            return start + timedelta(seconds=rnd.randrange(period))
+        return min(after + timedelta(seconds=rnd.randrange(7 * 86400)), end)
+
+    counts = {}
+    with transaction.atomic(using=using):
+        user_id = _next_id(User, using)
+        product_id = _next_id(Product, using)
+        review_id = _next_id(Review, using)
+        order_id = _next_id(Order, using)
+        position_id = _next_id(Position, using)
+
+        counts['users'] = writer.write('users', User, (
+            'id', 'username', 'password', 'is_superuser', 'is_staff', 'is_active', 'first_name', 'last_name',
+            'email', 'date_joined',
+        ), (
+            (user_id + i, f'user{user_id + i}', '!', False, False, True, '', '', '', moment())
+            for i in range(users)
+        ), users)
+
+        # отзывы распределяются заранее, чтобы записать агрегаты оценок вместе с товарами;
+        # пара (автор, товар) не повторяется: у каждого автора свой сдвиг по товарам
+        review_products = array('l')
+        review_ratings = array('b')
+        histogram = [array('l', [0]) * products for _ in range(5)]
+        for i in range(reviews):
+            user_index = i % users
+            product_index = (i // users + user_index * 7919) % products
+            rating = rnd.choices(range(1, 6), RATING_WEIGHTS)[0]
+            review_products.append(product_index)
+            review_ratings.append(rating)
+            histogram[rating - 1][product_index] += 1
+
+        prices = array('d')
+
+        def product_rows():
+            for i in range(products):
+                price = round(rnd.uniform(10, 5000), 2)
+                prices.append(price)
+                bins = [histogram[rating][i] for rating in range(5)]
+                rating_count = sum(bins)
+                rating_sum = sum((rating + 1) * count for rating, count in enumerate(bins))
+                created_at = moment()
+                yield (product_id + i,
+                       f'{rnd.choice(ADJECTIVES)} {rnd.choice(WORDS)} {product_id + i}'[:50],
+                       ' '.join(rnd.choices(WORDS + ADJECTIVES, k=12)),
+                       price, rating_sum / rating_count if rating_count else 0.0, rating_count, rating_sum,
+                       *bins, created_at, created_at)
+        counts['products'] = writer.write('products', Product, (
+            'id', 'name', 'description', 'price', 'rating_avg', 'rating_count', 'rating_sum',
+            'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+            'created_at', 'updated_at',
+        ), product_rows(), products)
+        del histogram
+
+        def review_rows():
+            for i in range(reviews):
+                created_at = moment()
+                yield (review_id + i, user_id + i % users, product_id + review_products[i], review_ratings[i],
+                       f'отзыв: {rnd.choice(ADJECTIVES)} {rnd.choice(WORDS)}', created_at, created_at)
+        counts['reviews'] = writer.write('reviews', Review, (
+            'id', 'creator_id', 'product_id', 'rating', 'review_text', 'created_at', 'updated_at',
+        ), review_rows(), reviews)
+        del review_products, review_ratings
+
+        # позиции заказа генерируются вместе с заказом и пишутся следующим проходом
+        # с тем же seed, поэтому в памяти не хранятся
+        def order_lines(rnd_lines):
+            for _ in range(orders):
+                size = rnd_lines.choices((1, 2, 3, 4, 5), (35, 25, 20, 12, 8))[0]
+                lines = rnd_lines.sample(range(products), size)
+                yield [(index, rnd_lines.randint(1, 3)) for index in lines]
+
+        lines_seed = rnd.random()
+
+        def order_rows():
+            for i, lines in enumerate(order_lines(random.Random(lines_seed))):
+                created_at = moment()
+                yield (order_id + i, user_id + rnd.randrange(users), rnd.choices(statuses, status_weights)[0],
+                       sum(quantity for _, quantity in lines),
+                       round(sum(prices[index] * quantity for index, quantity in lines), 2),
+                       created_at, moment(created_at))
+        counts['orders'] = writer.write('orders', Order, (
+            'id', 'user_id', 'status', 'count', 'total', 'created_at', 'updated_at',
+        ), order_rows(), orders)
+
+        def position_rows():
+            next_id = position_id
+            for i, lines in enumerate(order_lines(random.Random(lines_seed))):
+                for index, quantity in lines:
+                    yield next_id, order_id + i, product_id + index, quantity, prices[index]
+                    next_id += 1
+        counts['positions'] = writer.write('positions', Position, (
+            'id', 'order_id', 'product_id', 'quantity', 'price',
+        ), position_rows(), None)
+
+        favourites_per_user = min(favourites_per_user, products)
+        counts['favourites'] = writer.write('favourites', Product.favourites.through, ('user_id', 'product_id'), (
+            (user_id + i, product_id + index)
+            for i in range(users) for index in rnd.sample(range(products), favourites_per_user)
+        ), users * favourites_per_user)
+
+        collection_id = _next_id(ProductCollections, using)
+        counts['collections'] = writer.write('collections', ProductCollections, (
+            'id', 'title', 'text', 'created_at', 'updated_at',
+        ), (
+            (collection_id + i, f'Подборка {collection_id + i}', f'{rnd.choice(ADJECTIVES)} товары', end, end)
+            for i in range(collections)
+        ), collections)
+        collection_size = min(collection_size, products)
+        writer.write('collection products', ProductCollections.products.through,
+                     ('productcollections_id', 'product_id'), (
+                         (collection_id + i, product_id + index)
+                         for i in range(collections) for index in rnd.sample(range(products), collection_size)
+                     ), collections * collection_size)
+
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Product, Review, Order, Position,
+                                                                     ProductCollections]):
+                cursor.execute(sql)
+        rebuild_index(using)
+        rebuild_favourites_counts(Product.objects.using(using).filter(id__gte=product_id))
+        rebuild_sales(using=using)
+        if orders:
+            add_order_range(order_id, order_id + orders - 1, using)
+            refresh_top(using=using)
+        invalidate('products', 'collections', using=using)
+    return counts
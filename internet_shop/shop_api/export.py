@@ -0,0 +1,83 @@
+"""
+Потоковая выгрузка заказов с позициями для персонала.
+
+Заказы и позиции читаются одним запросом (LEFT JOIN, строка на позицию),
+отсортированным по заказу, через .iterator(chunk_size): на PostgreSQL это
+серверный курсор, поэтому в памяти одновременно находится не больше одной
+порции строк, а ответ формируется по мере чтения.
+"""
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from shop_api.models import Order
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+ORDER_FIELDS = ('id', 'user', 'status', 'total', 'count', 'created_at', 'updated_at')
+POSITION_FIELDS = ('product', 'quantity')
+
+
+def _chunk_size():
+    return getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+
+
+def iter_order_rows(orders):
+    """
+    Строки (заказ, позиция) для заказов из queryset. Фильтры применяются к
+    заказам подзапросом, чтобы отбор по позиции не сокращал список позиций.
+    """
+    rows = (Order.objects
+            .filter(id__in=orders.order_by().values('id'))
+            .annotate(username=F('user__username'),
+                      position_product=F('position__product_id'),
+                      position_quantity=F('position__quantity'))
+            .values('id', 'username', 'status', 'total', 'count', 'created_at', 'updated_at',
+                    'position_product', 'position_quantity')
+            .order_by('id', 'position__id'))
+    return rows.iterator(chunk_size=_chunk_size())
+
+
+def _order_values(row):
+    return [row['id'], row['username'], row['status'], row['total'], row['count'],
+            row['created_at'].isoformat(), row['updated_at'].isoformat()]
+
+
+def iter_ndjson(orders):
+    """ Заказ на строку, позиции - вложенным списком """
+    for _, rows in itertools.groupby(iter_order_rows(orders), key=lambda row: row['id']):
+        rows = list(rows)
+        order = dict(zip(ORDER_FIELDS, _order_values(rows[0])))
+        order['positions'] = [
+            {'product': row['position_product'], 'quantity': row['position_quantity']}
+            for row in rows if row['position_product'] is not None
+        ]
+        yield json.dumps(order, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """ Буфер для csv.writer, возвращающий записанную строку """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(orders):
+    """ Позиция на строку с повторением полей заказа """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(ORDER_FIELDS + POSITION_FIELDS)
+    for row in iter_order_rows(orders):
+        yield writer.writerow(_order_values(row) + [row['position_product'], row['position_quantity']])
+
+
+def iter_export(orders, export_format):
+    if export_format == 'csv':
+        return iter_csv(orders)
+    return iter_ndjson(orders)
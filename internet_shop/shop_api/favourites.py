@@ -0,0 +1,111 @@
+"""
+Избранное: добавление и удаление многих товаров одним запросом к связующей
+таблице Product.favourites.
+
+Повторное добавление и удаление отсутствующих игнорируются самой БД
+(INSERT ... ON CONFLICT DO NOTHING, DELETE ... WHERE). Изменённые строки
+возвращает RETURNING, по ним одним UPDATE обновляется счётчик
+Product.favourites_count - по нему товары сортируются без GROUP BY по
+связующей таблице. Сигналы m2m_changed при этом не отправляются.
+
+Каскадное удаление строк избранного вместе с пользователем счётчики не
+уменьшает, поэтому избранное удаляемого пользователя снимается заранее
+(clear_favourites в обработчике pre_delete).
+"""
+import sqlite3
+
+from django.db import connections, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from shop_api.models import Product
+from shop_api.signals import invalidate_products
+
+Favourite = Product.favourites.through
+
+
+def _supports_returning(connection):
+    # RETURNING в SQLite - с версии 3.35
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35))
+
+
+def _quoted(connection):
+    quote = connection.ops.quote_name
+    return (quote(Favourite._meta.db_table), quote(Product._meta.db_table),
+            quote(Favourite._meta.get_field('user').column), quote(Favourite._meta.get_field('product').column))
+
+
+def _apply_counts(product_ids, delta, using):
+    if not product_ids:
+        return
+    Product.objects.using(using).filter(id__in=product_ids).update(
+        favourites_count=F('favourites_count') + delta, updated_at=timezone.now())
+    invalidate_products(product_ids, using)
+
+
+def add_favourites(user_id, product_ids, using='default'):
+    """ Добавление товаров в избранное пользователя; возвращает id добавленных (без уже имевшихся и неизвестных) """
+    product_ids = sorted(set(product_ids))
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if _supports_returning(connection):
+            favourites, products, user_column, product_column = _quoted(connection)
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {favourites} ({user_column}, {product_column}) "
+                    f"SELECT %s, id FROM {products} WHERE id IN ({placeholders}) "
+                    f"ON CONFLICT DO NOTHING RETURNING {product_column}",
+                    [user_id, *product_ids],
+                )
+                added = sorted(row[0] for row in cursor.fetchall())
+        else:
+            added = list(Product.objects.using(using).filter(id__in=product_ids).exclude(favourites=user_id)
+                         .order_by('id').values_list('id', flat=True))
+            Favourite.objects.using(using).bulk_create(
+                [Favourite(user_id=user_id, product_id=product_id) for product_id in added], ignore_conflicts=True)
+        _apply_counts(added, 1, using)
+    return added
+
+
+def remove_favourites(user_id, product_ids, using='default'):
+    """ Удаление товаров из избранного пользователя; возвращает id удалённых """
+    product_ids = sorted(set(product_ids))
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if _supports_returning(connection):
+            favourites, _, user_column, product_column = _quoted(connection)
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {favourites} WHERE {user_column} = %s AND {product_column} IN ({placeholders}) "
+                    f"RETURNING {product_column}",
+                    [user_id, *product_ids],
+                )
+                removed = sorted(row[0] for row in cursor.fetchall())
+        else:
+            rows = Favourite.objects.using(using).filter(user_id=user_id, product_id__in=product_ids)
+            removed = sorted(rows.values_list('product_id', flat=True))
+            rows.delete()
+        _apply_counts(removed, -1, using)
+    return removed
+
+
+def clear_favourites(user_id, using='default'):
+    """ Удаление всего избранного пользователя со счётчиками товаров; возвращает id удалённых """
+    product_ids = list(Favourite.objects.using(using).filter(user_id=user_id).values_list('product_id', flat=True))
+    if not product_ids:
+        return []
+    return remove_favourites(user_id, product_ids, using)
+
+
+def rebuild_favourites_counts(queryset=None):
+    """ Пересчёт счётчиков избранного по связующей таблице; возвращает число обновлённых товаров """
+    if queryset is None:
+        queryset = Product.objects.all()
+    through = queryset.model._meta.get_field('favourites').remote_field.through
+    counts = (through.objects.filter(product=OuterRef('pk')).order_by().values('product')
+              .annotate(total=Count('id')).values('total'))
+    return queryset.update(favourites_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0)))
@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from django_filters import rest_framework as filters
 
 from shop_api.models import Product, Review, Order, OrderStatusChoices, Position
+from shop_api.search import search_products
 
 
 class ProductFilter(filters.FilterSet):
@@ -19,6 +20,12 @@ class ProductFilter(filters.FilterSet):
     # фильтр по части текста описания
     description = filters.CharFilter(field_name='description', lookup_expr='icontains')
 
+    # полнотекстовый поиск по названию и описанию с сортировкой по релевантности
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
 
 class ReviewFilter(filters.FilterSet):
 
@@ -0,0 +1,19 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from shop_api.analytics import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = "Заполнение сводных таблиц продаж по дням (SalesDaily, ProductSalesDaily) по существующим заказам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help="пересчитать только дни начиная с даты (ГГГГ-ММ-ДД)")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        products, days = rebuild_sales(options['since'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Строк по товарам: {products}, по дням: {days}"))
@@ -0,0 +1,58 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from shop_api.datagen import CHUNK_SIZE, SCALES, generate
+
+
+class Command(BaseCommand):
+    help = ("Генерация синтетических пользователей, товаров, отзывов, заказов с позициями, избранного и подборок. "
+            "Объёмы задаются масштабом (--scale) или по отдельности; одинаковые --seed и --end-date дают одинаковые "
+            "данные")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='10k',
+                            help="число товаров, отзывов и заказов; пользователей - в 100 раз меньше")
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--products', type=int)
+        parser.add_argument('--reviews', type=int)
+        parser.add_argument('--orders', type=int)
+        parser.add_argument('--favourites-per-user', type=int, default=5)
+        parser.add_argument('--collections', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--end-date', type=date.fromisoformat,
+                            help="дата, до которой распределяются даты создания (по умолчанию сегодня)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--no-copy', action='store_true', help="bulk_create вместо COPY на PostgreSQL")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        scale = SCALES[options['scale']]
+        volumes = {
+            'users': options['users'] if options['users'] is not None else max(10, scale // 100),
+            'products': options['products'] if options['products'] is not None else scale,
+            'reviews': options['reviews'] if options['reviews'] is not None else scale,
+            'orders': options['orders'] if options['orders'] is not None else scale,
+        }
+        if volumes['users'] < 1 or volumes['products'] < 1:
+            raise CommandError("Нужен хотя бы один пользователь и один товар")
+        counts = generate(
+            **volumes,
+            favourites_per_user=options['favourites_per_user'],
+            collections=options['collections'],
+            seed=options['seed'],
+            end_date=options['end_date'],
+            using=options['database'],
+            chunk_size=options['chunk_size'],
+            use_copy=not options['no_copy'],
+            progress=self.progress if options['verbosity'] > 0 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Создано: " + ", ".join(f"{label} - {count}" for label, count in counts.items())
+        ))
+
+    def progress(self, label, done, total, elapsed):
+        rate = done / elapsed if elapsed else 0
+        of_total = f"/{total}" if total else ""
+        self.stdout.write(f"{label}: {done}{of_total} ({elapsed:.1f} с, {rate:,.0f} строк/с)")
@@ -0,0 +1,69 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from shop_api.outbox import process_batch, retry_failed
+
+
+class Command(BaseCommand):
+    help = "Воркер outbox: обработка сообщений пачками в нескольких потоках с повтором при ошибках"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.OUTBOX_CONCURRENCY, help="потоков")
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE, help="сообщений в пачке")
+        parser.add_argument('--poll-interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help="пауза при пустой очереди, секунды")
+        parser.add_argument('--once', action='store_true', help="обработать готовые сообщения и завершиться")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="вернуть в очередь сообщения с исчерпанными попытками")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['retry_failed']:
+            self.stdout.write(f"Возвращено в очередь: {retry_failed(using)}")
+        concurrency = max(1, options['concurrency'])
+        if concurrency > 1 and not connections[using].features.has_select_for_update_skip_locked:
+            # без SKIP LOCKED потоки выбрали бы одни и те же сообщения
+            self.stderr.write(f"{connections[using].vendor} не поддерживает SKIP LOCKED, воркер работает в один поток")
+            concurrency = 1
+
+        stop = threading.Event()
+        if not options['once'] and threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+
+        totals = {'processed': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def work():
+            while not stop.is_set():
+                processed, failed = process_batch(options['batch_size'], using)
+                with lock:
+                    totals['processed'] += processed
+                    totals['failed'] += failed
+                if not processed and not failed:
+                    if options['once']:
+                        break
+                    stop.wait(options['poll_interval'])
+
+        def work_in_thread():
+            try:
+                work()
+            finally:
+                # у каждого потока свои соединения с БД
+                connections.close_all()
+
+        if concurrency == 1:
+            work()
+        else:
+            threads = [threading.Thread(target=work_in_thread, name=f'outbox-{index}') for index in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано сообщений: {totals['processed']}, с ошибкой: {totals['failed']}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from shop_api.models import Product
+from shop_api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчёт средней оценки, количества оценок и гистограммы оценок товаров по отзывам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            updated = rebuild_ratings(Product.objects.using(options['database']))
+        self.stdout.write(self.style.SUCCESS(f"Обновлено товаров: {updated}"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from shop_api.recommendations import BATCH_SIZE, rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = "Пересчёт матрицы совместных покупок и топа рекомендаций \"часто покупают вместе\" по всем заказам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="заказов в пакете")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        pairs, recommendations = rebuild_recommendations(options['database'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Пар товаров: {pairs}, рекомендаций: {recommendations}"))
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.5 on 2026-10-18 12:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from shop_api.ratings import rebuild_ratings
+
+
+def delete_duplicate_reviews(apps, schema_editor):
+    """ Перед ограничением уникальности: остаётся первый отзыв пользователя на товар """
+    Review = apps.get_model('shop_api', 'Review')
+    Product = apps.get_model('shop_api', 'Product')
+    reviews = Review.objects.using(schema_editor.connection.alias)
+    duplicates = (reviews.values('creator', 'product').order_by()
+                  .annotate(first_id=Min('id'), total=Count('id')).filter(total__gt=1))
+    product_ids = set()
+    for duplicate in duplicates:
+        reviews.filter(creator=duplicate['creator'], product=duplicate['product']) \
+            .exclude(id=duplicate['first_id']).delete()
+        product_ids.add(duplicate['product'])
+    if product_ids:
+        rebuild_ratings(Product.objects.using(schema_editor.connection.alias).filter(id__in=product_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_api', '0004_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('creator', 'product'), name='review_creator_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.5 on 2026-10-18 12:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_position_prices(apps, schema_editor):
+    """ Для существующих позиций цена на момент заказа неизвестна - берётся текущая цена товара """
+    Position = apps.get_model('shop_api', 'Position')
+    Product = apps.get_model('shop_api', 'Product')
+    Position.objects.using(schema_editor.connection.alias).filter(price__isnull=True).update(
+        price=Subquery(Product.objects.filter(id=OuterRef('product_id')).values('price')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_api', '0005_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='День')),
+                ('revenue', models.FloatField(default=0.0, verbose_name='Выручка')),
+                ('units', models.IntegerField(default=0, verbose_name='Продано штук')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+            },
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='price',
+            field=models.FloatField(editable=False, null=True, verbose_name='Цена'),
+        ),
+        migrations.RunPython(fill_position_prices, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ProductSalesDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('revenue', models.FloatField(default=0.0, verbose_name='Выручка')),
+                ('units', models.IntegerField(default=0, verbose_name='Продано штук')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='shop_api.product')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи товаров по дням',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsalesdaily',
+            index=models.Index(fields=['day', 'product'], name='product_sales_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsalesdaily',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='product_sales_daily_uniq'),
+        ),
+    ]
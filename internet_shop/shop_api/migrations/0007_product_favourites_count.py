@@ -0,0 +1,30 @@
+# Generated by Django 3.1.5 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+from shop_api.favourites import rebuild_favourites_counts
+
+
+def fill_favourites_counts(apps, schema_editor):
+    Product = apps.get_model('shop_api', 'Product')
+    rebuild_favourites_counts(Product.objects.using(schema_editor.connection.alias))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_api', '0006_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='favourites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_favourites_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['favourites_count', 'id'], name='product_favourites_idx'),
+        ),
+    ]
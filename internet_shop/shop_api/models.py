@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -11,6 +12,15 @@ class OrderStatusChoices(models.TextChoices):
     CANCELLED = "CANCELLED", "Отменён"
 
 
+# допустимые переходы статусов заказа при массовой смене (shop_api.order_status)
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatusChoices.NEW: (OrderStatusChoices.IN_PROGRESS, OrderStatusChoices.DONE, OrderStatusChoices.CANCELLED),
+    OrderStatusChoices.IN_PROGRESS: (OrderStatusChoices.DONE, OrderStatusChoices.CANCELLED),
+    OrderStatusChoices.DONE: (),
+    OrderStatusChoices.CANCELLED: (),
+}
+
+
 class Product(models.Model):
     """ Модель товаров """
 
@@ -18,6 +28,17 @@ class Product(models.Model):
     description = models.TextField("Описание", default='')
     price = models.FloatField("Цена", default=0.00)
     favourites = models.ManyToManyField(User, related_name='products')
+    # число пользователей, добавивших товар в избранное (shop_api.favourites)
+    favourites_count = models.PositiveIntegerField("В избранном", default=0, editable=False)
+    # агрегаты отзывов, обновляются вместе с отзывами (shop_api.ratings)
+    rating_avg = models.FloatField("Средняя оценка", default=0.0, editable=False)
+    rating_count = models.PositiveIntegerField("Количество оценок", default=0, editable=False)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField("Оценок 1", default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField("Оценок 2", default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField("Оценок 3", default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField("Оценок 4", default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField("Оценок 5", default=0, editable=False)
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
@@ -27,9 +48,21 @@ class Product(models.Model):
     def get_review(self):
         return self.review.all()
 
+    def get_rating_histogram(self):
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [
+            models.Index(fields=['rating_avg', 'id'], name='product_rating_avg_idx'),
+            # фильтры price__gt/price__lt
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            # сортировка ordering=-favourites_count ("чаще всего в избранном")
+            models.Index(fields=['favourites_count', 'id'], name='product_favourites_idx'),
+            # keyset-пагинация по умолчанию и иерархия дат в админке
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+        ]
 
 
 class Order(models.Model):
@@ -58,6 +91,12 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ["created_at"]
+        indexes = [
+            # список заказов пользователя с keyset-пагинацией по (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+            # список всех заказов для персонала
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
 
 
 class Position(models.Model):
@@ -66,6 +105,8 @@ class Position(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='position')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='position')
     quantity = models.PositiveIntegerField()
+    # цена товара на момент заказа (для выручки в аналитике)
+    price = models.FloatField("Цена", null=True, editable=False)
 
     def __str__(self):
         return "This entry contains {} {}(s).".format(self.quantity, self.product.name)
@@ -98,6 +139,16 @@ class Review(models.Model):
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        constraints = [
+            # один отзыв пользователя на товар; проверка при вставке закрывает гонку параллельных запросов
+            models.UniqueConstraint(fields=['creator', 'product'], name='review_creator_product_uniq'),
+        ]
+        indexes = [
+            # отзывы товара с keyset-пагинацией по (created_at, id)
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+            # все отзывы по (created_at, id): keyset-пагинация без фильтра и иерархия дат в админке
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ]
 
 
 class ProductCollections(models.Model):
@@ -115,3 +166,91 @@ class ProductCollections(models.Model):
     class Meta:
         verbose_name = "Подборка"
         verbose_name_plural = "Подборки"
+
+
+class SalesDaily(models.Model):
+    """ Продажи за день: выручка, штуки и число заказов (без отменённых) """
+
+    day = models.DateField("День", unique=True)
+    revenue = models.FloatField("Выручка", default=0.0)
+    units = models.IntegerField("Продано штук", default=0)
+    orders = models.IntegerField("Заказов", default=0)
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+
+
+class ProductSalesDaily(models.Model):
+    """ Продажи товара за день: выручка, штуки и число заказов с товаром (без отменённых) """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales')
+    day = models.DateField("День")
+    revenue = models.FloatField("Выручка", default=0.0)
+    units = models.IntegerField("Продано штук", default=0)
+    orders = models.IntegerField("Заказов", default=0)
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='product_sales_daily_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'product'], name='product_sales_day_idx'),
+        ]
+
+
+class ProductCooccurrence(models.Model):
+    """ Число заказов, в которых товар куплен вместе с другим (разреженная матрица, обе пары хранятся) """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cooccurrences')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.IntegerField("Заказов вместе", default=0)
+
+    class Meta:
+        verbose_name = "Совместная покупка"
+        verbose_name_plural = "Совместные покупки"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='product_cooccurrence_uniq'),
+        ]
+
+
+class ProductRecommendation(models.Model):
+    """ Топ товаров, чаще всего покупаемых вместе с товаром (из ProductCooccurrence) """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.IntegerField("Заказов вместе")
+    rank = models.PositiveSmallIntegerField("Место")
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='product_recommendation_rank_uniq'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """ Отложенная работа после изменения данных (shop_api.outbox): пишется в транзакции изменения """
+
+    topic = models.CharField("Тип", max_length=64)
+    object_id = models.PositiveIntegerField("id объекта", null=True, blank=True)
+    payload = models.JSONField("Данные", default=dict, blank=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    available_at = models.DateTimeField("Обработать не раньше", default=timezone.now)
+    attempts = models.PositiveIntegerField("Попыток", default=0)
+    last_error = models.TextField("Последняя ошибка", blank=True, default="")
+    failed_at = models.DateTimeField("Попытки исчерпаны", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Сообщение outbox"
+        verbose_name_plural = "Outbox"
+        indexes = [
+            # выборка очередной пачки воркером
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx',
+                         condition=models.Q(failed_at__isnull=True)),
+            # сообщения заказа, обрабатываемые до его изменения в запросе
+            models.Index(fields=['topic', 'object_id'], name='outbox_object_idx'),
+        ]
@@ -0,0 +1,51 @@
+"""
+Массовая смена статуса заказов.
+
+Заказы выбираются по списку id или фильтрам OrderFilter; статус меняется одним
+UPDATE ... WHERE status IN (...) только у заказов, из статуса которых переход
+допустим (ORDER_STATUS_TRANSITIONS). Перед обновлением текущие статусы
+читаются одним запросом с блокировкой строк (SELECT ... FOR UPDATE), по ним
+составляется отчёт по каждому id и обновляются сводные таблицы продаж. И
+сводные таблицы, и UPDATE затрагивают только заблокированные id, а не
+повторный подзапрос по фильтрам: заказ, подходящий под фильтры и
+зафиксированный параллельно после блокировки, не меняется мимо отчёта.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from shop_api.analytics import CHUNK_SIZE, apply_orders, is_counted
+from shop_api.models import ORDER_STATUS_TRANSITIONS, Order
+
+
+def allowed_sources(status):
+    """ Статусы, из которых допустим переход в status """
+    return [source for source, targets in ORDER_STATUS_TRANSITIONS.items() if status in targets]
+
+
+def transition_orders(queryset, status, ids=None):
+    """
+    Перевод заказов queryset (и из ids, если задан) в статус status. Возвращает
+    словарь исходов: updated, unchanged (уже в этом статусе), not_allowed
+    (id и текущий статус, из которого переход недопустим), not_found.
+    """
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    sources = allowed_sources(status)
+    with transaction.atomic(using=queryset.db):
+        current = dict(queryset.select_for_update(of=('self',)).order_by('id').values_list('id', 'status'))
+        updated = [order_id for order_id, source in current.items() if source in sources]
+        recounted = [order_id for order_id in updated if is_counted(current[order_id]) != is_counted(status)]
+        if recounted:
+            apply_orders(recounted, 1 if is_counted(status) else -1, using=queryset.db)
+        now = timezone.now()
+        for start in range(0, len(updated), CHUNK_SIZE):
+            Order.objects.using(queryset.db).filter(id__in=updated[start:start + CHUNK_SIZE]) \
+                .update(status=status, updated_at=now)
+    return {
+        'status': status,
+        'updated': updated,
+        'unchanged': [order_id for order_id, source in current.items() if source == status],
+        'not_allowed': [{'id': order_id, 'status': source} for order_id, source in current.items()
+                        if source != status and source not in sources],
+        'not_found': sorted(set(ids) - current.keys()) if ids is not None else [],
+    }
@@ -0,0 +1,130 @@
+"""
+Transactional outbox: работа после оформления заказа вне запроса.
+
+Запрос добавляет в транзакции изменения данных строку OutboxMessage (один
+INSERT), воркер (manage.py process_outbox) выбирает готовые сообщения
+пачками по OUTBOX_BATCH_SIZE и обрабатывает их обработчиком типа из HANDLERS
+одним вызовом на тип. Пачка выбирается SELECT ... FOR UPDATE SKIP LOCKED,
+поэтому потоки и процессы воркера не получают одни и те же сообщения, а
+изменения обработчика и удаление сообщений фиксируются одной транзакцией:
+работа с БД выполняется ровно один раз, внешние действия (уведомления) -
+не менее одного раза.
+
+Если обработчик пачки падает, её сообщения обрабатываются по одному, чтобы
+отделить сбойные. Сбойное сообщение откладывается с экспоненциальной
+задержкой (OUTBOX_RETRY_DELAY * 2^(попытка-1), не больше
+OUTBOX_RETRY_MAX_DELAY), а после OUTBOX_MAX_ATTEMPTS попыток помечается
+failed_at и больше не выбирается (повтор - process_outbox --retry-failed).
+
+Сводные таблицы продаж и матрица совместных покупок - суммы, поэтому отмена
+заказа в запросе может вычесть его позиции и раньше, чем воркер их прибавит.
+Позиции удалённого заказа воркер уже не прочитает: при удалении заказа его
+необработанное сообщение удаляется (discard_pending) вместо вычитания.
+"""
+import logging
+import random
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from shop_api.analytics import apply_orders
+from shop_api.models import OutboxMessage
+from shop_api.recommendations import record_orders
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'order.created'
+
+
+def _order_created(messages, using):
+    """ Позиции новых заказов - в сводные таблицы продаж и матрицу совместных покупок """
+    order_ids = [message.object_id for message in messages]
+    apply_orders(order_ids, using=using)
+    record_orders(order_ids, using=using)
+
+
+# тип сообщения -> обработчик(сообщения, using)
+HANDLERS = {
+    ORDER_CREATED: _order_created,
+}
+
+
+def enqueue(topic, object_id=None, payload=None, using='default'):
+    """ Сообщение для воркера; вызывается в транзакции изменения данных """
+    return OutboxMessage.objects.using(using).create(topic=topic, object_id=object_id, payload=payload or {})
+
+
+def retry_delay(attempts):
+    """ Задержка перед повтором после attempts неудачных попыток (со случайным разбросом) """
+    delay = min(settings.OUTBOX_RETRY_MAX_DELAY, settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def _handle(topic, messages, using):
+    # точка сохранения: ошибка обработчика не прерывает транзакцию пачки
+    with transaction.atomic(using=using):
+        HANDLERS[topic](messages, using)
+
+
+def _fail(message, error, using):
+    attempts = message.attempts + 1
+    now = timezone.now()
+    logger.warning("outbox %s #%s: попытка %d: %r", message.topic, message.pk, attempts, error)
+    OutboxMessage.objects.using(using).filter(pk=message.pk).update(
+        attempts=attempts,
+        last_error=repr(error),
+        available_at=now + retry_delay(attempts),
+        failed_at=now if attempts >= settings.OUTBOX_MAX_ATTEMPTS else None,
+    )
+
+
+def _process_group(topic, messages, using):
+    """ Обработка сообщений одного типа; возвращает обработанные """
+    try:
+        _handle(topic, messages, using)
+        return messages
+    except Exception as error:
+        if len(messages) == 1:
+            _fail(messages[0], error, using)
+            return []
+    done = []
+    for message in messages:
+        done.extend(_process_group(topic, [message], using))
+    return done
+
+
+def process_batch(batch_size=None, using='default'):
+    """ Обработка одной пачки готовых сообщений; возвращает (обработано, с ошибкой) """
+    queryset = (OutboxMessage.objects.using(using)
+                .filter(failed_at__isnull=True, available_at__lte=timezone.now())
+                .order_by('available_at', 'id'))
+    if connections[using].features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    with transaction.atomic(using=using):
+        messages = list(queryset[:batch_size or settings.OUTBOX_BATCH_SIZE])
+        done = []
+        for topic, group in groupby(sorted(messages, key=attrgetter('topic', 'id')), key=attrgetter('topic')):
+            done.extend(_process_group(topic, list(group), using))
+        if done:
+            OutboxMessage.objects.using(using).filter(pk__in=[message.pk for message in done]).delete()
+    return len(done), len(messages) - len(done)
+
+
+def discard_pending(topic, object_ids, using='default'):
+    """
+    Удаление ещё не обработанных сообщений объектов object_ids; возвращает их
+    число. Сообщения, которые сейчас обрабатывает воркер, удаление ждёт до его
+    COMMIT и уже не находит.
+    """
+    deleted, _ = OutboxMessage.objects.using(using).filter(topic=topic, object_id__in=object_ids).delete()
+    return deleted
+
+
+def retry_failed(using='default'):
+    """ Возврат в очередь сообщений с исчерпанными попытками; возвращает их число """
+    return OutboxMessage.objects.using(using).filter(failed_at__isnull=False).update(
+        failed_at=None, attempts=0, available_at=timezone.now())
@@ -0,0 +1,176 @@
+import datetime
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, _reverse_ordering
+from rest_framework.response import Response
+
+from shop_api.counts import count_rows
+
+
+def _encode_value(value):
+    """ Приведение значений ключа к виду, пригодному для JSON """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Значение {value!r} не может быть частью курсора")
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по составному ключу.
+
+    В отличие от CursorPagination из DRF позиция курсора хранит значения всех
+    полей сортировки, а не только первого, поэтому страница выбирается условием
+    WHERE (created_at, id) > (...) без OFFSET и стоит одинаково для любой
+    страницы. По умолчанию ключ - (created_at, id); если фильтры уже задали
+    queryset явную сортировку (например, по релевантности), используется она,
+    дополненная id для уникальности.
+
+    Общее число записей не считается; с параметром ?with_count=true ответ
+    содержит count и count_exact - на больших выборках это оценка
+    (shop_api.counts.count_rows), а не COUNT(*).
+    """
+
+    ordering = ('created_at', 'id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'with_count'
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Queryset записей страницы (на одну больше - чтобы понять, есть ли
+        следующая) без выборки; None, если пагинация отключена. По нему же
+        ConditionalGetMixin проверяет актуальность страницы до сериализации.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._get_keyset_filter(ordering, self._decode_position(position)))
+        return queryset[:self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+
+        self.count = self.count_exact = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count, self.count_exact = count_rows(queryset)
+
+        results = list(page_queryset)
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = self.cursor is not None and self.cursor.position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_paginated_data(self, data):
+        page = OrderedDict()
+        if self.count is not None:
+            page['count'] = self.count
+            page['count_exact'] = self.count_exact
+        page['next'] = self.get_next_link()
+        page['previous'] = self.get_previous_link()
+        page['results'] = data
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_ordering(self, request, queryset, view):
+        """ Явная сортировка queryset (из фильтров) либо ключ по умолчанию + id """
+        ordering = tuple(queryset.query.order_by) or tuple(self.ordering)
+        for field in ordering:
+            assert isinstance(field, str) and '__' not in field, (
+                'Keyset-пагинация поддерживает сортировку только по полям модели и аннотациям'
+            )
+        if not {'id', 'pk'} & {field.lstrip('-') for field in ordering}:
+            ordering += ('-id',) if ordering[-1].startswith('-') else ('id',)
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            field_name = field.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(instance[field_name])
+            else:
+                values.append(getattr(instance, field_name))
+        return json.dumps(values, default=_encode_value)
+
+    def _decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def _get_keyset_filter(ordering, values):
+        """
+        Лексикографическое сравнение (a, b, c) > (x, y, z) в виде
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z).
+        """
+        keyset_filter = Q()
+        for index, field in enumerate(ordering):
+            field_name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            clause = Q(**{field_name + lookup: values[index]})
+            for prev_field, prev_value in zip(ordering[:index], values[:index]):
+                clause &= Q(**{prev_field.lstrip('-'): prev_value})
+            keyset_filter |= clause
+        return keyset_filter
+
+
+class OrderHistoryPagination(KeysetPagination):
+    """ История заказов в информации о пользователе: сначала новые """
+
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    max_page_size = 50
@@ -0,0 +1,70 @@
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from shop_api.models import Product
+
+RATINGS = range(1, 6)
+
+
+def _histogram_field(rating):
+    return f'rating_{rating}_count'
+
+
+def _average(rating_sum, rating_count):
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)), Value(0.0))
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    """
+    Инкрементальное обновление агрегатов товара одним UPDATE:
+    added - оценка нового отзыва, removed - оценка удалённого (или старая при изменении).
+    Вызывается в той же транзакции, что и запись отзыва; updated_at товара
+    обновляется всегда, в том числе при правке только текста отзыва (added ==
+    removed), так как отзывы входят в его представление и ETag; время берётся
+    из приложения (как у auto_now), а не CURRENT_TIMESTAMP с точностью до
+    секунды в SQLite.
+    """
+    if added == removed:
+        Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+        return
+    changes = {}
+    rating_sum = F('rating_sum')
+    rating_count = F('rating_count')
+    if added is not None:
+        changes[_histogram_field(added)] = F(_histogram_field(added)) + 1
+        rating_sum += added
+        rating_count += 1
+    if removed is not None:
+        changes[_histogram_field(removed)] = F(_histogram_field(removed)) - 1
+        rating_sum -= removed
+        rating_count -= 1
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=_average(rating_sum, rating_count),
+        updated_at=timezone.now(),
+        **changes
+    )
+
+
+def rebuild_ratings(queryset=None):
+    """ Пересчёт агрегатов с нуля по таблице отзывов; возвращает число обновлённых товаров """
+    if queryset is None:
+        queryset = Product.objects.all()
+    review_model = queryset.model._meta.get_field('review').related_model
+    reviews = review_model.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+    def aggregate(expression, **filters):
+        subquery = reviews.filter(**filters).annotate(value=expression).values('value')
+        return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+    rating_sum = aggregate(Sum('rating'))
+    rating_count = aggregate(Count('id'))
+    histogram = {_histogram_field(rating): aggregate(Count('id'), rating=rating) for rating in RATINGS}
+    return queryset.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=_average(rating_sum, rating_count),
+        **histogram
+    )
@@ -0,0 +1,107 @@
+"""
+Рекомендации "часто покупают вместе" по совместным покупкам в заказах.
+
+ProductCooccurrence - разреженная матрица совместной встречаемости товаров
+(строка на ненулевую пару, хранятся обе пары): число заказов, в которых оба
+товара есть среди позиций. Матрица считается не циклом по позициям, а
+соединением позиций заказа между собой с GROUP BY по паре товаров - по
+пакетам заказов (диапазонам id) при полном пересчёте и по новым заказам при
+их создании (инкрементально, INSERT ... ON CONFLICT DO UPDATE).
+ProductRecommendation - топ RECOMMENDATIONS_TOP_K пар каждого товара,
+пересчитывается оконной функцией только для товаров изменённых заказов;
+эндпоинт рекомендаций читает только его.
+"""
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min, Value, Window
+from django.db.models.functions import RowNumber
+
+from shop_api.models import Order, Position, Product, ProductCooccurrence, ProductRecommendation
+from shop_api.upsert import add_rows
+
+# заказов в пакете полного пересчёта матрицы
+BATCH_SIZE = 5000
+
+
+def _pairs(positions, sign=1):
+    """ Пары (товар, другой товар того же заказа) с числом заказов """
+    return (positions
+            .annotate(other=F('order__position__product'))
+            .exclude(other=F('product'))
+            .values('product', 'other')
+            .annotate(orders=Count('order', distinct=True) * Value(sign))
+            .order_by())
+
+
+def _add_pairs(positions, sign, using):
+    add_rows(ProductCooccurrence, _pairs(positions, sign), ('product', 'other'), ('orders',), using)
+
+
+def refresh_top(product_ids=None, using='default'):
+    """
+    Пересчёт топа рекомендаций товаров product_ids (список или подзапрос;
+    None - всех). Строки товаров блокируются (по порядку id) до удаления
+    старого топа, поэтому параллельные пересчёты одного товара выполняются
+    по очереди и не нарушают уникальность (product, rank).
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(ProductRecommendation._meta.get_field(name).column)
+                        for name in ('product', 'recommended', 'orders', 'rank'))
+    # внутри транзакции вызывающего (удаление заказа, полный пересчёт) точка сохранения не нужна:
+    # ошибка всё равно откатывает его транзакцию целиком
+    with transaction.atomic(using=using, savepoint=False):
+        locked = Product.objects.using(using).select_for_update().order_by('id').values_list('id', flat=True)
+        if product_ids is not None:
+            product_ids = list(locked.filter(id__in=product_ids))
+            if not product_ids:
+                return
+        else:
+            list(locked)
+        pairs = ProductCooccurrence.objects.using(using).filter(orders__gt=0)
+        recommendations = ProductRecommendation.objects.using(using)
+        if product_ids is not None:
+            pairs = pairs.filter(product__in=product_ids)
+            recommendations = recommendations.filter(product__in=product_ids)
+        ranked = pairs.annotate(rank=Window(
+            RowNumber(), partition_by=[F('product')], order_by=[F('orders').desc(), F('other').asc()],
+        )).values('product', 'other', 'orders', 'rank').order_by()
+        sql, params = ranked.query.sql_with_params()
+
+        recommendations.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(ProductRecommendation._meta.db_table)} ({columns}) "
+                f"SELECT * FROM ({sql}) ranked WHERE ranked.{quote('rank')} <= %s",
+                (*params, settings.RECOMMENDATIONS_TOP_K),
+            )
+
+
+def record_orders(order_ids, sign=1, using='default'):
+    """
+    Добавление (sign=1) или вычитание (sign=-1) пар товаров заказов в матрице
+    и пересчёт топа их товаров; для новых заказов вызывается воркером outbox,
+    при удалении - в транзакции удаления.
+    """
+    positions = Position.objects.using(using).filter(order_id__in=order_ids)
+    _add_pairs(positions, sign, using)
+    refresh_top(positions.values('product'), using)
+
+
+def add_order_range(first_id, last_id, using='default', batch_size=BATCH_SIZE):
+    """ Добавление в матрицу заказов с id от first_id до last_id пакетами по batch_size заказов """
+    for start in range(first_id, last_id + 1, batch_size):
+        positions = Position.objects.using(using).filter(order_id__gte=start, order_id__lt=start + batch_size)
+        _add_pairs(positions, 1, using)
+
+
+def rebuild_recommendations(using='default', batch_size=BATCH_SIZE):
+    """ Полный пересчёт матрицы и топа; возвращает число пар и рекомендаций """
+    with transaction.atomic(using=using):
+        ProductCooccurrence.objects.using(using).all().delete()
+        bounds = Order.objects.using(using).aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is not None:
+            add_order_range(bounds['first'], bounds['last'], using, batch_size)
+        refresh_top(using=using)
+    return (ProductCooccurrence.objects.using(using).count(),
+            ProductRecommendation.objects.using(using).count())
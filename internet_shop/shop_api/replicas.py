@@ -0,0 +1,162 @@
+"""
+Чтение каталога с реплик БД с гарантией "read-your-writes".
+
+Запросы чтения (GET, HEAD, OPTIONS) к ViewSet с ReplicaReadMixin (товары,
+отзывы, подборки) выполняются на случайной реплике из DATABASE_REPLICAS, все
+записи - на default. После успешного изменяющего запроса (PrimaryPinMiddleware)
+пользователь на REPLICA_PIN_SECONDS закрепляется за default, чтобы видеть
+свои изменения, пока реплики их догоняют. Закрепление хранится в кэше Django,
+поэтому с репликами он должен быть общим для процессов (Redis, Memcached, БД):
+иначе следующий запрос, попавший в другой воркер, закрепления не увидит.
+Проверка shop_api.E001 сообщает о таком кэше при запуске manage.py, а сами
+запросы при нём читаются из default.
+
+Ответы, прочитанные с реплики в течение REPLICA_PIN_SECONDS после любой
+записи, не сохраняются в кэш ответов: реплика могла ещё не получить данные,
+по которым уже увеличена версия области кэша. Без DATABASE_REPLICAS всё
+читается из default, а кэш не запрашивается.
+"""
+import asyncio
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import DEFAULT_DB_ALIAS
+
+from shop_api.cache_backends import is_shared
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_PIN_PREFIX = 'shop_api:replica:pin:'
+_LAST_WRITE_KEY = 'shop_api:replica:last_write'
+
+# (база чтения, можно ли кэшировать ответ) текущего запроса; None - чтение из default
+_read_state = ContextVar('shop_api_read_state', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    """ Закрепление за default и отметка записи видны другим воркерам только через общий кэш """
+    if get_replicas() and not is_shared(caches[DEFAULT_CACHE_ALIAS]):
+        return [checks.Error(
+            "DATABASE_REPLICAS задан, а кэш 'default' хранится в памяти процесса",
+            hint="Укажите в CACHES общий кэш (Redis, Memcached, БД); до этого всё читается из default.",
+            id='shop_api.E001',
+        )]
+    return []
+
+
+def pin_to_primary(user_id=None):
+    """ Чтение пользователя из default на REPLICA_PIN_SECONDS; запись отмечается для кэша ответов """
+    timeout = settings.REPLICA_PIN_SECONDS
+    values = {_LAST_WRITE_KEY: 1}
+    if user_id is not None:
+        values[_PIN_PREFIX + str(user_id)] = 1
+    cache.set_many(values, timeout)
+
+
+def choose_read_database(user):
+    """ (alias, можно ли кэшировать ответ) для запроса чтения пользователя """
+    replicas = get_replicas()
+    if not replicas or not is_shared(caches[DEFAULT_CACHE_ALIAS]):
+        return DEFAULT_DB_ALIAS, True
+    pin_key = _PIN_PREFIX + str(user.pk) if user.is_authenticated else None
+    recent = cache.get_many([_LAST_WRITE_KEY, pin_key] if pin_key else [_LAST_WRITE_KEY])
+    if pin_key in recent:
+        return DEFAULT_DB_ALIAS, True
+    return random.choice(replicas), _LAST_WRITE_KEY not in recent
+
+
+def get_read_database():
+    state = _read_state.get()
+    return state[0] if state else None
+
+
+def is_read_cacheable():
+    state = _read_state.get()
+    return state is None or state[1]
+
+
+class ReplicaRouter:
+    """ Чтение - из базы, выбранной для текущего запроса (или default), запись - всегда в default """
+
+    def db_for_read(self, model, **hints):
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        # объект, прочитанный с реплики, сохраняется в default
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Mixin для ViewSet: запросы чтения после аутентификации выполняются на
+    реплике, если пользователь не закреплён за default недавней записью.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_state.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_state.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and get_replicas():
+            _read_state.set(choose_read_database(request.user))
+
+
+class PrimaryPinMiddleware:
+    """
+    Закрепление за default пользователя, чей изменяющий запрос завершился
+    успешно. Работает и под WSGI, и под ASGI: асинхронная цепочка middleware
+    не переводится на общий поток синхронного кода.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Django определяет асинхронный middleware так же, как и MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.should_pin(request, response):
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_pin(request, response):
+            # пользователь сессии загружается из БД, кэш может быть сетевым
+            await sync_to_async(self.pin)(request)
+        return response
+
+    @staticmethod
+    def should_pin(request, response):
+        return request.method not in SAFE_METHODS and response.status_code < 400 and bool(get_replicas())
+
+    @staticmethod
+    def pin(request):
+        # DRF передаёт пользователя, аутентифицированного по токену, в request.user
+        user = getattr(request, 'user', None)
+        pin_to_primary(user.pk if user is not None and user.is_authenticated else None)
@@ -0,0 +1,143 @@
+"""
+Полнотекстовый поиск по товарам.
+
+Индекс хранится в отдельной таблице shop_api_product_search: на PostgreSQL это
+tsvector с GIN-индексом, на SQLite - виртуальная таблица FTS5 (rowid = id товара).
+Таблица создаётся миграцией 0003 и обновляется сигналами Product; после массовой
+загрузки (bulk_create, update) индекс перестраивается командой rebuild_search_index.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'shop_api_product_search'
+
+# словарь PostgreSQL для стемминга: описания товаров на русском
+SEARCH_CONFIG = 'russian'
+
+# вес совпадения в названии относительно описания
+NAME_WEIGHT = 10.0
+
+
+def is_supported(connection):
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def create_index(connection):
+    """ Создание таблицы индекса (вызывается из миграции) """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE {SEARCH_TABLE} ("
+                f"product_id integer PRIMARY KEY REFERENCES shop_api_product (id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(f"CREATE INDEX {SEARCH_TABLE}_document_gin ON {SEARCH_TABLE} USING GIN (document)")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(name, description, tokenize='unicode61')"
+            )
+
+
+def drop_index(connection):
+    if is_supported(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def index_product(product, using='default'):
+    """ Добавление или обновление товара в индексе """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+                f"VALUES (%s, setweight(to_tsvector(%s, %s), 'A') || setweight(to_tsvector(%s, %s), 'B')) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [product.pk, SEARCH_CONFIG, product.name, SEARCH_CONFIG, product.description],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+                [product.pk, product.name, product.description],
+            )
+
+
+def unindex_product(product_id, using='default'):
+    """ Удаление товара из индекса """
+    connection = connections[using]
+    if is_supported(connection):
+        with connection.cursor() as cursor:
+            key = 'product_id' if connection.vendor == 'postgresql' else 'rowid'
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = %s", [product_id])
+
+
+def rebuild_index(using='default'):
+    """ Полное перестроение индекса одним INSERT ... SELECT """
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+                f"SELECT id, setweight(to_tsvector(%s, name), 'A') || setweight(to_tsvector(%s, description), 'B') "
+                f"FROM shop_api_product",
+                [SEARCH_CONFIG, SEARCH_CONFIG],
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM shop_api_product"
+            )
+
+
+def _fts5_query(text):
+    """ Каждое слово запроса - отдельный префиксный терм FTS5 в кавычках """
+    words = re.findall(r'\w+', text)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def search_products(queryset, text):
+    """
+    Отбор товаров по поисковому запросу с аннотацией search_rank
+    (чем больше, тем релевантнее) и сортировкой по ней.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        matches = RawSQL(
+            f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ plainto_tsquery(%s, %s)",
+            [SEARCH_CONFIG, text],
+        )
+        # ts_rank возвращает real: значение, прочитанное в Python и переданное в курсор,
+        # не равно исходному при сравнении в float8, и на границе страниц строки с тем же
+        # рангом терялись бы или повторялись; приведение в самом выражении действует и
+        # в SELECT, и в условии курсора KeysetPagination (оно строится по этой аннотации)
+        rank = RawSQL(
+            f"SELECT ts_rank(document, plainto_tsquery(%s, %s))::float8 FROM {SEARCH_TABLE} "
+            f"WHERE product_id = shop_api_product.id",
+            [SEARCH_CONFIG, text],
+            output_field=FloatField(),
+        )
+    elif connection.vendor == 'sqlite':
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        matches = RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        # bm25() тем меньше, чем лучше совпадение, поэтому берём его со знаком минус
+        rank = RawSQL(
+            f"SELECT -bm25({SEARCH_TABLE}, {NAME_WEIGHT}, 1.0) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = shop_api_product.id",
+            [match],
+            output_field=FloatField(),
+        )
+    else:
+        return (queryset.filter(Q(name__icontains=text) | Q(description__icontains=text))
+                .annotate(search_rank=Value(0.0, output_field=FloatField()))
+                .order_by('-search_rank'))
+    return queryset.filter(id__in=matches).annotate(search_rank=rank).order_by('-search_rank')
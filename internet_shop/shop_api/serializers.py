@@ -1,10 +1,18 @@
 from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from shop_api.models import Product, Review, Order, Position, ProductCollections
+from shop_api.analytics import apply_status_change
+from shop_api.models import Product, Review, Order, OrderStatusChoices, Position, ProductCollections, \
+    ProductRecommendation
+from shop_api.outbox import ORDER_CREATED, enqueue
+from shop_api.pagination import OrderHistoryPagination
+from shop_api.ratings import apply_rating_change
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -12,7 +20,14 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'price', 'description')
+        fields = ('id', 'name', 'price', 'description', 'rating_avg', 'rating_count', 'favourites_count')
+
+    def update(self, instance, validated_data):
+        """Сохраняются только изменённые поля, чтобы не затереть агрегаты оценок"""
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -27,22 +42,25 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ('id', 'creator', 'review_text', 'rating', 'product')
 
+    @transaction.atomic
     def create(self, validated_data):
-        """Метод для создания"""
+        """Метод для создания; повторный отзыв на товар отклоняет ограничение review_creator_product_uniq"""
         validated_data["creator"] = self.context["request"].user
-        review_user = self.context["request"].user
-        product_id = validated_data['product'].id
-        reviews_count = Review.objects.filter(creator=review_user).filter(product=product_id).count()
-        if reviews_count >= 1:
+        try:
+            with transaction.atomic():
+                review = super().create(validated_data)
+        except IntegrityError:
             raise ValidationError({"Review": "Количество отзывов > 1"})
-        else:
-            return super().create(validated_data)
+        apply_rating_change(review.product_id, added=review.rating)
+        return review
 
     def update(self, instance, validated_data):
+        old_rating = instance.rating
         instance.review_text = validated_data.get('review_text', instance.review_text)
         instance.rating = validated_data.get('rating', instance.rating)
         instance.updated_at = datetime.now()
         instance.save()
+        apply_rating_change(instance.product_id, added=instance.rating, removed=old_rating)
         return instance
 
     def validate(self, data):
@@ -53,19 +71,39 @@ class ReviewSerializer(serializers.ModelSerializer):
         return data
 
 
+def reviews_prefetch():
+    """ Отзывы товара вместе с авторами одним запросом """
+    return Prefetch('review', queryset=Review.objects.select_related('creator'))
+
+
+class ProductRecommendationSerializer(serializers.ModelSerializer):
+    """ Рекомендованный товар и число заказов, в которых его купили вместе с товаром """
+
+    product = ProductSerializer(source='recommended')
+
+    class Meta:
+        model = ProductRecommendation
+        fields = ('product', 'orders')
+
+
 class ProductDetailSerializer(serializers.ModelSerializer):
     """Serializer для каждого продукта"""
 
     review = ReviewSerializer(many=True)
+    rating_histogram = serializers.DictField(source='get_rating_histogram', read_only=True)
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'description', 'price', 'review', 'created_at', 'updated_at')
+        fields = ('id', 'name', 'description', 'price', 'rating_avg', 'rating_count', 'rating_histogram',
+                  'favourites_count', 'review', 'created_at', 'updated_at')
 
 
 class PositionSerializer(serializers.ModelSerializer):
     """ Сериализатор списка позиций """
 
+    # товары всех позиций заказа загружаются одним запросом в OrderSerializer.validate
+    product = serializers.IntegerField(source='product_id')
+
     class Meta:
         model = Position
         fields = ("product", "quantity")
@@ -86,23 +124,30 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ('__all__')
         read_only_fields = ('status',)
 
+    def validate(self, data):
+        """ Загрузка товаров всех позиций одним запросом """
+        items = data['position']['all']
+        products = Product.objects.in_bulk({item['product_id'] for item in items})
+        missing = sorted({item['product_id'] for item in items} - products.keys())
+        if missing:
+            raise ValidationError({"products": f"Товары не найдены: {missing}"})
+        for item in items:
+            item['product'] = products[item.pop('product_id')]
+        return data
+
+    @transaction.atomic
     def create(self, validated_data):
         validated_data['user'] = self.context["request"].user
-        positions = validated_data.pop(
-            'position')
-        positions_objs = []
-        validated_data['count'] = 0
-        validated_data['total'] = 0
+        items = validated_data.pop('position')['all']
+        validated_data['count'] = sum(item['quantity'] for item in items)
+        validated_data['total'] = sum(item['product'].price * item['quantity'] for item in items)
         order = super().create(validated_data)
-        for position in positions.values():
-            for item in position:
-                validated_data['total'] += item['product'].price * item['quantity']
-                validated_data['count'] += item['quantity']
-                positions_objs.append(Position(quantity=item['quantity'], product=item['product'], order=order))
-        order.count = validated_data['count']
-        order.total = validated_data['total']
-        order.save()
-        Position.objects.bulk_create(positions_objs)
+        Position.objects.bulk_create(
+            [Position(quantity=item['quantity'], product=item['product'], price=item['product'].price, order=order)
+             for item in items]
+        )
+        # сводные таблицы продаж и рекомендации обновит воркер outbox
+        enqueue(ORDER_CREATED, order.id)
         return order
 
 
@@ -120,13 +165,16 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         model = Order
         fields = ('user', 'status', 'total', 'count', 'position', 'created_at', 'updated_at')
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Метод для обновления + проверка на допустимость изменения"""
+        old_status = instance.status
         if self.context['request'].user.is_authenticated:
             if validated_data['status'] == 'CANCELLED':
                 instance.status = validated_data.get('status', instance.status)
                 instance.updated_at = datetime.now()
                 instance.save()
+                apply_status_change([instance.id], old_status, instance.status)
                 return instance
             else:
                 raise ValidationError({"Order": "Авторизованный пользователь может менять статус только на 'Отменён'"})
@@ -134,6 +182,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             instance.status = validated_data.get('status', instance.status)
             instance.updated_at = datetime.now()
             instance.save()
+            apply_status_change([instance.id], old_status, instance.status)
             return instance
         else:
             raise ValidationError({"Order": "Менять статус заказа может только админ"})
@@ -158,9 +207,21 @@ class CollectionsDetailSerializer(serializers.ModelSerializer):
 
     products = serializers.SerializerMethodField()
 
+    @staticmethod
+    def get_products_prefetch(include_reviews=True):
+        """ Товары подборки, при необходимости с отзывами и их авторами """
+        products = Product.objects.all()
+        if include_reviews:
+            products = products.prefetch_related(reviews_prefetch())
+        return Prefetch('products', queryset=products)
+
     def get_products(self, data):
-        product_info = ProductCollections.objects.get(id=data.id).products.all()
-        return ProductDetailSerializer(product_info, many=True).data
+        include_reviews = self.context.get('include_reviews', True)
+        if 'products' not in getattr(data, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([data], self.get_products_prefetch(include_reviews))
+        if include_reviews:
+            return ProductDetailSerializer(data.products.all(), many=True).data
+        return ProductSerializer(data.products.all(), many=True).data
 
     class Meta:
         model = ProductCollections
@@ -177,20 +238,11 @@ class CollectionsDetailSerializer(serializers.ModelSerializer):
             raise ValidationError({"Collections": "Менять информацию может только админ"})
 
 
-class FavouritesCreateSerializer(serializers.ModelSerializer):
-    """ Сериализатор создания списка избранных товаров """
+class FavouritesSerializer(serializers.Serializer):
+    """ Сериализатор добавления и удаления товаров избранного (id товаров) """
 
-    class Meta:
-        model = User
-        fields = ("products",)
-
-    def create(self, validated_data):
-        validated_data['username'] = self.context['request'].user
-        products = validated_data.pop('products')
-        user_info = User.objects.get(username=self.context['request'].user)
-        for product in products:
-            user_info.products.add(product.id)
-        return user_info
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                     max_length=settings.FAVOURITES_MAX_PRODUCTS)
 
 
 class ProductSerializerForFavourites(serializers.ModelSerializer):
@@ -210,17 +262,49 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
-    """Serializer для информации об избранных продуктах пользователя."""
+    """
+    Serializer для информации об избранных продуктах пользователя.
+
+    Избранное берётся из prefetch экземпляра, история заказов отдаётся
+    страницей OrderHistoryPagination (параметры cursor и page_size запроса):
+    заказы выбираются через related manager пользователя, поэтому order.user
+    не загружается повторно, а позиции всей страницы - одним запросом.
+    """
 
     favourites = serializers.SerializerMethodField()
+    order = serializers.SerializerMethodField()
 
     def get_favourites(self, data):
-        user_info = User.objects.get(id=self.context['request'].user.id)
-        result = user_info.products.all()
-        return ProductSerializerForFavourites(result, many=True).data
+        return ProductSerializerForFavourites(data.products.all(), many=True).data
 
-    order = OrderDetailSerializer(many=True, read_only=True)
+    def get_order(self, data):
+        paginator = OrderHistoryPagination()
+        orders = data.order.prefetch_related('position')
+        page = paginator.paginate_queryset(orders, self.context['request'], view=self.context.get('view'))
+        return paginator.get_paginated_data(OrderDetailSerializer(page, many=True, context=self.context).data)
 
     class Meta:
         model = User
         fields = ('username', 'favourites', 'order')
+
+
+class OrderBulkStatusSerializer(serializers.Serializer):
+    """ Массовая смена статуса: новый статус и id заказов (без id - заказы по фильтрам запроса) """
+
+    status = serializers.ChoiceField(choices=OrderStatusChoices.choices)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False,
+                                max_length=settings.ORDER_BULK_STATUS_MAX_IDS)
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    """ Параметры отчёта о продажах: период группировки, диапазон дат и товары """
+
+    period = serializers.ChoiceField(choices=('day', 'month'), default='day')
+    date_after = serializers.DateField(required=False)
+    date_before = serializers.DateField(required=False)
+    product = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        if data.get('date_after') and data.get('date_before') and data['date_after'] > data['date_before']:
+            raise ValidationError({"date_after": "Начало периода позже конца"})
+        return data
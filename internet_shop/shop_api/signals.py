@@ -0,0 +1,100 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from shop_api import search
+from shop_api.authentication import revoke_tokens, revoke_user
+from shop_api.cache import invalidate
+from shop_api.models import Product, Review, ProductCollections
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, using, **kwargs):
+    """ Обновление поискового индекса при сохранении товара """
+    search.index_product(instance, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, using, **kwargs):
+    """ Удаление товара из поискового индекса """
+    search.unindex_product(instance.pk, using=using)
+
+
+def invalidate_products(product_ids, using):
+    """ Товар выводится в списке, на своей странице и на страницах подборок """
+    collection_ids = (ProductCollections.objects.using(using)
+                      .filter(products__in=product_ids).values_list('id', flat=True).distinct())
+    invalidate("products", *(f"product:{pk}" for pk in product_ids),
+               *(f"collection:{pk}" for pk in collection_ids), using=using)
+
+
+def _invalidate_product(product_id, using):
+    invalidate_products([product_id], using)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_cache(sender, instance, using, created, **kwargs):
+    if created:
+        invalidate("products", using=using)
+    else:
+        _invalidate_product(instance.pk, using)
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_deleted_product_cache(sender, instance, using, **kwargs):
+    """ Связи с подборками удаляются каскадом без m2m_changed, поэтому подборки находим до удаления """
+    _invalidate_product(instance.pk, using)
+    invalidate("collections", using=using)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_cache(sender, instance, using, **kwargs):
+    """ Отзывы и оценки выводятся на странице товара, оценки - в списке товаров """
+    _invalidate_product(instance.product_id, using)
+
+
+@receiver(post_save, sender=ProductCollections)
+@receiver(post_delete, sender=ProductCollections)
+def invalidate_collection_cache(sender, instance, using, **kwargs):
+    invalidate("collections", f"collection:{instance.pk}", using=using)
+
+
+@receiver(m2m_changed, sender=ProductCollections.products.through)
+def invalidate_collection_products_cache(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """ Изменение состава подборки (в том числе со стороны товара: product.product_collections) """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        collection_ids = [instance.pk]
+    elif action == 'pre_clear':
+        collection_ids = list(instance.product_collections.using(using).values_list('id', flat=True))
+    else:
+        collection_ids = pk_set
+    # состав подборки - часть её представления (ETag/Last-Modified)
+    ProductCollections.objects.using(using).filter(pk__in=collection_ids).update(updated_at=timezone.now())
+    invalidate("collections", *(f"collection:{pk}" for pk in collection_ids), using=using)
+
+
+@receiver(pre_delete, sender=User)
+def clear_deleted_user_favourites(sender, instance, using, **kwargs):
+    """ Избранное удаляется каскадом без m2m_changed, поэтому счётчики товаров уменьшаем до удаления """
+    # favourites импортирует отсюда invalidate_products
+    from shop_api.favourites import clear_favourites
+    clear_favourites(instance.pk, using)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    """ Удалённый токен (в том числе вместе с пользователем) сразу перестаёт приниматься """
+    revoke_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, update_fields, **kwargs):
+    """ В кэше токенов хранится пользователь: после изменения (is_active, is_staff, ...) он загружается заново """
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    revoke_user(instance.pk)
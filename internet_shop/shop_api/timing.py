@@ -0,0 +1,246 @@
+"""
+Разбивка времени запроса по фазам: Server-Timing, структурированный лог и
+гистограммы задержек по эндпоинтам.
+
+ServerTimingMiddleware измеряет запрос целиком, а ServerTimingMixin (первый
+в базовых классах ViewSet) - фазы внутри DRF:
+
+* auth - аутентификация (включая её SQL-запросы);
+* db - остальные SQL-запросы действия;
+* serialize - код действия без SQL: фильтры, права, сериализаторы;
+* render - рендеринг ответа и middleware;
+* total - весь запрос.
+
+Гистограммы хранятся в памяти процесса (у каждого воркера gunicorn свои) и
+отдаются в текстовом формате Prometheus эндпоинтом /api/v1/metrics/.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from shop_api.budgets import QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('auth', 'db', 'serialize', 'render', 'total')
+
+PHASE_DESCRIPTIONS = {
+    'auth': 'Authentication',
+    'db': 'SQL',
+    'serialize': 'View and serializers',
+    'render': 'Rendering',
+    'total': 'Total',
+}
+
+# границы корзин гистограммы, секунды (как у клиентов Prometheus по умолчанию)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics_lock = threading.Lock()
+_metrics = {}
+
+
+class RequestTimer:
+    """ Замеры одного запроса; хранится в request.server_timing """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint = None
+        self.view_duration = None
+        self.auth = 0.0
+        self.auth_db = 0.0
+        self.db = 0.0
+        self.queries = 0
+
+    def phases(self):
+        total = time.perf_counter() - self.started
+        if self.view_duration is None:
+            return {'total': total}
+        db = max(self.db - self.auth_db, 0.0)
+        return {
+            'auth': self.auth,
+            'db': db,
+            'serialize': max(self.view_duration - self.auth - db, 0.0),
+            'render': max(total - self.view_duration, 0.0),
+            'total': total,
+        }
+
+
+def server_timing_header(phases, queries=0):
+    parts = []
+    for phase in PHASES:
+        if phase in phases:
+            description = PHASE_DESCRIPTIONS[phase]
+            if phase == 'db':
+                description = f'{queries} queries'
+            parts.append(f'{phase};dur={phases[phase] * 1000:.1f};desc="{description}"')
+    return ', '.join(parts)
+
+
+def _endpoint_name(request, timer):
+    if timer.endpoint:
+        return timer.endpoint
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def record(endpoint, method, status, phases, queries):
+    """ Учёт запроса в гистограмме и счётчиках фаз """
+    total = phases['total']
+    with _metrics_lock:
+        stats = _metrics.setdefault((endpoint, method), {
+            'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'queries': 0,
+            'phases': dict.fromkeys(PHASES[:-1], 0.0), 'statuses': {},
+        })
+        for index, bound in enumerate(BUCKETS):
+            if total <= bound:
+                stats['buckets'][index] += 1
+        stats['count'] += 1
+        stats['sum'] += total
+        stats['queries'] += queries
+        for phase in PHASES[:-1]:
+            stats['phases'][phase] += phases.get(phase, 0.0)
+        stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render_metrics():
+    """ Метрики в текстовом формате Prometheus (version 0.0.4) """
+    with _metrics_lock:
+        snapshot = {key: {**stats, 'buckets': list(stats['buckets']), 'phases': dict(stats['phases']),
+                          'statuses': dict(stats['statuses'])}
+                    for key, stats in _metrics.items()}
+    lines = [
+        '# HELP shop_api_request_duration_seconds Request latency by endpoint.',
+        '# TYPE shop_api_request_duration_seconds histogram',
+    ]
+    for (endpoint, method), stats in sorted(snapshot.items()):
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append('shop_api_request_duration_seconds_bucket'
+                         f'{_labels(endpoint=endpoint, method=method, le=bound)} {count}')
+        lines.append('shop_api_request_duration_seconds_bucket'
+                     f'{_labels(endpoint=endpoint, method=method, le="+Inf")} {stats["count"]}')
+        lines.append(f'shop_api_request_duration_seconds_sum{_labels(endpoint=endpoint, method=method)} '
+                     f'{stats["sum"]:.6f}')
+        lines.append(f'shop_api_request_duration_seconds_count{_labels(endpoint=endpoint, method=method)} '
+                     f'{stats["count"]}')
+    lines += [
+        '# HELP shop_api_request_phase_seconds_total Time spent in each request phase.',
+        '# TYPE shop_api_request_phase_seconds_total counter',
+    ]
+    for (endpoint, method), stats in sorted(snapshot.items()):
+        for phase, value in stats['phases'].items():
+            lines.append('shop_api_request_phase_seconds_total'
+                         f'{_labels(endpoint=endpoint, method=method, phase=phase)} {value:.6f}')
+    lines += [
+        '# HELP shop_api_db_queries_total SQL queries executed by endpoint.',
+        '# TYPE shop_api_db_queries_total counter',
+    ]
+    for (endpoint, method), stats in sorted(snapshot.items()):
+        lines.append(f'shop_api_db_queries_total{_labels(endpoint=endpoint, method=method)} {stats["queries"]}')
+    lines += [
+        '# HELP shop_api_responses_total Responses by endpoint and status code.',
+        '# TYPE shop_api_responses_total counter',
+    ]
+    for (endpoint, method), stats in sorted(snapshot.items()):
+        for status, count in sorted(stats['statuses'].items()):
+            lines.append(f'shop_api_responses_total{_labels(endpoint=endpoint, method=method, status=status)} '
+                         f'{count}')
+    return '\n'.join(lines) + '\n'
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware (первым в MIDDLEWARE): заголовок Server-Timing, строка лога
+    в JSON и учёт запроса в гистограммах. Работает и под WSGI, и под ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Django определяет асинхронный middleware так же, как и MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request.server_timing = RequestTimer()
+        response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        request.server_timing = RequestTimer()
+        response = await self.get_response(request)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        timer = request.server_timing
+        phases = timer.phases()
+        endpoint = _endpoint_name(request, timer)
+        response['Server-Timing'] = server_timing_header(phases, timer.queries)
+        record(endpoint, request.method, response.status_code, phases, timer.queries)
+        logger.info(json.dumps({
+            'event': 'request',
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.queries,
+            **{f'{phase}_ms': round(value * 1000, 3) for phase, value in phases.items()},
+        }, ensure_ascii=False))
+        return response
+
+
+class ServerTimingMixin:
+    """
+    Mixin для ViewSet: фазы auth/db/serialize для ServerTimingMiddleware.
+    SQL учитывается в потоке, где выполняется представление (в том числе в
+    пуле shop_api.async_views).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        timer = getattr(request, 'server_timing', None)
+        if timer is None:
+            return super().dispatch(request, *args, **kwargs)
+        self._timing_recorder = recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = super().dispatch(request, *args, **kwargs)
+        timer.view_duration = time.perf_counter() - start
+        timer.db = recorder.duration
+        timer.queries = recorder.count
+        action = getattr(self, 'action', None)
+        if action:
+            timer.endpoint = f"{type(self).__name__}.{action}"
+        return response
+
+    def perform_authentication(self, request):
+        timer = getattr(request._request, 'server_timing', None)
+        if timer is None:
+            return super().perform_authentication(request)
+        recorder = self._timing_recorder
+        start, db_start = time.perf_counter(), recorder.duration
+        super().perform_authentication(request)
+        timer.auth += time.perf_counter() - start
+        timer.auth_db += recorder.duration - db_start
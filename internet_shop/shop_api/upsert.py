@@ -0,0 +1,36 @@
+"""
+Прибавление результатов агрегирующего SELECT к таблице счётчиков.
+
+На PostgreSQL и SQLite - одним запросом INSERT ... SELECT ...
+ON CONFLICT (ключ) DO UPDATE SET поле = поле + excluded.поле, на остальных
+СУБД - UPDATE/INSERT по строкам. Ключ должен быть уникальным в таблице.
+"""
+from django.db import connections
+from django.db.models import F
+
+
+def add_rows(model, rows, keys, fields, using='default'):
+    """
+    rows - queryset .values(*keys).annotate(**fields) (имена как у полей model);
+    значения fields прибавляются к строкам model с тем же ключом keys.
+    """
+    connection = connections[using]
+    key_fields = [model._meta.get_field(key) for key in keys]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        quote = connection.ops.quote_name
+        sql, params = rows.query.sql_with_params()
+        table = quote(model._meta.db_table)
+        key_columns = ', '.join(quote(field.column) for field in key_fields)
+        columns = ', '.join([key_columns, *map(quote, fields)])
+        updates = ', '.join(f'{name} = {table}.{name} + excluded.{name}' for name in map(quote, fields))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) {sql} ON CONFLICT ({key_columns}) DO UPDATE SET {updates}",
+                params,
+            )
+        return
+    manager = model.objects.using(using)
+    for row in rows:
+        lookup = {field.attname: row[key] for key, field in zip(keys, key_fields)}
+        if not manager.filter(**lookup).update(**{field: F(field) + row[field] for field in fields}):
+            manager.create(**lookup, **{field: row[field] for field in fields})
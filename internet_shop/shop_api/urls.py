@@ -1,8 +1,9 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
 
+from shop_api import async_views
 from shop_api.views import ProductViewSet, ReviewViewSet, OrderViewSet, \
-     UserViewSet, CollectionViewSet
+     UserViewSet, CollectionViewSet, MetricsView, SalesAnalyticsView
 
 urlpatterns = format_suffix_patterns([
     path('products/', ProductViewSet.as_view({'get': 'list', 'post': 'create'})),
@@ -15,5 +16,15 @@ urlpatterns = format_suffix_patterns([
     path('product-collections/<int:pk>/', CollectionViewSet.as_view({'get': 'retrieve', 'put': 'update',
                                                                      'delete': 'destroy'})),
     path('user-info/', UserViewSet.as_view({'get': 'list'})),
-    path('user-info/<int:pk>/', UserViewSet.as_view({'get': 'retrieve', 'post': 'create'}))
+    path('user-info/<int:pk>/', UserViewSet.as_view({'get': 'retrieve', 'post': 'create'})),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='analytics-sales'),
+    # асинхронные эндпоинты чтения каталога для ASGI (internet_shop/asgi.py)
+    path('async/products/', async_views.product_list, name='async-products-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-products-detail'),
+    path('async/product-reviews/', async_views.review_list, name='async-product-reviews-list'),
+    path('async/product-reviews/<int:pk>/', async_views.review_detail, name='async-product-reviews-detail'),
+    path('async/product-collections/', async_views.collection_list, name='async-product-collections-list'),
+    path('async/product-collections/<int:pk>/', async_views.collection_detail,
+         name='async-product-collections-detail'),
 ])
@@ -1,24 +1,62 @@
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.status import HTTP_201_CREATED
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from shop_api.analytics import apply_orders, is_counted, sales_report
+from shop_api.budgets import QueryBudgetMixin
+from shop_api.cache import ResponseCacheMixin
+from shop_api.conditional import ConditionalGetMixin
+from shop_api.export import EXPORT_FORMATS, iter_export
+from shop_api.favourites import add_favourites, remove_favourites
 from shop_api.filters import ProductFilter, ReviewFilter, OrderFilter
-from shop_api.models import Product, Review, Order, ProductCollections
+from shop_api.models import Product, Review, Order, ProductCollections, ProductRecommendation
+from shop_api.order_status import transition_orders
+from shop_api.outbox import ORDER_CREATED, discard_pending
+from shop_api.pagination import KeysetPagination
+from shop_api.recommendations import record_orders
+from shop_api.ratings import apply_rating_change
+from shop_api.replicas import ReplicaReadMixin
+from shop_api.timing import ServerTimingMixin, render_metrics
 
 from shop_api.serializers import ProductSerializer, ProductDetailSerializer, ReviewSerializer, OrderSerializer,\
     OrderDetailSerializer, UserSerializer, UserDetailSerializer, CollectionsSerializer, CollectionsDetailSerializer,\
-    FavouritesCreateSerializer
+    FavouritesSerializer, OrderBulkStatusSerializer, ProductRecommendationSerializer, SalesQuerySerializer, \
+    reviews_prefetch
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ServerTimingMixin, QueryBudgetMixin, ReplicaReadMixin, ConditionalGetMixin, ResponseCacheMixin,
+                     ModelViewSet):
     """ViewSet для продуктов """
 
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = ProductFilter
+    ordering_fields = ('rating_avg', 'rating_count', 'favourites_count', 'price', 'created_at')
+    pagination_class = KeysetPagination
     queryset = Product.objects.all()
+    query_budgets = {"list": 3, "retrieve": 4, "create": 4, "update": 6, "partial_update": 6, "destroy": 12,
+                     "recommendations": 3}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "retrieve":
+            # отзывы вместе с авторами загружаются одним дополнительным запросом
+            queryset = queryset.prefetch_related(reviews_prefetch())
+        return queryset
+
+    def get_cache_scopes(self):
+        if self.action == "retrieve":
+            return [f"product:{self.kwargs['pk']}"]
+        return ["products"]
 
     def get_serializer_class(self):
         if self.action in ["list", "create", "update"]:
@@ -32,13 +70,23 @@ class ProductViewSet(ModelViewSet):
             return [IsAdminUser()]
         return []
 
+    @action(detail=True, methods=["get"])
+    def recommendations(self, request, pk=None):
+        """ Товары, чаще всего покупаемые вместе с этим (из заранее рассчитанного топа) """
+        product = self.get_object()
+        recommendations = (ProductRecommendation.objects.filter(product=product)
+                           .select_related('recommended').order_by('rank'))
+        return Response(ProductRecommendationSerializer(recommendations, many=True).data)
+
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ServerTimingMixin, QueryBudgetMixin, ReplicaReadMixin, ConditionalGetMixin, ModelViewSet):
     """ViewSet для отзывов """
 
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ReviewFilter
-    queryset = Review.objects.all()
+    pagination_class = KeysetPagination
+    queryset = Review.objects.select_related('creator')
+    query_budgets = {"list": 5, "retrieve": 3, "create": 5, "update": 7, "partial_update": 7, "destroy": 6}
 
     def get_serializer_class(self):
         if self.action in ["list", "retrieve", "create", "update"]:
@@ -58,6 +106,10 @@ class ReviewViewSet(ModelViewSet):
             raise ValidationError({"Review": "Удалять можно только свои записи!"})
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        apply_rating_change(instance.product_id, removed=instance.rating)
+
     @transaction.atomic
     def update(self, request, *args, **kwargs):
         review_user = request.user
@@ -68,10 +120,14 @@ class ReviewViewSet(ModelViewSet):
         return super().update(request, *args, **kwargs)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ServerTimingMixin, QueryBudgetMixin, ConditionalGetMixin, ModelViewSet):
     """ViewSet для заказов"""
 
+    filter_backends = (DjangoFilterBackend,)
     filterset_class = OrderFilter
+    pagination_class = KeysetPagination
+    query_budgets = {"list": 6, "retrieve": 6, "create": 8, "update": 7, "partial_update": 7, "destroy": 12,
+                     "bulk_status": 5}
 
     def get_serializer_class(self):
         if self.action in ["list", "create"]:
@@ -80,7 +136,7 @@ class OrderViewSet(ModelViewSet):
             return OrderDetailSerializer
 
     def get_queryset(self):
-        queryset = Order.objects.all()
+        queryset = Order.objects.select_related('user').prefetch_related('position')
         if not (self.request.user.is_staff or self.request.user.is_superuser):
             queryset = queryset.filter(user=self.request.user.id)
         return queryset
@@ -88,6 +144,8 @@ class OrderViewSet(ModelViewSet):
     def get_permissions(self):
         if self.action == "create":
             return [IsAuthenticated()]
+        if self.action in ["export", "bulk_status"]:
+            return [IsAdminUser()]
         return []
 
     @transaction.atomic
@@ -99,11 +157,83 @@ class OrderViewSet(ModelViewSet):
             raise ValidationError({"Order": "Просматривать можно только свои заказы!"})
         return super().retrieve(request, *args, **kwargs)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # позиции заказа, ещё не учтённые воркером outbox, вычитать не нужно
+        if not discard_pending(ORDER_CREATED, [instance.id]):
+            if is_counted(instance.status):
+                apply_orders([instance.id], -1)
+            record_orders([instance.id], -1)
+        instance.delete()
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """ Потоковая выгрузка заказов с позициями (NDJSON или CSV) с учётом фильтров OrderFilter """
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({"export_format": f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"})
+        orders = self.filter_queryset(Order.objects.all())
+        response = StreamingHttpResponse(iter_export(orders, export_format),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
 
-class CollectionViewSet(ModelViewSet):
+    @staticmethod
+    def has_bound_filters(request):
+        """ Задано ли значение хотя бы одного фильтра OrderFilter (неизвестные параметры и format не в счёт) """
+        filterset = OrderFilter(request.query_params, queryset=Order.objects.none())
+        if not filterset.is_valid():
+            return False
+        return any(filterset.form.cleaned_data.get(name) not in (None, '', [])
+                   for name in OrderFilter.base_filters)
+
+    @action(detail=False, methods=["post"], url_path="bulk-status")
+    def bulk_status(self, request):
+        """ Массовая смена статуса заказов из списка ids или по фильтрам OrderFilter в строке запроса """
+        serializer = OrderBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get("ids")
+        orders = self.filter_queryset(Order.objects.all())
+        if ids is None and not self.has_bound_filters(request):
+            raise ValidationError({"ids": "Укажите id заказов или фильтры OrderFilter в строке запроса"})
+        return Response(transition_orders(orders, serializer.validated_data["status"], ids))
+
+
+class CollectionViewSet(ServerTimingMixin, QueryBudgetMixin, ReplicaReadMixin, ConditionalGetMixin, ResponseCacheMixin,
+                        ModelViewSet):
     """ViewSet для подборок """
 
     queryset = ProductCollections.objects.all()
+    query_budgets = {"list": 4, "retrieve": 5, "create": 8, "update": 7, "partial_update": 7, "destroy": 4}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = queryset.prefetch_related('products')
+        elif self.action in ["retrieve", "update"]:
+            queryset = queryset.prefetch_related(
+                CollectionsDetailSerializer.get_products_prefetch(self.include_reviews())
+            )
+        return queryset
+
+    def include_reviews(self):
+        """ ?reviews=false - облегчённый режим: товары подборки без отзывов """
+        return self.request.query_params.get('reviews', '').lower() not in ('0', 'false', 'no')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_reviews'] = self.include_reviews()
+        return context
+
+    def get_cache_scopes(self):
+        if self.action == "retrieve":
+            return [f"collection:{self.kwargs['pk']}"]
+        return ["collections"]
+
+    def get_freshness_aggregates(self):
+        # подборка выводится вместе с товарами (при кэше, общем для процессов, - по версиям кэша)
+        return {"products_last_modified": Max('products__updated_at'),
+                "products_count": Count('products', distinct=True)}
 
     def get_serializer_class(self):
         if self.action in ["list", "create"]:
@@ -117,28 +247,106 @@ class CollectionViewSet(ModelViewSet):
         return []
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(ServerTimingMixin, QueryBudgetMixin, ConditionalGetMixin, ModelViewSet):
     """ ViewSet для информации о пользователе """
     queryset = User.objects.all()
+    # избранное не датируется, поэтому только ETag
+    last_modified_field = None
+    query_budgets = {"list": 3, "retrieve": 6, "create": 5, "favourites": 4}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related(Prefetch('products', queryset=Product.objects.only('id', 'name')))
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
             return UserSerializer
         elif self.action == "retrieve":
             return UserDetailSerializer
-        elif self.action == "create":
-            return FavouritesCreateSerializer
+        elif self.action in ["create", "favourites"]:
+            return FavouritesSerializer
+
+    def get_freshness_aggregates(self):
+        if self.action != "retrieve":
+            return {"max_id": Max('id')}
+        # заказы и избранное - отдельными подзапросами, без соединения заказов с избранным;
+        # id связующей таблицы избранного не переиспользуются (AUTOINCREMENT/sequence), поэтому
+        # добавление всегда меняет Max(id), удаление - число строк
+        user_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        orders = Order.objects.filter(user_id=user_id).order_by().values('user_id')
+        favourites = Product.favourites.through.objects.filter(user_id=user_id).order_by().values('user_id')
+
+        def scalar(queryset, aggregate):
+            return Max(Subquery(queryset.annotate(value=aggregate).values('value')))
+
+        return {"orders_modified": scalar(orders, Max('updated_at')),
+                "orders_count": scalar(orders, Count('id')),
+                "favourites_count": scalar(favourites, Count('id')),
+                "favourites_max_id": scalar(favourites, Max('id')),
+                "favourites_modified": scalar(favourites, Max('product__updated_at'))}
 
     def get_permissions(self):
-        if self.action in ["list", "create", "retrieve", "destroy"]:
+        if self.action in ["list", "create", "retrieve", "destroy", "favourites"]:
             return [IsAuthenticated()]
         return []
 
+    def check_own_profile(self, message):
+        # свой профиль определяется по pk из URL без лишней выборки пользователя
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if str(self.kwargs[lookup_url_kwarg]) != str(self.request.user.pk):
+            self.get_object()
+            raise ValidationError({"Favourites": message})
+
     @transaction.atomic
     def retrieve(self, request, *args, **kwargs):
-        request_user = self.request.user
-        instance = self.get_object()
-        request_creator = instance
-        if request_user != request_creator:
-            raise ValidationError({"Favourites": "Просматривать можно только свой список избранных товаров!"})
+        self.check_own_profile("Просматривать можно только свой список избранных товаров!")
         return super().retrieve(request, *args, **kwargs)
+
+    def get_favourites_products(self, request):
+        self.check_own_profile("Изменять можно только свой список избранных товаров!")
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data["products"]
+
+    def create(self, request, *args, **kwargs):
+        """ POST на страницу пользователя добавляет товары в избранное; в ответе, как и прежде, весь список """
+        add_favourites(request.user.pk, self.get_favourites_products(request))
+        favourites = (Product.favourites.through.objects.filter(user_id=request.user.pk)
+                      .order_by('product_id').values_list('product_id', flat=True))
+        return Response({"products": list(favourites)}, status=HTTP_201_CREATED)
+
+    @action(detail=True, methods=["post", "delete"])
+    def favourites(self, request, *args, **kwargs):
+        """ Добавление (POST) и удаление (DELETE) многих товаров избранного одним запросом к БД """
+        products = self.get_favourites_products(request)
+        if request.method == "DELETE":
+            return Response({"removed": remove_favourites(request.user.pk, products)})
+        return Response({"added": add_favourites(request.user.pk, products)}, status=HTTP_201_CREATED)
+
+
+class MetricsView(APIView):
+    """ Гистограммы задержек и фазы запросов в формате Prometheus (только для персонала) """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SalesAnalyticsView(ServerTimingMixin, APIView):
+    """ Выручка, проданные штуки и заказы по дням или месяцам из сводных таблиц (только для персонала) """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rows = sales_report(params['period'], params.get('date_after'), params.get('date_before'),
+                            params.get('product'))
+        return Response({
+            'period': params['period'],
+            'results': [{**row, 'revenue': round(row['revenue'], 2)} for row in rows],
+        })
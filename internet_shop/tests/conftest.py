@@ -1,12 +1,41 @@
+from io import StringIO
+
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
 from rest_framework.status import HTTP_201_CREATED
 from rest_framework.test import APIClient
 
-from shop_api.models import Product
+from shop_api.models import Product, Review
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """ Кэш ответов не должен переживать откат БД между тестами """
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    """ Общий для процессов кэш Django (файлы): с ним включаются кэш токенов и ETag по версиям кэша """
+    settings.CACHES = {**settings.CACHES, 'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path / 'cache')}}
+
+
+@pytest.fixture
+def process_outbox():
+    """ Обработка накопившихся сообщений outbox, как воркер: process_outbox --once """
+    def wrapper():
+        out = StringIO()
+        call_command('process_outbox', '--once', stdout=out)
+        return out.getvalue()
+    return wrapper
 
 
 @pytest.fixture
@@ -36,6 +65,21 @@ def product_factory():
     return factory
 
 
+@pytest.fixture
+def review_factory(django_user_model):
+    def factory(product, quantity):
+        """ Массовое создание отзывов от разных пользователей """
+        start = django_user_model.objects.count()
+        usernames = [f"reviewer{start + i}" for i in range(quantity)]
+        django_user_model.objects.bulk_create([django_user_model(username=name) for name in usernames])
+        users = django_user_model.objects.filter(username__in=usernames)
+        Review.objects.bulk_create(
+            [Review(creator=user, product=product, review_text="отзыв", rating=i % 5 + 1)
+             for i, user in enumerate(users)]
+        )
+    return factory
+
+
 @pytest.fixture
 def add_product_to_favourites_list(product_factory, authenticated_client):
     def wrapper():
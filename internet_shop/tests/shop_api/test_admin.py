@@ -0,0 +1,85 @@
+import pytest
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
+
+from shop_api.admin import EstimatedCountPaginator
+from shop_api.models import Order, OutboxMessage, Product
+
+
+@pytest.fixture
+def staff_client(admin_user):
+    client = Client()
+    client.force_login(admin_user)
+    return client
+
+
+def _changelist_queries(staff_client, django_assert_max_num_queries, url, limit):
+    with django_assert_max_num_queries(limit) as captured:
+        resp = staff_client.get(url)
+    assert resp.status_code == 200
+    return len(captured)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_name", ["admin:shop_api_order_changelist", "admin:shop_api_review_changelist"])
+def test_changelist_queries_do_not_grow(staff_client, django_assert_max_num_queries, url_name):
+    """ Тест постоянного числа запросов списка в админке (list_select_related, без COUNT по всей таблице) """
+    users = baker.make(User, _quantity=3)
+    products = baker.make(Product, _quantity=3)
+    for user, product in zip(users, products):
+        baker.make(Order, user=user)
+        baker.make('shop_api.Review', creator=user, product=product)
+    url = reverse(url_name)
+    few = _changelist_queries(staff_client, django_assert_max_num_queries, url, 20)
+    for _ in range(3):
+        users = baker.make(User, _quantity=5)
+        baker.make(Order, user=iter(users), _quantity=5)
+        baker.make('shop_api.Review', creator=iter(users), product=products[0], _quantity=5)
+    assert _changelist_queries(staff_client, django_assert_max_num_queries, url + '?created_at__year=2000',
+                               20) <= few
+    assert _changelist_queries(staff_client, django_assert_max_num_queries, url, 20) == few
+
+
+@pytest.mark.django_db
+def test_product_page_shows_capped_reviews(staff_client, product_factory):
+    """ Тест встройки отзывов: загружаются только последние, форма товара сохраняется """
+    product = product_factory(name="Дрель", price=10)
+    for user in baker.make(User, _quantity=25):
+        baker.make('shop_api.Review', creator=user, product=product, rating=5)
+    url = reverse("admin:shop_api_product_change", args=[product.id])
+    resp = staff_client.get(url)
+    assert resp.status_code == 200
+    formset = resp.context['inline_admin_formsets'][0].formset
+    assert len(formset.forms) == 20 + 1
+    latest = product.review.order_by('-created_at', '-id').first()
+    assert formset.forms[0].instance == latest
+
+    data = {"name": "Дрель ударная", "description": "ударная", "price": 12,
+            "review-TOTAL_FORMS": 0, "review-INITIAL_FORMS": 0, "review-MIN_NUM_FORMS": 0,
+            "review-MAX_NUM_FORMS": 1000}
+    resp = staff_client.post(url, data)
+    assert resp.status_code == 302
+    assert Product.objects.get(id=product.id).name == "Дрель ударная"
+
+
+@pytest.mark.django_db
+def test_estimated_count_falls_back_to_exact(product_factory, settings):
+    """ Тест точного подсчёта, когда оценки нет (не PostgreSQL) или список меньше порога """
+    product_factory(_quantity=3)
+    settings.ESTIMATED_COUNT_THRESHOLD = 1
+    assert EstimatedCountPaginator(Product.objects.order_by('id'), 2).count == 3
+
+
+@pytest.mark.django_db
+def test_outbox_changelist_filters_failed(staff_client):
+    """ Тест списка outbox в админке с отбором сообщений с исчерпанными попытками """
+    OutboxMessage.objects.create(topic="order.created", object_id=1)
+    OutboxMessage.objects.create(topic="order.created", object_id=2, attempts=8, last_error="ValueError()",
+                                 failed_at=timezone.now())
+    url = reverse("admin:shop_api_outboxmessage_changelist")
+    resp = staff_client.get(url + "?failed_at__isempty=0")
+    assert resp.status_code == 200
+    assert [message.object_id for message in resp.context["cl"].result_list] == [2]
@@ -0,0 +1,96 @@
+import logging
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_304_NOT_MODIFIED, \
+    HTTP_405_METHOD_NOT_ALLOWED
+
+from shop_api import async_views
+from shop_api.models import Product, Review, ProductCollections
+from shop_api.replicas import choose_read_database
+
+
+# пул потоков работает со своими соединениями, поэтому данные должны быть зафиксированы
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def _request(method, url, **headers):
+    # AsyncClient Django 3.1 принимает заголовки по их HTTP-именам
+    async def send():
+        return await getattr(AsyncClient(), method)(url, **headers)
+    return async_to_sync(send)()
+
+
+def _get(url, **headers):
+    return _request('get', url, **headers)
+
+
+def test_async_product_list_matches_sync(client, product_factory):
+    """ Тест совпадения ответа асинхронного и синхронного списка товаров """
+    product_factory(_quantity=3)
+    resp = _get(reverse("async-products-list") + '?page_size=2')
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json()['results'] == client.get(reverse("products-list") + '?page_size=2').json()['results']
+    assert 'async/products/' in resp.json()['next']
+    # фазы считаются в потоке пула, где выполняется представление
+    assert 'db;dur=' in resp['Server-Timing']
+
+
+def test_async_detail_endpoints(create_product_collections_by_admin, create_review_by_authenticated_user):
+    """ Тест асинхронных страниц товара, отзыва и подборки с условным GET """
+    create_review_by_authenticated_user()
+    create_product_collections_by_admin()
+    # отзыв доступен только авторизованному пользователю
+    headers = {'authorization': 'Token ' + Token.objects.get(user__username='foo').key}
+    for name, model in (("async-products-detail", Product), ("async-product-reviews-detail", Review),
+                        ("async-product-collections-detail", ProductCollections)):
+        url = reverse(name, args=(model.objects.first().id,))
+        resp = _get(url, **headers)
+        assert resp.status_code == HTTP_200_OK
+        assert _get(url, **headers, **{'if-none-match': resp['ETag']}).status_code == HTTP_304_NOT_MODIFIED
+
+
+def test_async_views_use_db_pool(product_factory, settings, monkeypatch):
+    """ Тест выполнения запроса в ограниченном пуле и отказа на запись """
+    settings.ASYNC_DB_POOL_SIZE = 1
+    monkeypatch.setattr(async_views, '_executor', None)
+    threads = []
+    original = async_views._call_in_pool
+    monkeypatch.setattr(async_views, '_call_in_pool',
+                        lambda *args: threads.append(threading.current_thread().name) or original(*args))
+    product_factory()
+    assert _get(reverse("async-products-list")).status_code == HTTP_200_OK
+    assert threads[0].startswith('shop-api-db')
+    assert async_views.get_executor()._max_workers == 1
+    resp = _request('post', reverse("async-products-list"))
+    assert resp.status_code == HTTP_405_METHOD_NOT_ALLOWED
+
+
+def test_middleware_not_adapted_under_asgi(caplog, settings):
+    """ Тест: под ASGI ни один middleware не переводится на общий поток синхронного кода """
+    # Django сообщает об адаптации только при DEBUG
+    settings.DEBUG = True
+    caplog.set_level(logging.DEBUG, logger='django.request')
+    ASGIHandler()
+    assert [record.getMessage() for record in caplog.records if 'adapted' in record.getMessage()] == []
+
+
+def test_write_pins_user_under_asgi(authenticated_client, product_factory, settings, shared_cache, django_user_model):
+    """ Тест закрепления за default после записи, выполненной через ASGI """
+    settings.DATABASE_REPLICAS = ['replica']
+    product = product_factory()
+    user = django_user_model.objects.get(username='foo')
+    assert choose_read_database(user)[0] == 'replica'
+    token = Token.objects.get(user=user).key
+
+    async def send():
+        return await AsyncClient().post(reverse("product-reviews-list"),
+                                        {'review_text': 'хорошая вещь', 'rating': 4, 'product': product.id},
+                                        content_type='application/json', authorization='Token ' + token)
+    assert async_to_sync(send)().status_code == HTTP_201_CREATED
+    assert choose_read_database(user)[0] == 'default'
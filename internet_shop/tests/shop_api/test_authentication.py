@@ -0,0 +1,123 @@
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED
+from rest_framework.test import APIClient
+
+from shop_api.authentication import LRUCache, _local, revoke_tokens
+
+
+def _url():
+    return reverse("user-info-list")
+
+
+@pytest.mark.django_db
+def test_token_lookup_is_cached(shared_cache, authenticated_client, django_assert_num_queries):
+    """ Тест аутентификации без запроса токена к БД начиная со второго запроса, в том числе из кэша Django """
+    # токен, ETag-агрегат и список пользователей
+    with django_assert_num_queries(3):
+        assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    with django_assert_num_queries(2):
+        resp = authenticated_client.get(_url())
+    assert resp.status_code == HTTP_200_OK
+    assert resp.wsgi_request.user.username == "foo"
+    # другой процесс: пустой LRU, запись из общего кэша
+    _local.clear()
+    with django_assert_num_queries(2):
+        assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_deleted_token_is_revoked(shared_cache, authenticated_client):
+    """ Тест немедленного отказа после удаления токена """
+    assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    Token.objects.get(user__username="foo").delete()
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_deactivated_user_is_revoked(shared_cache, authenticated_client):
+    """ Тест немедленного отказа после деактивации пользователя """
+    assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    user = User.objects.get(username="foo")
+    user.is_active = False
+    user.save()
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_revocation_during_cache_fill(shared_cache, authenticated_client, monkeypatch, settings):
+    """ Тест: токен, загруженный из БД до отзыва и записанный в кэш после него, не принимается """
+    # запросы удаления токена выполняет "другой запрос", в бюджет этого они не входят
+    settings.QUERY_BUDGETS_STRICT = False
+    load_token = TokenAuthentication.authenticate_credentials
+
+    def load_then_revoke(self, key):
+        result = load_token(self, key)
+        # отзыв в другом запросе между чтением из БД и записью в кэш
+        Token.objects.filter(key=key).delete()
+        return result
+
+    monkeypatch.setattr(TokenAuthentication, 'authenticate_credentials', load_then_revoke)
+    assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    monkeypatch.undo()
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+    _local.clear()
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_revocation_from_another_process(shared_cache, authenticated_client, django_assert_num_queries):
+    """ Тест: отзыв в другом процессе (поколение токена в общем кэше) отключает запись LRU этого процесса """
+    authenticated_client.get(_url())
+    key = Token.objects.get(user__username="foo").key
+    revoke_tokens([key])
+    with django_assert_num_queries(3):
+        authenticated_client.get(_url())
+
+
+@pytest.mark.django_db
+def test_revocation_keeps_other_tokens_cached(shared_cache, authenticated_client, django_user_model,
+                                              django_assert_num_queries):
+    """ Тест: отзыв токена одного пользователя не сбрасывает закэшированные токены других """
+    other = APIClient()
+    other_token = Token.objects.create(user=django_user_model.objects.create_user(username='other'))
+    other.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+    assert other.get(_url()).status_code == HTTP_200_OK
+    assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    Token.objects.get(user__username="foo").delete()
+    # ETag-агрегат и список пользователей, без запроса токена
+    with django_assert_num_queries(2):
+        assert other.get(_url()).status_code == HTTP_200_OK
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_process_local_cache_checks_db(authenticated_client, django_assert_num_queries):
+    """
+    Тест: с кэшем в памяти процесса отзыв в другом воркере не был бы виден,
+    поэтому токен проверяется по БД в каждом запросе
+    """
+    assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    # токен, ETag-агрегат и список пользователей
+    with django_assert_num_queries(3):
+        assert authenticated_client.get(_url()).status_code == HTTP_200_OK
+    # деактивация без сигнала - как отзыв, выполненный другим воркером
+    User.objects.filter(username="foo").update(is_active=False)
+    assert authenticated_client.get(_url()).status_code == HTTP_401_UNAUTHORIZED
+
+
+def test_lru_is_bounded_and_expires():
+    """ Тест вытеснения давно не использованных записей и срока жизни """
+    lru = LRUCache(maxsize=2, timeout=60)
+    lru.set('a', 1, 'A')
+    lru.set('b', 1, 'B')
+    assert lru.get('a', 1) == 'A'
+    lru.set('c', 1, 'C')
+    assert (lru.get('a', 1), lru.get('b', 1), lru.get('c', 1)) == ('A', None, 'C')
+    assert lru.get('a', 2) is None
+    expired = LRUCache(maxsize=2, timeout=-1)
+    expired.set('a', 1, 'A')
+    assert expired.get('a', 1) is None
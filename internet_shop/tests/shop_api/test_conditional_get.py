@@ -0,0 +1,175 @@
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_304_NOT_MODIFIED
+
+from shop_api.models import Order, Product, ProductCollections
+
+
+@pytest.mark.django_db
+def test_product_not_modified(client, product_factory, django_assert_num_queries):
+    """ Тест ответа 304 на If-None-Match без сериализации товара """
+    product = product_factory()
+    url = reverse("products-detail", args=(product.id,))
+    resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert resp['Last-Modified']
+    with django_assert_num_queries(1):
+        resp = client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+    assert resp.status_code == HTTP_304_NOT_MODIFIED
+    assert resp.content == b''
+
+
+@pytest.mark.django_db
+def test_if_modified_since(client, product_factory):
+    """ Тест ответа 304 на If-Modified-Since """
+    product_factory(_quantity=3)
+    url = reverse("products-list")
+    last_modified = client.get(url)['Last-Modified']
+    resp = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert resp.status_code == HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+def test_list_etag_by_page_keys(authenticated_client, client, product_factory, django_assert_num_queries):
+    """ Тест: ETag списка проверяется по ключам выданной страницы одним запросом, без сериализации """
+    products = product_factory(_quantity=3)
+    for product, rating in zip(products, (5, 4)):
+        resp = authenticated_client.post(reverse("product-reviews-list"),
+                                         {'review_text': f'оценка {rating}', 'rating': rating, 'product': product.id})
+        assert resp.status_code == HTTP_201_CREATED
+    for url in (reverse("products-list") + '?page_size=2', reverse("product-reviews-list") + '?page_size=1'):
+        first_page = client.get(url)
+        etag = first_page['ETag']
+        with django_assert_num_queries(1):
+            assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_304_NOT_MODIFIED
+        # вторая страница - свой ETag
+        assert client.get(first_page.json()['next'], HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+    review = first_page.json()['results'][0]
+    resp = authenticated_client.put(reverse("product-reviews-detail", args=(review['id'],)),
+                                    {'review_text': 'исправлено', 'rating': 5, 'product': review['product']})
+    assert resp.status_code == HTTP_200_OK
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_write_in_another_worker_changes_etag(client, product_factory):
+    """
+    Тест: с кэшем в памяти процесса ETag и кэш ответов следуют БД - запись
+    другого воркера (здесь - update() без сигналов) не даёт устаревшего 304
+    """
+    product = product_factory(name="старое")
+    for url in (reverse("products-list"), reverse("products-detail", args=(product.id,))):
+        etag = client.get(url)['ETag']
+        Product.objects.filter(pk=product.pk).update(name=url, updated_at=timezone.now())
+        resp = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == HTTP_200_OK
+        assert url in resp.content.decode()
+
+
+@pytest.mark.django_db
+def test_shared_cache_etag_without_queries(client, product_factory, django_assert_num_queries, settings, tmp_path):
+    """ Тест: с общим для процессов кэшем ETag товаров берётся из версий кэша, 304 - без запросов к БД """
+    settings.CACHES = {**settings.CACHES, 'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)}}
+    settings.RESPONSE_CACHE_ALIAS = 'responses'
+    product = product_factory()
+    for url in (reverse("products-list"), reverse("products-detail", args=(product.id,))):
+        resp = client.get(url)
+        assert resp['Last-Modified']
+        with django_assert_num_queries(0):
+            assert client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code == HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+def test_review_changes_product_etag(authenticated_client, client, product_factory):
+    """ Тест смены ETag товара после нового отзыва """
+    product = product_factory()
+    url = reverse("products-detail", args=(product.id,))
+    etag = client.get(url)['ETag']
+    authenticated_client.post(reverse("product-reviews-list"),
+                              {'review_text': 'отлично', 'rating': 5, 'product': product.id})
+    resp = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == HTTP_200_OK
+    assert resp['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_review_text_edit_changes_etags(authenticated_client, client, create_product_collections_by_admin):
+    """ Тест: правка только текста отзыва (с той же оценкой) меняет ETag товара и подборки с ним """
+    create_product_collections_by_admin()
+    collection = ProductCollections.objects.get(title="для работы")
+    product = collection.products.first()
+    resp = authenticated_client.post(reverse("product-reviews-list"),
+                                     {'review_text': 'отлично', 'rating': 5, 'product': product.id})
+    review_url = reverse("product-reviews-detail", args=(resp.json()['id'],))
+    urls = (reverse("products-detail", args=(product.id,)),
+            reverse("product-collections-detail", args=(collection.id,)))
+    etags = [client.get(url)['ETag'] for url in urls]
+
+    resp = authenticated_client.put(review_url, {'review_text': 'уже не так хорошо', 'rating': 5,
+                                                 'product': product.id})
+    assert resp.status_code == HTTP_200_OK
+    for url, etag in zip(urls, etags):
+        resp = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == HTTP_200_OK
+        assert 'уже не так хорошо' in resp.content.decode()
+
+
+@pytest.mark.django_db
+def test_orders_etag(authenticated_client, admin_client, create_order_by_authenticated_user):
+    """ Тест ETag списка заказов: свой для каждого пользователя, меняется со статусом заказа """
+    create_order_by_authenticated_user()
+    url = reverse("orders-list")
+    etag = authenticated_client.get(url)['ETag']
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_304_NOT_MODIFIED
+    assert admin_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+    order = Order.objects.get()
+    authenticated_client.put(reverse("orders-detail", args=(order.id,)), {"status": "CANCELLED"})
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_collection_etag_follows_products(client, create_product_collections_by_admin):
+    """ Тест смены ETag подборки при изменении её состава """
+    create_product_collections_by_admin()
+    collection = ProductCollections.objects.get(title="для работы")
+    url = reverse("product-collections-detail", args=(collection.id,))
+    etag = client.get(url)['ETag']
+    collection.products.remove(collection.products.first())
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_user_info_etag_follows_favourites(authenticated_client, add_product_to_favourites_list, product_factory):
+    """ Тест смены ETag информации о пользователе при изменении избранного """
+    add_product_to_favourites_list()
+    user = User.objects.get(username="foo")
+    url = reverse("user-info-detail", args=(user.id,))
+    resp = authenticated_client.get(url)
+    assert 'Last-Modified' not in resp
+    etag = resp['ETag']
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_304_NOT_MODIFIED
+    user.products.add(Product.objects.exclude(favourites=user).first() or product_factory())
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_user_info_etag_after_favourites_swap(authenticated_client, product_factory, django_assert_num_queries):
+    """ Тест: замена избранного с тем же числом товаров и той же суммой id ({1, 4} -> {2, 3}) меняет ETag """
+    first, second, third, fourth = product_factory(_quantity=4)
+    user = User.objects.get(username="foo")
+    url = reverse("user-info-detail", args=(user.id,))
+    authenticated_client.post(url, {"products": [first.id, fourth.id]})
+    etag = authenticated_client.get(url)['ETag']
+    favourites_url = reverse("user-info-favourites", args=(user.id,))
+    authenticated_client.delete(favourites_url, {"products": [first.id, fourth.id]})
+    authenticated_client.post(favourites_url, {"products": [second.id, third.id]})
+    resp = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == HTTP_200_OK
+    # токен, один агрегат с отдельными подзапросами для заказов и избранного + SAVEPOINT/RELEASE
+    with django_assert_num_queries(4):
+        assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code == HTTP_304_NOT_MODIFIED
+
@@ -1,10 +1,15 @@
+from io import StringIO
+
 import pytest
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
 from rest_framework.test import APIClient
 
+from shop_api.models import Order, Position, Product
+
 
 @pytest.mark.django_db
 def test_get_list_of_favourites_by_authenticated_user(authenticated_client, add_product_to_favourites_list):
@@ -37,3 +42,100 @@ def test_get_own_list_of_favourites_by_authenticated_user(authenticated_client,
     resp = authenticated_client.get(url)
     assert resp.status_code == HTTP_400_BAD_REQUEST
     assert str(another_user) != favourites_info.username
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("orders_count", [1, 30])
+def test_user_info_queries_do_not_grow_with_history(authenticated_client, add_product_to_favourites_list,
+                                                    product_factory, orders_count, django_assert_num_queries):
+    """ Тест постоянного числа запросов и постраничной истории заказов """
+    add_product_to_favourites_list()
+    user = User.objects.get(username="foo")
+    product = product_factory()
+    orders = [Order.objects.create(user=user, total=10, count=1) for _ in range(orders_count)]
+    Position.objects.bulk_create([Position(order=order, product=product, quantity=1) for order in orders])
+    url = reverse("user-info-detail", args=(user.id,))
+    with django_assert_num_queries(8):
+        resp = authenticated_client.get(url)
+    resp_json = resp.json()
+    assert len(resp_json['favourites']) == 3
+    history = resp_json['order']
+    assert len(history['results']) == min(orders_count, 10)
+    assert history['results'][0]['user'] == "foo"
+    assert len(history['results'][0]['position']) == 1
+    assert (history['next'] is None) == (orders_count <= 10)
+    if history['next']:
+        assert len(authenticated_client.get(history['next']).json()['order']['results']) == 10
+
+
+@pytest.mark.django_db
+def test_add_and_remove_favourites(authenticated_client, product_factory, django_user_model,
+                                   django_assert_max_num_queries):
+    """ Тест добавления и удаления многих товаров одним запросом и счётчика избранного """
+    products = product_factory(_quantity=4)
+    ids = [product.id for product in products]
+    user = User.objects.get(username="foo")
+    other = django_user_model.objects.create_user(username="other")
+    other.products.add(ids[0])
+    Product.objects.filter(id=ids[0]).update(favourites_count=1)
+    url = reverse("user-info-favourites", args=(user.id,))
+
+    with django_assert_max_num_queries(6):
+        resp = authenticated_client.post(url, {"products": ids[:3] + [ids[0], 999]}, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    assert resp.json() == {"added": ids[:3]}
+    # повторное добавление игнорируется
+    resp = authenticated_client.post(url, {"products": ids[1:]}, format='json')
+    assert resp.json() == {"added": ids[3:]}
+    assert set(user.products.values_list('id', flat=True)) == set(ids)
+    assert list(Product.objects.order_by('id').values_list('favourites_count', flat=True)) == [2, 1, 1, 1]
+
+    resp = authenticated_client.delete(url, {"products": [ids[0], ids[1], 999]}, format='json')
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json() == {"removed": ids[:2]}
+    assert list(Product.objects.order_by('id').values_list('favourites_count', flat=True)) == [1, 0, 1, 1]
+
+    resp = authenticated_client.get(reverse("products-list") + '?ordering=-favourites_count')
+    assert [item['favourites_count'] for item in resp.json()['results']] == [1, 1, 1, 0]
+
+    url = reverse("user-info-favourites", args=(other.id,))
+    assert authenticated_client.post(url, {"products": ids}, format='json').status_code == HTTP_400_BAD_REQUEST
+    assert authenticated_client.post(url, {"products": []}, format='json').status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_rebuild_favourites(add_product_to_favourites_list):
+    """ Тест пересчёта счётчиков избранного командой """
+    add_product_to_favourites_list()
+    Product.objects.update(favourites_count=0)
+    call_command('rebuild_favourites', stdout=StringIO())
+    assert list(Product.objects.values_list('favourites_count', flat=True)) == [1, 1, 1]
+
+
+@pytest.mark.django_db
+def test_add_favourites_by_user_info_post(authenticated_client, product_factory, django_assert_max_num_queries):
+    """ Тест прежнего ответа POST на страницу пользователя: весь список избранного """
+    products = product_factory(_quantity=3)
+    ids = [product.id for product in products]
+    user = User.objects.get(username="foo")
+    user.products.add(ids[2])
+    url = reverse("user-info-detail", args=(user.id,))
+    with django_assert_max_num_queries(7):
+        resp = authenticated_client.post(url, {"products": ids[:2] + [999]}, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    assert resp.json() == {"products": ids}
+    assert list(Product.objects.order_by('id').values_list('favourites_count', flat=True)) == [1, 1, 0]
+
+
+@pytest.mark.django_db
+def test_deleted_user_favourites_counts(add_product_to_favourites_list, django_user_model):
+    """ Тест уменьшения счётчиков избранного при удалении пользователя """
+    add_product_to_favourites_list()
+    other = django_user_model.objects.create_user(username="other")
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    other.products.add(product_ids[0])
+    Product.objects.filter(id=product_ids[0]).update(favourites_count=2)
+    User.objects.get(username="foo").delete()
+    assert list(Product.objects.order_by('id').values_list('favourites_count', flat=True)) == [1, 0, 0]
+    django_user_model.objects.filter(username="other").delete()
+    assert list(Product.objects.order_by('id').values_list('favourites_count', flat=True)) == [0, 0, 0]
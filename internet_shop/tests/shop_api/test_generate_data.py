@@ -0,0 +1,54 @@
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum
+
+from shop_api.models import Product, Review, Order, Position, ProductCollections, SalesDaily
+from shop_api.ratings import rebuild_ratings
+from shop_api.search import search_products
+
+OPTIONS = dict(users=20, products=50, reviews=200, orders=100, collections=2, seed=7, end_date=date(2021, 6, 1))
+
+
+def _snapshot():
+    return (list(Product.objects.order_by('id').values_list('name', 'price', 'rating_count', 'created_at')),
+            list(Order.objects.order_by('id').values_list('user__username', 'status', 'total', 'created_at')))
+
+
+@pytest.mark.django_db
+def test_generate_data():
+    """ Тест объёмов и согласованности сгенерированных данных """
+    out = StringIO()
+    call_command('generate_data', chunk_size=30, stdout=out, **OPTIONS)
+    assert "orders: 100/100" in out.getvalue()
+    assert (User.objects.count(), Product.objects.count(), Review.objects.count(), Order.objects.count()) == \
+           (20, 50, 200, 100)
+    assert ProductCollections.objects.get(title__endswith='1').products.count() == 50
+    assert Review.objects.values('creator', 'product').distinct().count() == 200
+
+    # итоги заказов и агрегаты оценок совпадают с позициями и отзывами
+    order = Order.objects.order_by('id').last()
+    assert order.count == order.position.aggregate(total=Sum('quantity'))['total']
+    assert Position.objects.aggregate(total=Sum('quantity'))['total'] == Order.objects.aggregate(
+        total=Sum('count'))['total']
+    before = list(Product.objects.order_by('id').values_list('rating_avg', 'rating_count', 'rating_5_count'))
+    rebuild_ratings()
+    assert list(Product.objects.order_by('id').values_list('rating_avg', 'rating_count', 'rating_5_count')) == before
+    assert SalesDaily.objects.aggregate(total=Sum('orders'))['total'] == \
+           Order.objects.exclude(status='CANCELLED').count()
+    assert search_products(Product.objects.all(), Product.objects.first().name.split()[1]).exists()
+
+
+@pytest.mark.django_db
+def test_generate_data_is_deterministic():
+    """ Тест одинаковых данных при одинаковом seed и добавления к существующим данным """
+    call_command('generate_data', stdout=StringIO(), **OPTIONS)
+    first = _snapshot()
+    call_command('flush', interactive=False, verbosity=0)
+    call_command('generate_data', stdout=StringIO(), **OPTIONS)
+    assert _snapshot() == first
+    call_command('generate_data', stdout=StringIO(), **OPTIONS)
+    assert Product.objects.count() == 100
@@ -2,10 +2,12 @@ import pytest
 from django.contrib.auth.models import User
 
 from django.urls import reverse
-from rest_framework.status import HTTP_200_OK
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN
 
-from shop_api.models import Order, Product, Position
+from shop_api.models import Order, Product, Position, SalesDaily
+import csv
 import datetime as dt
+import json
 
 
 @pytest.mark.django_db
@@ -45,7 +47,7 @@ def test_order_filter_by_total_price(create_order_by_authenticated_user,
     resp = admin_client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         assert item['total'] == order_info.total
 
 
@@ -63,7 +65,7 @@ def test_order_filter_by_create_date(create_order_by_authenticated_user,
     resp = admin_client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         data_from_response = item['created_at'].replace('T', ' ').split('.')[0]
         data_from_db = str(order_info.created_at).split('.')[0]
         assert data_from_response == data_from_db
@@ -85,7 +87,7 @@ def test_order_filter_by_update_date(create_order_by_authenticated_user,
     resp = admin_client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         data_from_response = item['updated_at'].replace('T', ' ').split('.')[0]
         data_from_db = str(order_info.updated_at).split('.')[0]
         assert data_from_response == data_from_db
@@ -103,6 +105,143 @@ def test_order_filter_by_product_in_positions(create_order_by_authenticated_user
     url = reverse('orders-list') + '?' + params
     resp = admin_client.get(url)
     resp_json = resp.json()
-    for item in resp_json:
+    for item in resp_json['results']:
         order_id_from_request = item['id']
         assert order_id_from_request == order_id_from_db
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("lines", [1, 50])
+def test_create_order_query_count(authenticated_client, product_factory, django_assert_num_queries, lines):
+    """ Тест постоянного числа запросов при создании заказа и подсчёта итогов """
+    products = product_factory(_quantity=lines, price=10)
+    order = {"products": [{"product": product.id, "quantity": 2} for product in products]}
+    # токен, товары, заказ, позиции, сообщение outbox, позиции для ответа + SAVEPOINT/RELEASE
+    with django_assert_num_queries(8):
+        resp = authenticated_client.post(reverse("orders-list"), order, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    order_info = Order.objects.get()
+    assert (order_info.count, order_info.total) == (2 * lines, 20 * lines)
+    assert order_info.position.count() == lines
+
+
+@pytest.mark.django_db
+def test_create_order_with_unknown_product(authenticated_client, product_factory):
+    """ Тест отказа в создании заказа с несуществующим товаром """
+    product = product_factory()
+    order = {"products": [{"product": product.id, "quantity": 1}, {"product": product.id + 100, "quantity": 1}]}
+    resp = authenticated_client.post(reverse("orders-list"), order, format='json')
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+    assert not Order.objects.exists()
+
+
+@pytest.mark.django_db
+def test_export_orders_ndjson(admin_client, authenticated_client, create_order_by_authenticated_user, settings):
+    """ Тест потоковой выгрузки заказов в NDJSON с учётом фильтров """
+    settings.ORDER_EXPORT_CHUNK_SIZE = 2
+    create_order_by_authenticated_user()
+    Order.objects.create(user=User.objects.get(username='foo'), status='DONE', total=1, count=0)
+    url = reverse("orders-export")
+    assert authenticated_client.get(url).status_code == HTTP_403_FORBIDDEN
+
+    resp = admin_client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert resp.streaming
+    orders = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+    assert [len(order['positions']) for order in orders] == [3, 0]
+    assert orders[0]['user'] == 'foo'
+    assert sum(position['quantity'] for position in orders[0]['positions']) == orders[0]['count']
+
+    resp = admin_client.get(url + '?status=DONE')
+    assert [json.loads(line)['status'] for line in b''.join(resp.streaming_content).decode().splitlines()] == ['DONE']
+
+
+@pytest.mark.django_db
+def test_export_orders_csv(admin_client, create_order_by_authenticated_user):
+    """ Тест выгрузки в CSV: строка на позицию, фильтр по позиции не сокращает состав заказа """
+    create_order_by_authenticated_user()
+    position = Position.objects.first()
+    resp = admin_client.get(reverse("orders-export") + f'?export_format=csv&position={position.id}')
+    assert resp['Content-Type'].startswith('text/csv')
+    rows = list(csv.reader(b''.join(resp.streaming_content).decode().splitlines()))
+    assert rows[0] == ['id', 'user', 'status', 'total', 'count', 'created_at', 'updated_at', 'product', 'quantity']
+    assert len(rows) == 4
+    assert admin_client.get(reverse("orders-export") + '?export_format=xml').status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_bulk_status_by_ids(admin_client, authenticated_client, create_order_by_authenticated_user,
+                            django_assert_max_num_queries, process_outbox):
+    """ Тест массовой смены статуса по списку id: допустимые переходы и исходы по каждому id """
+    create_order_by_authenticated_user()
+    process_outbox()
+    user = User.objects.get(username='foo')
+    new, done, in_progress = (Order.objects.create(user=user, status=status, total=1, count=0)
+                              for status in ('NEW', 'DONE', 'IN_PROGRESS'))
+    first = Order.objects.order_by('id').first()
+    url = reverse("orders-bulk-status")
+    payload = {"status": "CANCELLED", "ids": [first.id, new.id, done.id, in_progress.id, 999]}
+    assert authenticated_client.post(url, payload, format='json').status_code == HTTP_403_FORBIDDEN
+
+    with django_assert_max_num_queries(7):
+        resp = admin_client.post(url, payload, format='json')
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json() == {"status": "CANCELLED", "updated": [first.id, new.id, in_progress.id], "unchanged": [],
+                           "not_allowed": [{"id": done.id, "status": "DONE"}], "not_found": [999]}
+    assert list(Order.objects.order_by('id').values_list('status', flat=True)) == \
+           ['CANCELLED', 'CANCELLED', 'DONE', 'CANCELLED']
+    # отменённый заказ с позициями вычтен из сводных таблиц продаж
+    assert SalesDaily.objects.get().orders == 0
+
+    resp = admin_client.post(url, {"status": "DONE", "ids": [first.id]}, format='json')
+    assert resp.json()['not_allowed'] == [{"id": first.id, "status": "CANCELLED"}]
+    assert admin_client.post(url, {"status": "LOST", "ids": [first.id]}, format='json').status_code == \
+           HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_bulk_status_by_filter(admin_client, product_factory, django_user_model):
+    """ Тест массовой смены статуса по фильтрам OrderFilter """
+    user = django_user_model.objects.create_user(username='bulk')
+    for total in range(1, 31):
+        Order.objects.create(user=user, status='NEW' if total % 3 else 'DONE', total=total, count=0)
+    url = reverse("orders-bulk-status")
+    assert admin_client.post(url, {"status": "IN_PROGRESS"}, format='json').status_code == HTTP_400_BAD_REQUEST
+    # опечатка в имени фильтра или посторонний параметр не превращают запрос в смену статуса всех заказов
+    for query in ('?stauts=NEW', '?format=json', '?status=&created_at_after='):
+        resp = admin_client.post(url + query, {"status": "CANCELLED"}, format='json')
+        assert resp.status_code == HTTP_400_BAD_REQUEST
+    assert not Order.objects.filter(status='CANCELLED').exists()
+
+    resp = admin_client.post(url + '?total_price__gt=15', {"status": "IN_PROGRESS"}, format='json')
+    assert len(resp.json()['updated']) == 10
+    assert len(resp.json()['not_allowed']) == 5
+    assert Order.objects.filter(status='IN_PROGRESS', total__lte=15).count() == 0
+    resp = admin_client.post(url + '?status=IN_PROGRESS', {"status": "DONE"}, format='json')
+    assert len(resp.json()['updated']) == 10
+    assert Order.objects.filter(status='DONE').count() == 20
+
+
+@pytest.mark.django_db
+def test_bulk_status_ignores_orders_committed_after_lock(admin_client, create_order_by_authenticated_user,
+                                                         process_outbox, monkeypatch, settings):
+    """ Тест: заказ, подходящий под фильтры и появившийся после блокировки строк, не меняется мимо отчёта """
+    from shop_api import order_status
+    # INSERT выполняет "другая транзакция", в бюджет запроса он не входит
+    settings.QUERY_BUDGETS_STRICT = False
+    create_order_by_authenticated_user()
+    process_outbox()
+    locked = Order.objects.get()
+    apply_orders = order_status.apply_orders
+
+    def insert_then_apply(*args, **kwargs):
+        # параллельная транзакция зафиксировала новый заказ после SELECT ... FOR UPDATE
+        Order.objects.create(user=locked.user, status='NEW', total=1, count=0)
+        return apply_orders(*args, **kwargs)
+
+    monkeypatch.setattr(order_status, 'apply_orders', insert_then_apply)
+    resp = admin_client.post(reverse("orders-bulk-status") + '?status=NEW', {"status": "CANCELLED"}, format='json')
+    assert resp.json()['updated'] == [locked.id]
+    assert dict(Order.objects.values_list('id', 'status')) == {locked.id: 'CANCELLED', locked.id + 1: 'NEW'}
+    assert SalesDaily.objects.get().orders == 0
+
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
+
+from shop_api.models import OutboxMessage, ProductCooccurrence, SalesDaily
+from shop_api.outbox import HANDLERS, ORDER_CREATED, enqueue, process_batch, retry_failed
+
+
+def _order(client, *products):
+    resp = client.post(reverse("orders-list"),
+                       {"products": [{"product": product.id, "quantity": 1} for product in products]}, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    return resp.json()['id']
+
+
+@pytest.mark.django_db
+def test_order_processed_by_worker(authenticated_client, product_factory, process_outbox):
+    """ Тест: заказ только добавляет сообщение в outbox, сводные таблицы обновляет воркер """
+    first, second = product_factory(_quantity=2, price=10)
+    order_id = _order(authenticated_client, first, second)
+    assert list(OutboxMessage.objects.values_list('topic', 'object_id')) == [(ORDER_CREATED, order_id)]
+    assert not SalesDaily.objects.exists()
+
+    assert "Обработано сообщений: 1, с ошибкой: 0" in process_outbox()
+    assert not OutboxMessage.objects.exists()
+    assert SalesDaily.objects.get().orders == 1
+    assert ProductCooccurrence.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_order_changed_before_processing(authenticated_client, admin_client, product_factory, process_outbox):
+    """ Тест: отмена до обработки сообщения учитывается верно, удаление - отбрасывает сообщение """
+    first, second = product_factory(_quantity=2, price=10)
+    cancelled = _order(authenticated_client, first)
+    deleted = _order(authenticated_client, first, second)
+    resp = authenticated_client.put(reverse("orders-detail", args=[cancelled]), {"status": "CANCELLED"})
+    assert resp.status_code == HTTP_200_OK
+    admin_client.delete(reverse("orders-detail", args=[deleted]))
+    assert list(OutboxMessage.objects.values_list('object_id', flat=True)) == [cancelled]
+
+    process_outbox()
+    day = SalesDaily.objects.get()
+    assert (day.revenue, day.units, day.orders) == (0, 0, 0)
+    assert not ProductCooccurrence.objects.filter(orders__gt=0).exists()
+
+
+@pytest.mark.django_db
+def test_failed_messages_retried_with_backoff(monkeypatch, settings):
+    """ Тест: сбойное сообщение отделяется от пачки, откладывается и после OUTBOX_MAX_ATTEMPTS помечается """
+    settings.OUTBOX_MAX_ATTEMPTS = 2
+    handled = []
+
+    def handler(messages, using):
+        if any(message.payload.get('fail') for message in messages):
+            raise ValueError("сбой")
+        handled.extend(message.object_id for message in messages)
+
+    monkeypatch.setitem(HANDLERS, 'test', handler)
+    for object_id in range(1, 4):
+        enqueue('test', object_id, {'fail': object_id == 2})
+
+    assert process_batch() == (2, 1)
+    assert handled == [1, 3]
+    message = OutboxMessage.objects.get()
+    assert (message.object_id, message.attempts, message.failed_at) == (2, 1, None)
+    assert "сбой" in message.last_error
+    assert message.available_at > timezone.now()
+    assert process_batch() == (0, 0)
+
+    OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+    assert process_batch() == (0, 1)
+    message.refresh_from_db()
+    assert message.attempts == 2 and message.failed_at is not None
+    OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+    assert process_batch() == (0, 0)
+
+    assert retry_failed() == 1
+    OutboxMessage.objects.update(payload={})
+    assert process_batch() == (1, 0)
+    assert handled == [1, 3, 2]
@@ -0,0 +1,89 @@
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND
+
+from shop_api.models import Product
+from shop_api.pagination import KeysetPagination
+
+
+@pytest.mark.django_db
+def test_products_pages_cover_catalog_without_duplicates(client, product_factory):
+    """ Тест обхода всех страниц каталога по курсору, в том числе при одинаковом created_at """
+    products = product_factory(_quantity=7)
+    Product.objects.filter(id__in=[p.id for p in products[:4]]).update(created_at=timezone.now())
+    url = reverse("products-list") + '?page_size=3'
+    ids = []
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == HTTP_200_OK
+        resp_json = resp.json()
+        assert len(resp_json['results']) <= 3
+        ids += [item['id'] for item in resp_json['results']]
+        url = resp_json['next']
+    expected = list(Product.objects.order_by('created_at', 'id').values_list('id', flat=True))
+    assert ids == expected
+
+
+@pytest.mark.django_db
+def test_products_previous_page(client, product_factory):
+    """ Тест возврата на предыдущую страницу """
+    product_factory(_quantity=5)
+    first_page = client.get(reverse("products-list") + '?page_size=2').json()
+    assert first_page['previous'] is None
+    second_page = client.get(first_page['next']).json()
+    resp = client.get(second_page['previous'])
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json()['results'] == first_page['results']
+
+
+@pytest.mark.django_db
+def test_page_size_is_capped(client, product_factory):
+    """ Тест ограничения размера страницы, запрошенного клиентом """
+    product_factory(_quantity=KeysetPagination.max_page_size + 5)
+    url = reverse("products-list") + f'?page_size={KeysetPagination.max_page_size * 10}'
+    resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert len(resp.json()['results']) == KeysetPagination.max_page_size
+
+
+@pytest.mark.django_db
+def test_pagination_keeps_filter_params(client, product_factory):
+    """ Тест сохранения параметров фильтра в ссылках пагинации """
+    product_factory(_quantity=3, price=10)
+    product_factory(_quantity=3, price=500)
+    url = reverse("products-list") + '?price__lt=100&page_size=2'
+    resp_json = client.get(url).json()
+    assert 'price__lt=100' in resp_json['next']
+    prices = [item['price'] for item in resp_json['results']]
+    prices += [item['price'] for item in client.get(resp_json['next']).json()['results']]
+    assert prices == [10, 10, 10]
+
+
+@pytest.mark.django_db
+def test_invalid_cursor(client):
+    """ Тест некорректного курсора """
+    url = reverse("products-list") + '?cursor=cD1hYmM='
+    resp = client.get(url)
+    assert resp.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_count_is_opt_in_and_estimated_on_large_lists(admin_client, create_order_by_authenticated_user, settings):
+    """ Тест общего числа записей по ?with_count=true: точное ниже порога, выше - из кэша с признаком оценки """
+    for _ in range(3):
+        create_order_by_authenticated_user()
+    url = reverse("orders-list")
+    assert 'count' not in admin_client.get(url).json()
+    resp = admin_client.get(url + '?with_count=true&page_size=1').json()
+    assert (resp['count'], resp['count_exact']) == (3, True)
+
+    settings.ESTIMATED_COUNT_THRESHOLD = 3
+    create_order_by_authenticated_user()
+    resp = admin_client.get(url + '?with_count=true&page_size=1').json()
+    assert (resp['count'], resp['count_exact']) == (3, False)
+    # следующие страницы и другие фильтры
+    resp = admin_client.get(resp['next']).json()
+    assert (resp['count'], resp['count_exact']) == (3, False)
+    resp = admin_client.get(url + '?with_count=true&status=NEW').json()
+    assert (resp['count'], resp['count_exact']) == (4, True)
@@ -1,3 +1,5 @@
+from urllib.parse import urlencode
+
 import pytest
 from django.urls import reverse
 from rest_framework.status import HTTP_201_CREATED, HTTP_403_FORBIDDEN, HTTP_200_OK, HTTP_204_NO_CONTENT
@@ -78,7 +80,7 @@ def test_price_filter(client, product_factory):
     resp = client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         assert price_gt < float(item['price'])
         assert price_lt > float(item['price'])
 
@@ -93,7 +95,7 @@ def test_for_insistence_in_product_name(client, product_factory):
     resp = client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         assert name_part in item['name']
 
 
@@ -107,5 +109,58 @@ def test_for_insistence_in_description(product_factory, client):
     resp = client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         assert description_part in item['description']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("reviews_count", [1, 1000])
+def test_products_retrieve_query_count(client, product_factory, review_factory,
+                                       django_assert_num_queries, reviews_count):
+    """ Тест постоянного числа запросов при получении товара с отзывами """
+    product = product_factory()
+    review_factory(product, reviews_count)
+    url = reverse("products-detail", args=(product.id,))
+    # проверка актуальности (ETag), товар, отзывы с авторами
+    with django_assert_num_queries(3):
+        resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert len(resp.json()['review']) == reviews_count
+
+
+@pytest.mark.django_db
+def test_search_ranks_name_matches_first(client, product_factory):
+    """ Тест полнотекстового поиска: совпадение в названии релевантнее, чем в описании """
+    in_description = product_factory(name="Молоток", description="забивает гвозди любого размера")
+    in_name = product_factory(name="Гвозди строительные", description="оцинкованные")
+    product_factory(name="Отвёртка", description="крестовая")
+    url = reverse("products-list") + '?search=гвозди'
+    resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert [item['id'] for item in resp.json()['results']] == [in_name.id, in_description.id]
+
+
+@pytest.mark.django_db
+def test_search_index_follows_product_changes(admin_client, product_factory):
+    """ Тест обновления поискового индекса при изменении и удалении товара """
+    product = product_factory(name="Дрель", description="ударная")
+    url = reverse("products-detail", args=(product.id,))
+    admin_client.put(url, data={"name": "Перфоратор", "price": 10, "description": "ударный"}, format='json')
+    search_url = reverse("products-list") + '?search='
+    assert admin_client.get(search_url + 'дрель').json()['results'] == []
+    assert len(admin_client.get(search_url + 'перфоратор').json()['results']) == 1
+    admin_client.delete(url)
+    assert admin_client.get(search_url + 'перфоратор').json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_search_pagination(client, product_factory):
+    """ Тест постраничного вывода результатов поиска """
+    product_factory(_quantity=5, name="Гвоздь", description="обычный")
+    url = reverse("products-list") + '?' + urlencode({'search': 'гвоздь', 'page_size': 2})
+    ids = []
+    while url:
+        resp_json = client.get(url).json()
+        ids += [item['id'] for item in resp_json['results']]
+        url = resp_json['next']
+    assert sorted(ids) == sorted(Product.objects.values_list('id', flat=True))
@@ -22,3 +22,38 @@ def test_add_products_to_product_collections_by_admin(admin_client, client,
     url = reverse("product-collections-list")
     resp = client.get(url)
     assert resp.status_code == HTTP_200_OK
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("products_count", [1, 20])
+def test_collection_retrieve_query_count(client, product_factory, review_factory,
+                                         django_assert_num_queries, products_count):
+    """ Тест постоянного числа запросов при получении подборки с товарами и отзывами """
+    collection = ProductCollections.objects.create(title="подборка", text="текст")
+    products = product_factory(_quantity=products_count)
+    collection.products.add(*products)
+    for product in products:
+        review_factory(product, 3)
+    url = reverse("product-collections-detail", args=(collection.id,))
+    # проверка актуальности (ETag), подборка, товары, отзывы с авторами
+    with django_assert_num_queries(4):
+        resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert len(resp.json()['products']) == products_count
+    assert all(len(item['review']) == 3 for item in resp.json()['products'])
+
+
+@pytest.mark.django_db
+def test_collection_retrieve_without_reviews(client, product_factory, review_factory, django_assert_num_queries):
+    """ Тест облегчённого режима подборки: товары без отзывов """
+    collection = ProductCollections.objects.create(title="подборка", text="текст")
+    product = product_factory()
+    collection.products.add(product)
+    review_factory(product, 3)
+    url = reverse("product-collections-detail", args=(collection.id,)) + '?reviews=false'
+    with django_assert_num_queries(3):
+        resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    item = resp.json()['products'][0]
+    assert 'review' not in item
+    assert 'rating_avg' in item
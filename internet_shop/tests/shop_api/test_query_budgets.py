@@ -0,0 +1,113 @@
+import logging
+
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from shop_api.budgets import QueryBudgetExceeded, get_query_budget_report, reset_query_budget_report
+from shop_api.models import Product, Review, Order, ProductCollections
+from shop_api.views import ProductViewSet
+
+
+@pytest.fixture
+def shop_data(authenticated_client, product_factory, review_factory, create_order_by_authenticated_user,
+              create_product_collections_by_admin, add_product_to_favourites_list):
+    """ Несколько записей каждого вида, чтобы N+1 выходили за бюджет """
+    for _ in range(3):
+        create_order_by_authenticated_user()
+    create_product_collections_by_admin()
+    add_product_to_favourites_list()
+    for product in Product.objects.all()[:5]:
+        review_factory(product, 3)
+    authenticated_client.post(reverse("product-reviews-list"),
+                              {'review_text': 'отзыв', 'rating': 5, 'product': Product.objects.last().id})
+    reset_query_budget_report()
+
+
+def _ids():
+    user = User.objects.get(username="foo")
+    return {
+        'product': Product.objects.filter(review__isnull=False).first().id,
+        'free_product': Product.objects.filter(review__isnull=True, position__isnull=True).first().id,
+        'review': Review.objects.get(creator=user).id,
+        'order': Order.objects.filter(user=user).first().id,
+        'collection': ProductCollections.objects.first().id,
+        'user': user.id,
+        'products': list(Product.objects.values_list('id', flat=True)[:5]),
+    }
+
+
+ENDPOINTS = [
+    ("client", "get", "products-list", None, None),
+    ("client", "get", "products-detail", "product", None),
+    ("client", "get", "products-recommendations", "product", None),
+    ("admin_client", "post", "products-list", None, lambda ids: {"name": "Test", "price": 1, "description": "тест"}),
+    ("admin_client", "put", "products-detail", "product",
+     lambda ids: {"name": "Test", "price": 2, "description": "тест"}),
+    ("admin_client", "delete", "products-detail", "free_product", None),
+    ("client", "get", "product-reviews-list", None, None),
+    ("authenticated_client", "get", "product-reviews-detail", "review", None),
+    ("authenticated_client", "post", "product-reviews-list", None,
+     lambda ids: {"review_text": "ок", "rating": 3, "product": ids["free_product"]}),
+    ("authenticated_client", "put", "product-reviews-detail", "review",
+     lambda ids: {"review_text": "ок", "rating": 3, "product": ids["product"]}),
+    ("authenticated_client", "delete", "product-reviews-detail", "review", None),
+    ("authenticated_client", "get", "orders-list", None, None),
+    ("admin_client", "get", "orders-list", None, None),
+    ("authenticated_client", "get", "orders-detail", "order", None),
+    ("authenticated_client", "post", "orders-list", None,
+     lambda ids: {"products": [{"product": pk, "quantity": 1} for pk in ids["products"]]}),
+    ("authenticated_client", "put", "orders-detail", "order", lambda ids: {"status": "CANCELLED"}),
+    ("client", "get", "product-collections-list", None, None),
+    ("client", "get", "product-collections-detail", "collection", None),
+    ("admin_client", "post", "product-collections-list", None,
+     lambda ids: {"title": "новая", "text": "текст", "products": ids["products"][:2]}),
+    ("admin_client", "put", "product-collections-detail", "collection",
+     lambda ids: {"title": "новая", "text": "текст"}),
+    ("authenticated_client", "get", "user-info-list", None, None),
+    ("authenticated_client", "get", "user-info-detail", "user", None),
+    ("authenticated_client", "post", "user-info-detail", "user", lambda ids: {"products": ids["products"]}),
+    ("authenticated_client", "post", "user-info-favourites", "user", lambda ids: {"products": ids["products"]}),
+    ("authenticated_client", "delete", "user-info-favourites", "user", lambda ids: {"products": ids["products"]}),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("client_name,method,url_name,pk,data", ENDPOINTS)
+def test_action_within_query_budget(request, settings, shop_data, client_name, method, url_name, pk, data):
+    """ Тест соблюдения бюджета SQL-запросов действиями ViewSet """
+    settings.QUERY_BUDGETS_STRICT = True
+    client = request.getfixturevalue(client_name)
+    ids = _ids()
+    url = reverse(url_name, args=(ids[pk],)) if pk else reverse(url_name)
+    resp = getattr(client, method)(url, data=data(ids) if data else None, format='json')
+    assert resp.status_code < 500
+    report = get_query_budget_report()
+    assert len(report) == 1
+    stats = list(report.values())[0]
+    assert stats['budget'] is not None
+    assert stats['max_queries'] <= stats['budget']
+
+
+@pytest.mark.django_db
+def test_query_budget_exceeded_in_strict_mode(client, settings, monkeypatch, product_factory):
+    """ Тест исключения при превышении бюджета в режиме отладки """
+    settings.QUERY_BUDGETS_STRICT = True
+    monkeypatch.setattr(ProductViewSet, "query_budgets", {"list": 0})
+    product_factory(_quantity=3)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get(reverse("products-list"))
+
+
+@pytest.mark.django_db
+def test_query_budget_exceeded_is_logged(client, settings, monkeypatch, caplog, product_factory):
+    """ Тест записи в лог при превышении бюджета в production """
+    settings.QUERY_BUDGETS_STRICT = False
+    monkeypatch.setattr(ProductViewSet, "query_budgets", {"list": 0})
+    product_factory(_quantity=3)
+    reset_query_budget_report()
+    with caplog.at_level(logging.WARNING, logger="shop_api.budgets"):
+        resp = client.get(reverse("products-list"))
+    assert resp.status_code == 200
+    assert "ProductViewSet.list" in caplog.text
+    assert get_query_budget_report()["ProductViewSet.list"]["over_budget"] == 1
@@ -0,0 +1,82 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND
+
+from shop_api.models import Order, Product, ProductCooccurrence, ProductRecommendation
+from shop_api.recommendations import refresh_top
+
+
+def _order(client, *products):
+    resp = client.post(reverse("orders-list"),
+                       {"products": [{"product": product.id, "quantity": 1} for product in products]}, format='json')
+    return resp.json()['id']
+
+
+def _recommended(client, product):
+    resp = client.get(reverse("products-recommendations", args=[product.id]))
+    assert resp.status_code == HTTP_200_OK
+    return [(item['product']['id'], item['orders']) for item in resp.json()]
+
+
+def _matrix():
+    return (sorted(ProductCooccurrence.objects.filter(orders__gt=0).values_list('product', 'other', 'orders')),
+            sorted(ProductRecommendation.objects.values_list('product', 'recommended', 'orders', 'rank')))
+
+
+@pytest.mark.django_db
+def test_recommendations_follow_orders(client, authenticated_client, admin_client, product_factory, process_outbox):
+    """ Тест инкрементального обновления матрицы и топа при создании и удалении заказов """
+    phone, case, charger, cable = product_factory(_quantity=4)
+    _order(authenticated_client, phone, case, charger)
+    _order(authenticated_client, phone, case)
+    order_id = _order(authenticated_client, phone, cable, cable)
+    assert _recommended(client, phone) == []
+    process_outbox()
+    assert _recommended(client, phone) == [(case.id, 2), (charger.id, 1), (cable.id, 1)]
+    assert _recommended(client, cable) == [(phone.id, 1)]
+    assert _recommended(client, charger) == [(phone.id, 1), (case.id, 1)]
+
+    admin_client.delete(reverse("orders-detail", args=[order_id]))
+    assert _recommended(client, phone) == [(case.id, 2), (charger.id, 1)]
+    assert _recommended(client, cable) == []
+    assert client.get(reverse("products-recommendations", args=[cable.id + 100])).status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_rebuild_recommendations(authenticated_client, product_factory, settings, process_outbox):
+    """ Тест полного пересчёта пакетами: совпадает с инкрементальным, топ ограничен RECOMMENDATIONS_TOP_K """
+    settings.RECOMMENDATIONS_TOP_K = 2
+    products = product_factory(_quantity=5)
+    for first in range(4):
+        _order(authenticated_client, *products[first:])
+    process_outbox()
+    Order.objects.create(user=Order.objects.first().user, total=0, count=0)
+    incremental = _matrix()
+    assert ProductRecommendation.objects.filter(product=products[2]).count() == 2
+
+    ProductCooccurrence.objects.update(orders=0)
+    out = StringIO()
+    call_command('rebuild_recommendations', batch_size=2, stdout=out)
+    assert "Пар товаров: 20" in out.getvalue()
+    assert _matrix() == incremental
+
+
+@pytest.mark.django_db
+def test_refresh_top_locks_products_first(authenticated_client, product_factory, process_outbox):
+    """ Тест: пересчёт топа блокирует строки своих товаров до удаления старого топа и повторяется без изменений """
+    products = product_factory(_quantity=3)
+    _order(authenticated_client, *products)
+    process_outbox()
+    before = _matrix()
+
+    with CaptureQueriesContext(connection) as queries:
+        refresh_top([products[0].id, products[1].id])
+    statements = [query['sql'] for query in queries]
+    assert statements[0].startswith('SELECT') and Product._meta.db_table in statements[0]
+    assert statements[1].startswith('DELETE')
+    assert _matrix() == before
@@ -0,0 +1,107 @@
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_404_NOT_FOUND
+from rest_framework.test import APIClient
+
+from shop_api.models import Product, Review
+from shop_api.replicas import check_shared_cache, pin_to_primary
+
+# реплика - отдельный файл SQLite со схемой, но без репликации: данные в неё пишутся тестом явно
+replica_db = pytest.mark.django_db(databases=['default', 'replica'])
+
+
+@pytest.fixture(scope='module')
+def replica_database(django_db_setup, django_db_blocker, tmp_path_factory):
+    path = tmp_path_factory.mktemp('replica') / 'replica.sqlite3'
+    connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)}
+    with django_db_blocker.unblock(), override_settings(DATABASE_REPLICAS=['replica']):
+        call_command('migrate', database='replica', verbosity=0)
+    yield 'replica'
+    connections['replica'].close()
+    del connections.databases['replica']
+
+
+@pytest.fixture
+def replica(replica_database, settings, shared_cache):
+    settings.DATABASE_REPLICAS = [replica_database]
+    return replica_database
+
+
+def product_names(client):
+    resp = client.get(reverse("products-list"))
+    assert resp.status_code == HTTP_200_OK
+    return [item['name'] for item in resp.json()['results']]
+
+
+@replica_db
+def test_catalog_read_from_replica(replica, product_factory, client):
+    """ Чтение каталога идёт с реплики: товара, записанного только в default, в ответе нет """
+    primary_only = product_factory(name="только в default")
+    Product.objects.using(replica).create(id=primary_only.id + 1, name="на реплике", price=10)
+
+    assert product_names(client) == ["на реплике"]
+    resp = client.get(reverse("products-detail", args=(primary_only.id,)))
+    assert resp.status_code == HTTP_404_NOT_FOUND
+
+
+@replica_db
+def test_writer_reads_own_writes(replica, product_factory, authenticated_client):
+    """ После записи пользователь читает из default, остальные - с реплики, пока не истечёт закрепление """
+    product = product_factory()
+    Product.objects.using(replica).create(id=product.id, name=product.name, price=product.price)
+    url = reverse("product-reviews-list")
+
+    resp = authenticated_client.post(url, {'review_text': 'хорошая вещь', 'rating': 4, 'product': product.id})
+    assert resp.status_code == HTTP_201_CREATED
+    assert not Review.objects.using(replica).exists()
+
+    assert len(authenticated_client.get(url).json()['results']) == 1
+    assert APIClient().get(url).json()['results'] == []
+
+    # закрепление хранится в кэше: после его истечения чтение снова идёт с реплики
+    cache.clear()
+    assert authenticated_client.get(url).json()['results'] == []
+
+
+@replica_db
+def test_replica_response_not_cached_after_write(replica, client):
+    """ Ответ, прочитанный с реплики вскоре после записи, не сохраняется в кэш ответов """
+    Product.objects.using(replica).create(name="первый", price=10)
+    pin_to_primary()
+    assert product_names(client) == ["первый"]
+
+    Product.objects.using(replica).create(name="второй", price=20)
+    assert sorted(product_names(client)) == ["второй", "первый"]
+
+
+@replica_db
+def test_object_read_from_replica_saved_to_primary(replica):
+    """ Объект, прочитанный с реплики, сохраняется в default """
+    Product.objects.using(replica).create(name="на реплике", price=10)
+    product = Product.objects.using(replica).get()
+    product.price = 15
+    product.save()
+
+    assert Product.objects.get(pk=product.pk).price == 15
+    assert Product.objects.using(replica).get().price == 10
+
+
+@replica_db
+def test_process_local_cache_reads_primary(replica_database, settings, product_factory, client):
+    """ С кэшем в памяти процесса закрепление не видно другим воркерам: ошибка проверки, чтение из default """
+    settings.DATABASE_REPLICAS = [replica_database]
+    assert [error.id for error in check_shared_cache(None)] == ['shop_api.E001']
+    product_factory(name="только в default")
+    assert product_names(client) == ["только в default"]
+
+
+def test_shared_cache_passes_check(settings, shared_cache):
+    settings.DATABASE_REPLICAS = ['replica']
+    assert check_shared_cache(None) == []
+    settings.DATABASE_REPLICAS = []
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert check_shared_cache(None) == []
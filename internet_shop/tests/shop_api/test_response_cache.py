@@ -0,0 +1,93 @@
+import pytest
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK
+
+from shop_api.models import Product, ProductCollections
+
+
+@pytest.fixture(params=["locmem", "filebased"])
+def cache_backend(request, settings, tmp_path):
+    """ Кэш ответов должен работать и с locmem, и с файловым бэкендом """
+    if request.param == "locmem":
+        backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'}
+    else:
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)}
+    settings.CACHES = {**settings.CACHES, 'responses': backend}
+    settings.RESPONSE_CACHE_ALIAS = 'responses'
+    return request.param
+
+
+@pytest.mark.django_db
+def test_cached_product_list_and_detail(client, cache_backend, product_factory, django_assert_num_queries):
+    """
+    Тест повторного ответа из кэша: с общим кэшем (файлы) - без запросов к БД,
+    с кэшем в памяти процесса остаётся проверка актуальности по БД
+    """
+    product = product_factory(_quantity=3)[0]
+    queries = 0 if cache_backend == "filebased" else 1
+    for url in (reverse("products-list") + '?page_size=2&price__lt=1000', reverse("products-detail", args=(product.id,))):
+        first = client.get(url)
+        with django_assert_num_queries(queries):
+            second = client.get(url)
+        assert second.status_code == HTTP_200_OK
+        assert second.json() == first.json()
+
+
+@pytest.mark.django_db
+def test_query_params_are_normalized(client, cache_backend, product_factory, django_assert_num_queries):
+    """ Тест одного ключа кэша для параметров в разном порядке """
+    product_factory(_quantity=3)
+    client.get(reverse("products-list") + '?price__lt=1000&page_size=2')
+    with django_assert_num_queries(0 if cache_backend == "filebased" else 1):
+        client.get(reverse("products-list") + '?page_size=2&price__lt=1000')
+
+
+@pytest.mark.django_db
+def test_product_change_invalidates_cache(admin_client, client, cache_backend, product_factory):
+    """ Тест сброса кэша списка и страницы товара после изменения товара """
+    product = product_factory(name="старое")
+    list_url = reverse("products-list")
+    detail_url = reverse("products-detail", args=(product.id,))
+    client.get(list_url)
+    client.get(detail_url)
+    admin_client.put(detail_url, data={"name": "новое", "price": 5, "description": "-"}, format='json')
+    assert client.get(list_url).json()['results'][0]['name'] == "новое"
+    assert client.get(detail_url).json()['name'] == "новое"
+
+
+@pytest.mark.django_db
+def test_review_invalidates_product_cache(authenticated_client, client, cache_backend, product_factory):
+    """ Тест сброса кэша товара после нового отзыва """
+    product = product_factory()
+    detail_url = reverse("products-detail", args=(product.id,))
+    assert client.get(detail_url).json()['review'] == []
+    authenticated_client.post(reverse("product-reviews-list"),
+                              {'review_text': 'отлично', 'rating': 5, 'product': product.id})
+    resp_json = client.get(detail_url).json()
+    assert len(resp_json['review']) == 1
+    assert resp_json['rating_avg'] == 5
+    assert client.get(reverse("products-list")).json()['results'][0]['rating_count'] == 1
+
+
+@pytest.mark.django_db
+def test_collection_cache_follows_products(admin_client, client, cache_backend, create_product_collections_by_admin):
+    """ Тест сброса кэша подборки при изменении её состава и товаров """
+    create_product_collections_by_admin()
+    collection = ProductCollections.objects.get(title="для работы")
+    url = reverse("product-collections-detail", args=(collection.id,))
+    list_url = reverse("product-collections-list")
+    assert len(client.get(url).json()['products']) == 2
+    client.get(list_url)
+
+    product = collection.products.first()
+    admin_client.put(reverse("products-detail", args=(product.id,)),
+                     data={"name": "переименован", "price": 1, "description": "-"}, format='json')
+    assert "переименован" in [item['name'] for item in client.get(url).json()['products']]
+
+    collection.products.add(Product.objects.exclude(product_collections=collection).first())
+    assert len(client.get(url).json()['products']) == 3
+
+    admin_client.delete(reverse("products-detail", args=(product.id,)))
+    assert len(client.get(url).json()['products']) == 2
+    listed = [item for item in client.get(list_url).json() if item['id'] == collection.id][0]
+    assert product.id not in listed['products']
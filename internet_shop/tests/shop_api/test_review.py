@@ -1,4 +1,8 @@
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.urls import reverse
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_200_OK, HTTP_204_NO_CONTENT, \
     HTTP_403_FORBIDDEN, HTTP_401_UNAUTHORIZED
@@ -60,5 +64,83 @@ def test_filter_review_by_product(authenticated_client, create_review_by_authent
     resp = authenticated_client.get(url)
     resp_json = resp.json()
     assert resp.status_code == HTTP_200_OK
-    for item in resp_json:
+    for item in resp_json['results']:
         assert item['product'] == product_info.id
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("reviews_count", [1, 1000])
+def test_reviews_list_query_count(client, product_factory, review_factory,
+                                  django_assert_num_queries, reviews_count):
+    """ Тест постоянного числа запросов при получении списка отзывов """
+    product = product_factory()
+    review_factory(product, reviews_count)
+    url = reverse("product-reviews-list") + '?page_size=100'
+    # ключи страницы для ETag (без агрегата по всей таблице) и страница отзывов с авторами
+    with django_assert_num_queries(2):
+        resp = client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert len(resp.json()['results']) == min(reviews_count, 100)
+    assert all(item['creator'] for item in resp.json()['results'])
+
+
+@pytest.mark.django_db
+def test_rating_aggregates_follow_reviews(authenticated_client, create_review_by_authenticated_user):
+    """ Тест обновления средней оценки и гистограммы при создании, изменении и удалении отзыва """
+    product_info, review = create_review_by_authenticated_user()
+    product_info.refresh_from_db()
+    assert (product_info.rating_count, product_info.rating_avg) == (1, 4)
+    review_info = Review.objects.get(review_text=review["review_text"])
+    url = reverse("product-reviews-detail", args=(review_info.id,))
+    authenticated_client.put(url, data={"review_text": "хуже", "rating": 2, "product": product_info.id}, format='json')
+    product_info.refresh_from_db()
+    assert (product_info.rating_count, product_info.rating_avg) == (1, 2)
+    assert product_info.get_rating_histogram() == {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}
+    authenticated_client.delete(url)
+    product_info.refresh_from_db()
+    assert (product_info.rating_count, product_info.rating_avg, product_info.rating_2_count) == (0, 0, 0)
+
+
+@pytest.mark.django_db
+def test_rebuild_ratings_command(product_factory, review_factory):
+    """ Тест пересчёта агрегатов оценок командой rebuild_ratings """
+    product = product_factory()
+    review_factory(product, 10)
+    call_command('rebuild_ratings', stdout=StringIO())
+    product.refresh_from_db()
+    assert product.rating_count == 10
+    assert product.rating_avg == 3
+    assert product.get_rating_histogram() == {1: 2, 2: 2, 3: 2, 4: 2, 5: 2}
+
+
+@pytest.mark.django_db
+def test_products_sorted_by_rating(client, product_factory, review_factory):
+    """ Тест сортировки списка товаров по средней оценке """
+    products = product_factory(_quantity=4)
+    for count, product in enumerate(products, start=1):
+        review_factory(product, count)
+    call_command('rebuild_ratings', stdout=StringIO())
+    url = reverse("products-list") + '?ordering=-rating_avg&page_size=2'
+    ratings = []
+    while url:
+        resp_json = client.get(url).json()
+        ratings += [item['rating_avg'] for item in resp_json['results']]
+        url = resp_json['next']
+    assert len(ratings) == 4
+    assert ratings == sorted(ratings, reverse=True)
+
+
+@pytest.mark.django_db
+def test_duplicate_review_rejected_by_constraint(authenticated_client, create_review_by_authenticated_user,
+                                                 django_assert_num_queries):
+    """ Тест отказа в повторном отзыве ограничением БД без изменения агрегатов товара """
+    product_info, review = create_review_by_authenticated_user()
+    # токен, товар, отклонённый INSERT + по SAVEPOINT/ROLLBACK TO/RELEASE на create() и на вставку
+    with django_assert_num_queries(9):
+        resp = authenticated_client.post(reverse("product-reviews-list"), review)
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+    product_info.refresh_from_db()
+    assert product_info.rating_count == 1
+    existing = Review.objects.get()
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Review.objects.create(creator=existing.creator, product=existing.product, rating=1, review_text='ещё')
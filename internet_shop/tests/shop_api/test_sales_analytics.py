@@ -0,0 +1,105 @@
+from datetime import date, datetime, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+
+from shop_api.models import Order, Product, ProductSalesDaily, SalesDaily
+
+
+def _rollups():
+    return (list(SalesDaily.objects.order_by('day').values_list('day', 'revenue', 'units', 'orders')),
+            list(ProductSalesDaily.objects.order_by('product', 'day')
+                 .values_list('product', 'day', 'revenue', 'units', 'orders')))
+
+
+def _order(client, *lines):
+    resp = client.post(reverse("orders-list"),
+                       {"products": [{"product": product.id, "quantity": quantity} for product, quantity in lines]},
+                       format='json')
+    return Order.objects.get(id=resp.json()['id'])
+
+
+@pytest.mark.django_db
+def test_rollups_follow_orders(authenticated_client, admin_client, product_factory, process_outbox):
+    """ Тест инкрементального обновления сводных таблиц при создании, отмене и удалении заказов """
+    first, second = product_factory(_quantity=2, price=10)
+    order = _order(authenticated_client, (first, 1), (second, 2))
+    _order(authenticated_client, (first, 3))
+    process_outbox()
+    day = SalesDaily.objects.get()
+    assert (day.revenue, day.units, day.orders) == (60, 6, 2)
+    assert ProductSalesDaily.objects.get(product=first).units == 4
+
+    # цена фиксируется в позиции: её изменение не меняет выручку
+    Product.objects.filter(id=first.id).update(price=1000)
+    resp = authenticated_client.put(reverse("orders-detail", args=[order.id]), {"status": "CANCELLED"})
+    assert resp.status_code == HTTP_200_OK
+    day.refresh_from_db()
+    assert (day.revenue, day.units, day.orders) == (30, 3, 1)
+    assert ProductSalesDaily.objects.get(product=second).orders == 0
+
+    # удаление отменённого заказа не меняет итоги, неотменённого - вычитает
+    admin_client.delete(reverse("orders-detail", args=[order.id]))
+    assert SalesDaily.objects.get().orders == 1
+    admin_client.delete(reverse("orders-detail", args=[Order.objects.get().id]))
+    assert SalesDaily.objects.get().units == 0
+
+
+@pytest.mark.django_db
+def test_backfill_sales(authenticated_client, product_factory):
+    """ Тест пересчёта сводных таблиц командой: совпадает с инкрементальным обновлением """
+    products = product_factory(_quantity=3, price=5)
+    _order(authenticated_client, (products[0], 1), (products[1], 2))
+    order = _order(authenticated_client, (products[1], 1), (products[2], 4))
+    Order.objects.filter(id=order.id).update(created_at=datetime(2021, 1, 15, 23, 30, tzinfo=timezone.utc))
+    _order(authenticated_client, (products[2], 7)).position.update(price=None)
+    Order.objects.filter(id=order.id - 1).update(status='CANCELLED')
+    ProductSalesDaily.objects.filter(day=date(2021, 1, 15)).delete()
+
+    out = StringIO()
+    call_command('backfill_sales', stdout=out)
+    assert "по дням: 2" in out.getvalue()
+    days, products_days = _rollups()
+    assert days[0] == (date(2021, 1, 15), 25, 5, 1)
+    assert days[1][1:] == (35, 7, 1)
+    assert len(products_days) == 3
+
+    SalesDaily.objects.filter(day=date(2021, 1, 15)).update(units=0)
+    call_command('backfill_sales', since=date(2021, 2, 1), stdout=StringIO())
+    assert SalesDaily.objects.get(day=date(2021, 1, 15)).units == 0
+
+
+@pytest.mark.django_db
+def test_sales_analytics_endpoint(client, authenticated_client, admin_client, product_factory):
+    """ Тест отчёта о продажах по дням, месяцам и товарам (только для персонала) """
+    first, second = product_factory(_quantity=2, price=10)
+    for created_at, lines in ((datetime(2021, 3, 1, tzinfo=timezone.utc), ((first, 1),)),
+                              (datetime(2021, 3, 20, tzinfo=timezone.utc), ((first, 2), (second, 1))),
+                              (datetime(2021, 4, 2, tzinfo=timezone.utc), ((second, 5),))):
+        order = _order(authenticated_client, *lines)
+        Order.objects.filter(id=order.id).update(created_at=created_at)
+    call_command('backfill_sales', stdout=StringIO())
+
+    url = reverse("analytics-sales")
+    assert client.get(url).status_code == HTTP_401_UNAUTHORIZED
+    assert authenticated_client.get(url).status_code == HTTP_403_FORBIDDEN
+
+    resp = admin_client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert [row['date'] for row in resp.json()['results']] == ['2021-03-01', '2021-03-20', '2021-04-02']
+
+    resp = admin_client.get(url, {'period': 'month', 'date_before': '2021-03-31'})
+    assert resp.json() == {'period': 'month', 'results': [
+        {'date': '2021-03-01', 'revenue': 40.0, 'units': 4, 'orders': 2},
+    ]}
+
+    resp = admin_client.get(url + f'?period=month&product={second.id}')
+    assert [(row['date'], row['product'], row['units']) for row in resp.json()['results']] == \
+           [('2021-03-01', second.id, 1), ('2021-04-01', second.id, 5)]
+
+    assert admin_client.get(url, {'period': 'week'}).status_code == HTTP_400_BAD_REQUEST
+    assert admin_client.get(url, {'date_after': '2021-05-01', 'date_before': '2021-04-01'}).status_code == \
+           HTTP_400_BAD_REQUEST
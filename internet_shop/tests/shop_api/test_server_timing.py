@@ -0,0 +1,60 @@
+import json
+import logging
+
+import pytest
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+
+from shop_api.timing import reset_metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    reset_metrics()
+    yield
+    reset_metrics()
+
+
+def _phases(header):
+    return {part.strip().split(';')[0]: part for part in header.split(',')}
+
+
+@pytest.mark.django_db
+def test_server_timing_header(authenticated_client, create_order_by_authenticated_user):
+    """ Тест заголовка Server-Timing с фазами запроса """
+    create_order_by_authenticated_user()
+    resp = authenticated_client.get(reverse("orders-list"))
+    phases = _phases(resp['Server-Timing'])
+    assert set(phases) == {'auth', 'db', 'serialize', 'render', 'total'}
+    assert 'queries"' in phases['db']
+
+
+@pytest.mark.django_db
+def test_structured_log(client, product_factory, caplog):
+    """ Тест строки лога в JSON с фазами и эндпоинтом """
+    product_factory()
+    with caplog.at_level(logging.INFO, logger='shop_api.timing'):
+        client.get(reverse("products-list"))
+    entry = json.loads(caplog.records[-1].getMessage())
+    assert entry['endpoint'] == 'ProductViewSet.list'
+    assert entry['status'] == HTTP_200_OK
+    assert entry['total_ms'] >= entry['db_ms']
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, authenticated_client, admin_client, product_factory):
+    """ Тест гистограмм в формате Prometheus, доступных только персоналу """
+    product_factory()
+    for _ in range(3):
+        client.get(reverse("products-list"))
+    url = reverse("metrics")
+    assert client.get(url).status_code == HTTP_401_UNAUTHORIZED
+    assert authenticated_client.get(url).status_code == HTTP_403_FORBIDDEN
+    resp = admin_client.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert resp['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = resp.content.decode()
+    assert '# TYPE shop_api_request_duration_seconds histogram' in body
+    assert 'shop_api_request_duration_seconds_count{endpoint="ProductViewSet.list",method="GET"} 3' in body
+    assert 'shop_api_request_duration_seconds_bucket{endpoint="ProductViewSet.list",method="GET",le="+Inf"} 3' in body
+    assert 'shop_api_request_phase_seconds_total{endpoint="ProductViewSet.list",method="GET",phase="db"}' in body